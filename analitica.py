@@ -0,0 +1,269 @@
+"""
+Motor analítico del dashboard con pandas.
+
+Carga UNA vez (por versión de datos) las columnas de pagos ACTIVOS y de suscripciones
+con `pd.read_sql` en DataFrames tipados (categóricos para las dimensiones) y calcula
+los agregados con group-bys vectorizados. También ofrece análisis más pesados
+(percentiles, LTV por cliente, ingresos por servidor) sobre los mismos DataFrames.
+
+No importa `app`: app.py le pasa las consultas (selectables) y la conexión,
+así se evita el import circular.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Etiquetas fijas de la gráfica "Top Paquetes" (mismo orden que el dashboard)
+PAQUETES_GRAFICA = ['Abeja', 'Clínica', 'Iguana', 'Chango', 'Elefante', 'Demo']
+
+_CATEGORICAS_PAGOS = ['moneda', 'vigencia', 'metodo_pago', 'paquete', 'pais', 'server']
+_CATEGORICAS_SUSCRIPCIONES = ['status', 'server', 'paquete', 'pais']
+
+
+class DatosAnaliticos:
+    """DataFrames de pagos y suscripciones de una versión de datos."""
+
+    def __init__(self, pagos, suscripciones):
+        self.pagos = pagos
+        self.suscripciones = suscripciones
+
+
+def _tipar(df, fechas, categoricas, numericas=(), booleanas=()):
+    for col in fechas:
+        df[col] = pd.to_datetime(df[col], errors='coerce')
+    for col in categoricas:
+        df[col] = df[col].astype('category')
+    for col in numericas:
+        df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+    for col in booleanas:
+        df[col] = df[col].fillna(False).astype(bool)
+    return df
+
+
+def cargar_datos(conexion, stmt_pagos, stmt_suscripciones):
+    """
+    Ejecuta las dos consultas y devuelve DatosAnaliticos.
+    stmt_pagos: pago_id, cliente_id, fecha_pago, monto, monto_mxn, moneda, vigencia,
+                metodo_pago, factura_pago, paquete, pais, server
+    stmt_suscripciones: suscripcion_id, cliente_id, status, server, paquete, fecha_inicio, pais
+    """
+    pagos = pd.read_sql(stmt_pagos, conexion)
+    pagos = _tipar(
+        pagos, fechas=['fecha_pago'], categoricas=_CATEGORICAS_PAGOS,
+        numericas=['monto', 'monto_mxn'], booleanas=['factura_pago']
+    )
+    pagos['monto_mxn'] = pagos['monto_mxn'].fillna(0.0)
+
+    suscripciones = pd.read_sql(stmt_suscripciones, conexion)
+    suscripciones = _tipar(suscripciones, fechas=['fecha_inicio'], categoricas=_CATEGORICAS_SUSCRIPCIONES)
+    return DatosAnaliticos(pagos, suscripciones)
+
+
+class MotorAnalitico:
+    """Cache (por proceso) de los DataFrames, invalidada cuando cambia la versión de datos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._datos = None
+
+    def datos(self, version, cargar):
+        """Devuelve los DataFrames de `version`; llama a cargar() solo si la versión cambió."""
+        datos = self._datos
+        if datos is not None and self._version == version:
+            return datos
+        with self._lock:
+            if self._datos is None or self._version != version:
+                self._datos = cargar()
+                self._version = version
+            return self._datos
+
+    def invalidar(self):
+        with self._lock:
+            self._datos = None
+            self._version = None
+
+
+# ----- Filtros (mismas reglas que el dashboard SQL) -----
+
+def _contiene(serie, texto):
+    """Equivalente a ILIKE '%texto%'."""
+    return serie.astype('string').str.contains(texto, case=False, regex=False, na=False)
+
+
+def filtrar_pagos(pagos, anio=None, mes=None, pais=None, server=None, paquete=None):
+    m = pd.Series(True, index=pagos.index)
+    if anio:
+        m &= pagos['fecha_pago'].dt.year == anio
+    if mes:
+        m &= pagos['fecha_pago'].dt.month == mes
+    if pais:
+        m &= pagos['pais'] == pais
+    if server:
+        m &= pagos['server'] == server
+    if paquete:
+        m &= _contiene(pagos['paquete'], paquete)
+    return pagos[m]
+
+
+def filtrar_suscripciones(suscripciones, pais=None, server=None, paquete=None):
+    m = pd.Series(True, index=suscripciones.index)
+    if pais:
+        m &= suscripciones['pais'] == pais
+    if server:
+        m &= suscripciones['server'] == server
+    if paquete:
+        m &= _contiene(suscripciones['paquete'], paquete)
+    return suscripciones[m]
+
+
+def _conteos(serie, vacio):
+    """{etiqueta: conteo} ordenado por conteo desc y etiqueta (como el dashboard SQL)."""
+    conteos = serie.astype('object').fillna(vacio).value_counts()
+    orden = sorted(conteos.items(), key=lambda kv: (-kv[1], kv[0]))
+    return {str(k): int(v) for k, v in orden}
+
+
+# ----- Agregados del dashboard -----
+
+def agregados_dashboard(datos, hoy, anio=None, mes=None, pais=None, server=None, paquete=None):
+    """
+    Mismo contenido que /api/dashboard_data salvo "ventas" (ver ingresos_por_periodo):
+    kpi, vigencias, paquetes, metodos, facturacion, servidores.
+    """
+    pagos = filtrar_pagos(datos.pagos, anio, mes, pais, server, paquete)
+    subs = filtrar_suscripciones(datos.suscripciones, pais, server)
+
+    # A. Ingresos (ya en MXN) y conteos de pagos
+    es_mxn = pagos['moneda'].astype('string').str.strip().str.upper().eq('MXN').fillna(False)
+    ingresos = float(pagos['monto_mxn'].sum())
+    ingresos_mx = float(pagos.loc[es_mxn, 'monto_mxn'].sum())
+    num_pagos = int(len(pagos))
+    facturados = int(pagos['factura_pago'].sum())
+
+    # B. Suscripciones activas / suspendidas / demos
+    con_paquete = subs if not paquete else subs[_contiene(subs['paquete'], paquete)]
+    activas = con_paquete[con_paquete['status'] == 'Activo']
+    suspendidos = int((con_paquete['status'] == 'Suspendido').sum())
+    if paquete and 'demo' not in paquete.lower():
+        demos = 0
+    else:
+        demos = int(((subs['status'] == 'Activo') & _contiene(subs['paquete'], 'demo')).sum())
+
+    # C. Antigüedad promedio (meses)
+    total_activos = int(len(activas))
+    antiguedad = 0
+    if total_activos:
+        dias = (pd.Timestamp(hoy) - activas['fecha_inicio']).dt.days.sum()
+        antiguedad = round((float(dias) / total_activos) / 30.44, 1)
+
+    # F. Top Paquetes: primera palabra del nombre, 'demo' -> 'Demo'
+    nombres = activas['paquete'].astype('string').dropna()
+    primera = nombres.str.split(' ').str[0].str.strip()
+    primera = primera.where(~primera.str.lower().str.contains('demo', regex=False), 'Demo')
+    por_paquete = primera.value_counts()
+    paquetes_data = [int(por_paquete.get(label, 0)) for label in PAQUETES_GRAFICA]
+
+    # H. Carga por servidor
+    servidores = activas['server'].astype('object').fillna('N/A').value_counts()
+
+    vigencias = _conteos(pagos['vigencia'], 'N/A')
+    metodos = _conteos(pagos['metodo_pago'], 'Otro')
+    return {
+        "kpi": {
+            "ingresos": round(ingresos, 2),
+            "clientes": total_activos,
+            "antiguedad": antiguedad,
+            "pct_facturado": round(facturados / num_pagos * 100) if num_pagos else 0,
+            "suspendidos": suspendidos,
+            "ingresos_mx": round(ingresos_mx, 2),
+            "ingresos_latam": round(ingresos - ingresos_mx, 2),
+            "num_pagos": num_pagos,
+            "demos_activos": demos,
+        },
+        "vigencias": {"labels": list(vigencias.keys()), "data": list(vigencias.values())},
+        "paquetes": {"labels": list(PAQUETES_GRAFICA), "data": paquetes_data},
+        "metodos": {"labels": list(metodos.keys()), "data": list(metodos.values())},
+        "facturacion": {"data": [facturados, num_pagos - facturados]},
+        "servidores": {"labels": [str(k) for k in servidores.index], "data": [int(v) for v in servidores.values]},
+    }
+
+
+def ingresos_por_periodo(datos, desde, hasta, granularidad='mes', pais=None, server=None, paquete=None):
+    """{inicio_de_periodo (date): ingresos MXN} para pagos con fecha en [desde, hasta]."""
+    pagos = filtrar_pagos(datos.pagos, pais=pais, server=server, paquete=paquete)
+    fechas = pagos['fecha_pago']
+    pagos = pagos[(fechas >= pd.Timestamp(desde)) & (fechas <= pd.Timestamp(hasta))]
+    fechas = pagos['fecha_pago'].dt.normalize()
+    if granularidad == 'mes':
+        inicio = fechas.dt.to_period('M').dt.start_time
+    elif granularidad == 'semana':
+        inicio = fechas - pd.to_timedelta(fechas.dt.weekday, unit='D')
+    else:
+        inicio = fechas
+    suma = pagos['monto_mxn'].groupby(inicio).sum()
+    return {ts.date(): float(v) for ts, v in suma.items()}
+
+
+# ----- Análisis adicionales -----
+
+def percentiles_montos(datos, percentiles=(10, 25, 50, 75, 90, 95, 99), **filtros):
+    """Percentiles de monto_mxn por vigencia y en total."""
+    pagos = filtrar_pagos(datos.pagos, **filtros)
+    qs = [p / 100 for p in percentiles]
+
+    def fila(serie):
+        valores = serie.quantile(qs).to_numpy() if len(serie) else np.full(len(qs), np.nan)
+        return {f"p{p}": (None if np.isnan(v) else round(float(v), 2)) for p, v in zip(percentiles, valores)}
+
+    por_vigencia = {
+        str(vig): {"num_pagos": int(len(grupo)), **fila(grupo)}
+        for vig, grupo in pagos.groupby('vigencia', observed=True)['monto_mxn']
+    }
+    return {"total": {"num_pagos": int(len(pagos)), **fila(pagos['monto_mxn'])}, "por_vigencia": por_vigencia}
+
+
+def ltv_por_cliente(datos, limite=50, **filtros):
+    """LTV por cliente: ingresos MXN acumulados, pagos, primer/último pago y promedio mensual."""
+    pagos = filtrar_pagos(datos.pagos, **filtros)
+    if pagos.empty:
+        return []
+    g = pagos.groupby('cliente_id').agg(
+        ltv_mxn=('monto_mxn', 'sum'),
+        num_pagos=('pago_id', 'count'),
+        primer_pago=('fecha_pago', 'min'),
+        ultimo_pago=('fecha_pago', 'max'),
+    )
+    meses = ((g['ultimo_pago'] - g['primer_pago']).dt.days / 30.44).clip(lower=1)
+    g['promedio_mensual_mxn'] = g['ltv_mxn'] / meses
+    g = g.sort_values('ltv_mxn', ascending=False).head(limite)
+    return [
+        {
+            "cliente_id": int(cid),
+            "ltv_mxn": round(float(r.ltv_mxn), 2),
+            "num_pagos": int(r.num_pagos),
+            "primer_pago": r.primer_pago.date().isoformat(),
+            "ultimo_pago": r.ultimo_pago.date().isoformat(),
+            "promedio_mensual_mxn": round(float(r.promedio_mensual_mxn), 2),
+        }
+        for cid, r in g.iterrows()
+    ]
+
+
+def ingresos_por_servidor(datos, **filtros):
+    """Ingresos MXN por servidor y mes: {"meses": [...], "servidores": {server: [...]}}."""
+    pagos = filtrar_pagos(datos.pagos, **filtros)
+    if pagos.empty:
+        return {"meses": [], "servidores": {}}
+    tabla = pd.pivot_table(
+        pagos.assign(
+            mes=pagos['fecha_pago'].dt.strftime('%Y-%m'),
+            server=pagos['server'].astype('object').fillna('N/A'),
+        ),
+        index='mes', columns='server', values='monto_mxn', aggfunc='sum', fill_value=0.0
+    ).sort_index()
+    return {
+        "meses": list(tabla.index),
+        "servidores": {str(s): [round(float(v), 2) for v in tabla[s]] for s in tabla.columns},
+    }
@@ -15,18 +15,26 @@ import os
 
 # Librerías de terceros
 import pandas as pd
+import click # CLI (flask <comando>) con opciones
 from decimal import Decimal 
 import locale # <-- Importación del módulo de localización
 
 # Librerías de seguridad y base de datos
 from werkzeug.security import generate_password_hash, check_password_hash
 from sqlalchemy import or_, extract, func, desc, and_, distinct, BigInteger # BigInteger añadido aquí
+from sqlalchemy import event
 
 # Forms (WTForms)
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField, SelectField
 from wtforms.validators import DataRequired, Email, Length, Optional
 
+# Módulos propios
+try:
+    import analitica
+except ImportError:  # app cargada como paquete (p. ej. `flask` desde el directorio padre)
+    from . import analitica
+
 # Configuración de Logging
 import logging
 logging.basicConfig(level=logging.DEBUG)
@@ -122,6 +130,10 @@ class BankTransaction(db.Model):
     negocio_conciliado = db.Column(db.String(255), nullable=True) # Guarda nombres de negocios/sucursales
     num_factura_conciliado = db.Column(db.String(50), nullable=True) # Guarda el número de factura
 
+    __table_args__ = (
+        db.Index('ix_bank_transaction_date', 'date'),
+    )
+
 class Pago(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(100), nullable=False)
@@ -139,8 +151,14 @@ class Pago(db.Model):
     vigencia = db.Column(db.String(20), nullable=True)
     motivo_descuento = db.Column(db.String(150), nullable=True)
     moneda = db.Column(db.String(5), nullable=True)
+    monto_mxn = db.Column(db.Numeric(14, 2), nullable=True) # Calculado al escribir con el tipo de cambio vigente en fecha_pago
     status = db.Column(db.String(20), default='ACTIVO', nullable=False)
-    
+
+    # Periodo que cubre este pago según la reproducción de la historia (ver reproducir_vigencia).
+    # NULL = cancelado o pendiente de recalcular; permite recalcular solo desde el pago editado.
+    periodo_inicio = db.Column(db.Date, nullable=True)
+    periodo_fin = db.Column(db.Date, nullable=True)
+
     paquete_precio_id = db.Column(db.Integer, db.ForeignKey('paquete_precio.id'), nullable=True)
     paquete_precio = db.relationship('PaquetePrecio', backref='pagos_detalle', lazy=True)
 
@@ -149,6 +167,18 @@ class Pago(db.Model):
     bank_transaction_id = db.Column(db.BigInteger, db.ForeignKey('bank_transaction.id'), nullable=True, unique=True)
     bank_transaction = db.relationship('BankTransaction', backref='pago', uselist=False)
 
+    # 🔹 Índices de las rutas calientes (ver migración 7a2d5c9e1f34 y bench_indices.py)
+    __table_args__ = (
+        db.Index('ix_pago_cliente_id_fecha_pago', 'cliente_id', 'fecha_pago'),
+        db.Index('ix_pago_status_fecha_pago', 'status', 'fecha_pago'),
+        # Parcial: casi todas las consultas (dashboard, listado global) solo ven pagos ACTIVOS
+        db.Index(
+            'ix_pago_fecha_pago_activo', 'fecha_pago', 'id',
+            postgresql_where=db.text("status = 'ACTIVO'"),
+            sqlite_where=db.text("status = 'ACTIVO'"),
+        ),
+    )
+
 class Cliente(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     negocio = db.Column(db.String(150), nullable=False) # <- CRÍTICO: Este campo debe existir.
@@ -182,6 +212,10 @@ class Cliente(db.Model):
     numero_factura = db.Column(db.String(50))
     motivo_descuento = db.Column(db.String(150), nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_cliente_negocio', 'negocio'),
+    )
+
 class Suscripcion(db.Model):
     id = db.Column(db.Integer, primary_key=True)
 
@@ -210,6 +244,11 @@ class Suscripcion(db.Model):
 
     observaciones = db.Column(db.Text, nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_suscripcion_cliente_id', 'cliente_id'),
+        db.Index('ix_suscripcion_status_vence_en', 'status', 'vence_en'),
+    )
+
 class PaquetePrecio(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     pais = db.Column(db.String(50), nullable=False)
@@ -226,9 +265,888 @@ class PaquetePrecio(db.Model):
     def __repr__(self):
         return f"<Paquete {self.paquete} - {self.pais} ({self.vigencia})>"
 
+# Tipo de cambio histórico a MXN: la tasa de una moneda rige desde fecha_vigencia hasta la siguiente
+class TipoCambio(db.Model):
+    __tablename__ = 'tipo_cambio'
+    id = db.Column(db.Integer, primary_key=True)
+    moneda = db.Column(db.String(5), nullable=False)        # USD | COP | ...
+    fecha_vigencia = db.Column(db.Date, nullable=False)
+    tasa_mxn = db.Column(db.Numeric(18, 8), nullable=False) # MXN por 1 unidad de la moneda
+
+    __table_args__ = (
+        db.UniqueConstraint('moneda', 'fecha_vigencia', name='uq_tipo_cambio_moneda_fecha'),
+    )
+
+    def __repr__(self):
+        return f"<TipoCambio {self.moneda} {self.fecha_vigencia}: {self.tasa_mxn}>"
+
+# Foto diaria de KPIs por país y servidor (flask kpi-snapshot), para gráficas históricas
+class KpiSnapshot(db.Model):
+    __tablename__ = 'kpi_snapshot'
+    id = db.Column(db.Integer, primary_key=True)
+    fecha = db.Column(db.Date, nullable=False)
+    pais = db.Column(db.String(50), nullable=True)
+    server = db.Column(db.String(100), nullable=True)
+
+    # Suscripciones al momento de la foto
+    clientes_activos = db.Column(db.Integer, nullable=False, default=0)
+    suspendidos = db.Column(db.Integer, nullable=False, default=0)
+    demos_activos = db.Column(db.Integer, nullable=False, default=0)
+
+    # Pagos ACTIVOS del mes de la foto (acumulado al día)
+    num_pagos_mes = db.Column(db.Integer, nullable=False, default=0)
+    pagos_facturados_mes = db.Column(db.Integer, nullable=False, default=0)
+    ingresos_mes_mxn = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+    creado_en = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('fecha', 'pais', 'server', name='uq_kpi_snapshot_fecha_pais_server'),
+    )
+
+# Versión de cambios por tabla (para ETag / If-None-Match en las APIs de lectura).
+# Cada tabla se reparte en VERSION_SHARDS filas: cada commit incrementa una al azar
+# (así los workers no se pelean por la misma fila) y la versión es la suma.
+class CambioVersion(db.Model):
+    __tablename__ = 'cambio_version'
+    tabla = db.Column(db.String(50), nullable=False)
+    shard = db.Column(db.SmallInteger, nullable=False, default=0)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        db.PrimaryKeyConstraint('tabla', 'shard', name='pk_cambio_version'),
+    )
+
+# Ledger de periodos pagados: una fila por pago con periodo (Pago.periodo_inicio / periodo_fin),
+# para consultas "a la fecha X" por rango sin reproducir historias de pagos.
+class SuscripcionPeriodo(db.Model):
+    __tablename__ = 'suscripcion_periodo'
+    id = db.Column(db.Integer, primary_key=True)
+    pago_id = db.Column(db.Integer, db.ForeignKey('pago.id', ondelete='CASCADE'), nullable=False, unique=True)
+    cliente_id = db.Column(db.Integer, db.ForeignKey('cliente.id', ondelete='CASCADE'), nullable=False)
+    periodo_inicio = db.Column(db.Date, nullable=False)
+    periodo_fin = db.Column(db.Date, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_suscripcion_periodo_inicio_fin', 'periodo_inicio', 'periodo_fin'),
+        db.Index('ix_suscripcion_periodo_cliente_id_inicio', 'cliente_id', 'periodo_inicio'),
+    )
+
+# Secuencias: en Postgres son SEQUENCE reales; esta tabla las emula en SQLite (ver reservar_ids_manuales)
+class Secuencia(db.Model):
+    __tablename__ = 'secuencia'
+    nombre = db.Column(db.String(50), primary_key=True)
+    valor = db.Column(db.BigInteger, nullable=False, default=0)
+
+# bank_transaction_id de pagos manuales = -nextval (create_all solo la crea en Postgres)
+secuencia_pago_manual = db.Sequence('pago_manual_id_seq', metadata=db.metadata)
+
+# Rollup mensual de ingresos (pagos ACTIVOS): una fila por combinación de dimensiones del dashboard.
+# Se recalcula por mes en la misma transacción que las escrituras de pagos.
+class ResumenIngresosMensual(db.Model):
+    __tablename__ = 'resumen_ingresos_mensual'
+    id = db.Column(db.Integer, primary_key=True)
+    anio = db.Column(db.Integer, nullable=False)
+    mes = db.Column(db.Integer, nullable=False)
+    pais = db.Column(db.String(50), nullable=True)       # Cliente.pais
+    server = db.Column(db.String(100), nullable=True)    # Suscripcion.server
+    paquete = db.Column(db.String(100), nullable=True)   # Pago.paquete
+    vigencia = db.Column(db.String(20), nullable=True)   # Pago.vigencia
+    moneda = db.Column(db.String(5), nullable=True)
+    metodo_pago = db.Column(db.String(50), nullable=True)
+    factura_pago = db.Column(db.Boolean, nullable=True)
+    num_pagos = db.Column(db.Integer, nullable=False, default=0)
+    monto_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    monto_mxn_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_resumen_ingresos_mensual_anio_mes', 'anio', 'mes'),
+    )
+
+# Modelo de lectura: una fila por cliente con la proyección Cliente+Suscripcion
+# que usan los listados. Se mantiene en la misma transacción que las escrituras.
+class ClienteResumen(db.Model):
+    __tablename__ = 'cliente_resumen'
+    cliente_id = db.Column(db.Integer, db.ForeignKey('cliente.id', ondelete='CASCADE'), primary_key=True)
+
+    # Cliente
+    negocio = db.Column(db.String(150), nullable=False, index=True)
+    nombre_contacto = db.Column(db.String(120), nullable=True)
+    mail = db.Column(db.String(120), nullable=True)
+    telefono = db.Column(db.String(30), nullable=True)
+    telefono_secundario_1 = db.Column(db.String(30), nullable=True)
+    telefono_secundario_2 = db.Column(db.String(30), nullable=True)
+    telefono_secundario_3 = db.Column(db.String(30), nullable=True)
+    telefonos_normalizados = db.Column(db.String(150), nullable=True) # Solo dígitos, separados por espacio
+    pais = db.Column(db.String(50), nullable=True)
+    status_cliente = db.Column(db.String(20), nullable=True)
+    rfc = db.Column(db.String(20), nullable=True)
+    ultimo_pago = db.Column(db.Date, nullable=True) # Cliente.fecha_pago
+
+    # Suscripcion (NULL si el cliente no tiene)
+    suscripcion_id = db.Column(db.Integer, nullable=True)
+    id_gumi = db.Column(db.String(50), nullable=True)
+    status = db.Column(db.String(20), nullable=True)
+    server = db.Column(db.String(100), nullable=True)
+    paquete = db.Column(db.String(100), nullable=True)
+    vigencia = db.Column(db.String(20), nullable=True)
+    fecha_inicio = db.Column(db.Date, nullable=True)
+    vence_en = db.Column(db.Date, nullable=True)
+    proximo_pago = db.Column(db.Date, nullable=True)
+    observaciones = db.Column(db.Text, nullable=True)
+
+    # Derivados
+    es_demo = db.Column(db.Boolean, nullable=False, default=False, index=True)
+    busqueda = db.Column(db.Text, nullable=True) # negocio, contacto, mail, id_gumi, rfc y teléfonos en minúsculas
+    actualizado_en = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_cliente_resumen_status_vence_en', 'status', 'vence_en'),
+        # Postgres: índice trigram para ILIKE '%q%' y ranking por similitud (requiere pg_trgm)
+        db.Index(
+            'ix_cliente_resumen_busqueda_trgm', 'busqueda',
+            postgresql_using='gin', postgresql_ops={'busqueda': 'gin_trgm_ops'}
+        ).ddl_if(dialect='postgresql'),
+    )
+
+# SQLite: tabla sombra FTS5 (tokenizer trigram, rowid = cliente_id) para la búsqueda de clientes
+event.listen(
+    ClienteResumen.__table__, 'after_create',
+    db.DDL("CREATE VIRTUAL TABLE IF NOT EXISTS cliente_resumen_fts USING fts5(busqueda, tokenize='trigram')").execute_if(dialect='sqlite')
+)
+event.listen(
+    ClienteResumen.__table__, 'before_drop',
+    db.DDL("DROP TABLE IF EXISTS cliente_resumen_fts").execute_if(dialect='sqlite')
+)
+event.listen(
+    db.metadata, 'before_create',
+    db.DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect='postgresql')
+)
+
 # ========== Fin de Modelos ==========
 
 
+# =======================================================
+# VERSIONES DE CAMBIO POR TABLA (se incrementan en cada commit)
+# =======================================================
+# Tablas cuyas escrituras invalidan las respuestas cacheadas por ETag
+TABLAS_VERSIONADAS = {'cliente', 'suscripcion', 'pago', 'bank_transaction', 'paquete_precio', 'kpi_snapshot'}
+
+
+def _marcar_tablas_modificadas(session, tablas):
+    pendientes = session.info.setdefault('tablas_modificadas', set())
+    pendientes.update(t for t in tablas if t in TABLAS_VERSIONADAS)
+
+
+def _cliente_ids_afectados(obj):
+    """IDs de cliente (actual y anterior) cuya fila de cliente_resumen depende de obj."""
+    from sqlalchemy import inspect as sa_inspect
+
+    if isinstance(obj, Cliente):
+        return {obj.id}
+    if isinstance(obj, (Suscripcion, Pago)):
+        historial = sa_inspect(obj).attrs.cliente_id.history
+        return {obj.cliente_id, *historial.deleted}
+    return set()
+
+
+@event.listens_for(db.session, 'after_flush')
+def _registrar_tablas_en_flush(session, flush_context):
+    """Anota qué tablas versionadas (y qué clientes) tocó el flush (altas, cambios y bajas)."""
+    tablas = set()
+    modificados = list(session.new) + list(session.deleted)
+    modificados += [obj for obj in session.dirty if session.is_modified(obj, include_collections=False)]
+    clientes = session.info.setdefault('clientes_resumen_pendientes', set())
+    for obj in modificados:
+        tablas.add(obj.__table__.name)
+        clientes.update(_cliente_ids_afectados(obj))
+    clientes.discard(None)
+    _marcar_tablas_modificadas(session, tablas)
+    _registrar_meses_de_ingresos(session, modificados)
+    _registrar_periodos_invalidados(session, modificados)
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _registrar_tablas_en_bulk(orm_execute_state):
+    """
+    Cubre los UPDATE/DELETE/INSERT masivos que no pasan por el flush.
+    Solo los usan comandos CLI (recalcular-vigencias, backfill-monto-mxn, tipo-cambio),
+    nunca una petición web: ahí se reconstruye el resumen completo al confirmar.
+    """
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            nombre = mapper.local_table.name
+            _marcar_tablas_modificadas(orm_execute_state.session, {nombre})
+            if nombre in ('cliente', 'suscripcion', 'pago'):
+                # No sabemos qué clientes tocó: se reconstruye el resumen completo
+                orm_execute_state.session.info['resumen_completo_pendiente'] = True
+                orm_execute_state.session.info['ingresos_completo_pendiente'] = True
+
+
+# Filas por tabla en cambio_version (ver CambioVersion)
+VERSION_SHARDS = 8
+
+
+def _incrementar_versiones(session, tablas):
+    """UPSERT version = version + 1 para cada tabla, en un shard al azar, dentro de la transacción en curso."""
+    import random
+
+    tabla_cv = CambioVersion.__table__
+    dialecto = session.get_bind().dialect.name
+    if dialecto == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as upsert
+
+    shard = random.randrange(VERSION_SHARDS)
+    for tabla in sorted(tablas):  # Orden fijo para no provocar deadlocks entre workers
+        stmt = upsert(tabla_cv).values(tabla=tabla, shard=shard, version=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[tabla_cv.c.tabla, tabla_cv.c.shard],
+            set_={'version': tabla_cv.c.version + 1}
+        )
+        session.execute(stmt)
+
+
+@event.listens_for(db.session, 'before_commit')
+def _versionar_antes_de_commit(session):
+    # El flush final del commit ocurre después de este hook: lo adelantamos
+    # para que las tablas pendientes queden registradas antes del UPSERT.
+    session.flush()
+
+    # 1. Modelo de lectura cliente_resumen (misma transacción)
+    if session.info.pop('resumen_completo_pendiente', False):
+        session.info.pop('clientes_resumen_pendientes', None)
+        refrescar_cliente_resumen(session)
+    else:
+        clientes = session.info.pop('clientes_resumen_pendientes', None)
+        if clientes:
+            refrescar_cliente_resumen(session, clientes)
+
+    # 1b. Rollup mensual de ingresos
+    meses = session.info.pop('meses_ingresos_pendientes', set())
+    clientes_ingresos = session.info.pop('clientes_ingresos_pendientes', set())
+    if session.info.pop('ingresos_completo_pendiente', False):
+        refrescar_resumen_ingresos(session)
+    elif meses or clientes_ingresos:
+        if clientes_ingresos:
+            meses |= _meses_con_pagos_de_clientes(session, clientes_ingresos)
+        if meses:
+            refrescar_resumen_ingresos(session, meses)
+
+    # 1c. Periodos de pago (y su ledger) de los clientes cuyos pagos cambiaron en esta transacción
+    periodos = session.info.pop('periodos_pendientes', None)
+    if periodos:
+        for cliente_id in sorted(periodos):
+            recalcular_periodos_cliente(session, cliente_id, periodos[cliente_id])
+
+    # 2. Versiones para ETag
+    tablas = session.info.pop('tablas_modificadas', None)
+    if tablas:
+        _incrementar_versiones(session, tablas)
+        session.info.setdefault('tablas_confirmadas', set()).update(tablas)
+
+
+# Callbacks por proceso que se ejecutan después de un commit que tocó ciertas tablas
+_OYENTES_COMMIT = []
+
+
+def al_confirmar_cambios(*tablas):
+    """Registra fn() para que se ejecute tras cada commit que modifique alguna de las tablas."""
+    def decorator(fn):
+        _OYENTES_COMMIT.append((set(tablas), fn))
+        return fn
+    return decorator
+
+
+@event.listens_for(db.session, 'after_commit')
+def _notificar_cambios_confirmados(session):
+    tablas = session.info.pop('tablas_confirmadas', None)
+    if not tablas:
+        return
+    for tablas_oyente, fn in _OYENTES_COMMIT:
+        if tablas & tablas_oyente:
+            try:
+                fn()
+            except Exception:
+                logger.error(f"Error en oyente de commit {fn.__name__}: {traceback.format_exc()}")
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _descartar_tablas_pendientes(session):
+    session.info.pop('tablas_modificadas', None)
+    session.info.pop('tablas_confirmadas', None)
+    session.info.pop('clientes_resumen_pendientes', None)
+    session.info.pop('resumen_completo_pendiente', None)
+    session.info.pop('meses_ingresos_pendientes', None)
+    session.info.pop('clientes_ingresos_pendientes', None)
+    session.info.pop('ingresos_completo_pendiente', None)
+    session.info.pop('periodos_pendientes', None)
+
+
+# =======================================================
+# MODELO DE LECTURA cliente_resumen
+# =======================================================
+RESUMEN_LOTE = 500 # IDs por sentencia IN al refrescar
+
+
+def normalizar_telefono(tel):
+    """Deja solo los dígitos (quita espacios, guiones y el '.0' de los CSV)."""
+    if not tel:
+        return ''
+    tel = str(tel).strip()
+    if tel.endswith('.0'):
+        tel = tel[:-2]
+    return ''.join(ch for ch in tel if ch.isdigit())
+
+
+def _fila_cliente_resumen(r, ahora):
+    telefonos = [r.telefono, r.telefono_secundario_1, r.telefono_secundario_2, r.telefono_secundario_3]
+    telefonos_normalizados = ' '.join(filter(None, map(normalizar_telefono, telefonos))) or None
+    es_demo = bool(
+        (r.paquete and 'demo' in r.paquete.lower())
+        or (r.suscripcion_id is None and 'en prueba' in (r.status_cliente or '').lower())
+    )
+    busqueda = ' '.join(
+        str(v).strip().lower()
+        for v in (r.negocio, r.nombre_contacto, r.mail, r.id_gumi, r.rfc, telefonos_normalizados)
+        if v
+    )
+    return {
+        'cliente_id': r.cliente_id,
+        'negocio': r.negocio,
+        'nombre_contacto': r.nombre_contacto,
+        'mail': r.mail,
+        'telefono': r.telefono,
+        'telefono_secundario_1': r.telefono_secundario_1,
+        'telefono_secundario_2': r.telefono_secundario_2,
+        'telefono_secundario_3': r.telefono_secundario_3,
+        'telefonos_normalizados': telefonos_normalizados,
+        'pais': r.pais,
+        'status_cliente': r.status_cliente,
+        'rfc': r.rfc,
+        'ultimo_pago': r.ultimo_pago,
+        'suscripcion_id': r.suscripcion_id,
+        'id_gumi': r.id_gumi,
+        'status': r.status,
+        'server': r.server,
+        'paquete': r.paquete,
+        'vigencia': r.vigencia,
+        'fecha_inicio': r.fecha_inicio,
+        'vence_en': r.vence_en,
+        'proximo_pago': r.proximo_pago,
+        'observaciones': r.observaciones,
+        'es_demo': es_demo,
+        'busqueda': busqueda or None,
+        'actualizado_en': ahora,
+    }
+
+
+_FTS_CLIENTES = {}  # url de la DB -> bool (¿existe cliente_resumen_fts?)
+
+
+def _fts_clientes_disponible(session):
+    """True si la DB es SQLite y tiene la tabla sombra FTS5 de búsqueda."""
+    from sqlalchemy import text
+    bind = session.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return False
+    clave = str(bind.url)
+    if clave not in _FTS_CLIENTES:
+        existe = session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cliente_resumen_fts'"
+        )).first()
+        _FTS_CLIENTES[clave] = existe is not None
+    return _FTS_CLIENTES[clave]
+
+
+def _sincronizar_fts_clientes(session, lote, filas):
+    """Replica en cliente_resumen_fts las filas recién escritas (solo SQLite)."""
+    from sqlalchemy import text, bindparam
+    if not _fts_clientes_disponible(session):
+        return
+    if lote is None:
+        session.execute(text("DELETE FROM cliente_resumen_fts"))
+    else:
+        session.execute(
+            text("DELETE FROM cliente_resumen_fts WHERE rowid IN :ids").bindparams(bindparam('ids', expanding=True)),
+            {'ids': list(lote)}
+        )
+    if filas:
+        session.execute(
+            text("INSERT INTO cliente_resumen_fts (rowid, busqueda) VALUES (:cliente_id, :busqueda)"),
+            [{'cliente_id': f['cliente_id'], 'busqueda': f['busqueda'] or ''} for f in filas]
+        )
+
+
+def refrescar_cliente_resumen(session, cliente_ids=None):
+    """
+    Recalcula las filas de cliente_resumen de los clientes indicados
+    (o de todos si cliente_ids es None) con DELETE + INSERT en la transacción actual.
+
+    Una fila por cliente: el modelo es 1:1 (Cliente.suscripcion con uselist=False y todas las
+    rutas usan Suscripcion.query.filter_by(cliente_id=...).first()). Si aun así un cliente
+    tuviera varias suscripciones, se toma la de menor id y se deja aviso en el log.
+    """
+    from sqlalchemy import select, outerjoin
+
+    tabla = ClienteResumen.__table__
+    ahora = datetime.now()
+
+    stmt_base = select(
+        Cliente.id.label('cliente_id'),
+        Cliente.negocio, Cliente.nombre_contacto, Cliente.mail,
+        Cliente.telefono, Cliente.telefono_secundario_1,
+        Cliente.telefono_secundario_2, Cliente.telefono_secundario_3,
+        Cliente.pais, Cliente.status_cliente, Cliente.rfc,
+        Cliente.fecha_pago.label('ultimo_pago'),
+        Suscripcion.id.label('suscripcion_id'),
+        Suscripcion.id_gumi, Suscripcion.status, Suscripcion.server,
+        Suscripcion.paquete, Suscripcion.vigencia, Suscripcion.fecha_inicio,
+        Suscripcion.vence_en, Suscripcion.proximo_pago, Suscripcion.observaciones,
+    ).select_from(
+        outerjoin(Cliente, Suscripcion, Cliente.id == Suscripcion.cliente_id)
+    ).order_by(Cliente.id, Suscripcion.id)
+
+    if cliente_ids is None:
+        session.execute(tabla.delete())
+        lotes = [None]
+    else:
+        ids = sorted(cliente_ids)
+        lotes = [ids[i:i + RESUMEN_LOTE] for i in range(0, len(ids), RESUMEN_LOTE)]
+
+    for lote in lotes:
+        stmt = stmt_base
+        if lote is not None:
+            session.execute(tabla.delete().where(tabla.c.cliente_id.in_(lote)))
+            stmt = stmt.where(Cliente.id.in_(lote))
+
+        filas = {}
+        duplicados = set()
+        for r in session.execute(stmt):
+            # Una fila por cliente (si hubiera más de una suscripción, gana la de menor id)
+            if r.cliente_id not in filas:
+                filas[r.cliente_id] = _fila_cliente_resumen(r, ahora)
+            else:
+                duplicados.add(r.cliente_id)
+        if duplicados:
+            logger.warning(
+                f"cliente_resumen: {len(duplicados)} clientes con más de una suscripción; "
+                f"solo se muestra la de menor id (clientes {sorted(duplicados)[:20]})"
+            )
+        if filas:
+            session.execute(tabla.insert(), list(filas.values()))
+        _sincronizar_fts_clientes(session, lote, list(filas.values()))
+
+
+def buscar_clientes(texto, limite=20):
+    """
+    Búsqueda de clientes por negocio, contacto, mail, ID Gumi, RFC o teléfono,
+    ordenada por relevancia. Usa el índice trigram (Postgres) o la tabla FTS5
+    (SQLite); si ninguno está disponible cae a ILIKE sobre cliente_resumen.
+    Devuelve filas ClienteResumen.
+    """
+    from sqlalchemy import text as sql_text, case
+
+    q = (texto or '').strip().lower()
+    digitos = normalizar_telefono(q)
+    if len(digitos) >= 3 and all(ch.isdigit() or ch in ' +-().' for ch in q):
+        q = digitos  # Parece un teléfono: buscamos contra los teléfonos normalizados
+    if len(q) < 3:
+        return []
+
+    R = ClienteResumen
+    prefijo_negocio = case((func.lower(R.negocio).like(f'{q}%'), 0), else_=1)
+    dialecto = db.session.get_bind().dialect.name
+
+    if dialecto == 'postgresql':
+        return R.query.filter(
+            R.busqueda.ilike(f'%{q}%')
+        ).order_by(
+            prefijo_negocio, func.word_similarity(q, R.busqueda).desc(), R.negocio.asc()
+        ).limit(limite).all()
+
+    if _fts_clientes_disponible(db.session):
+        frase = '"' + q.replace('"', '""') + '"'
+        ranking = db.session.execute(sql_text(
+            "SELECT rowid, bm25(cliente_resumen_fts) AS rank FROM cliente_resumen_fts "
+            "WHERE cliente_resumen_fts MATCH :q ORDER BY rank LIMIT :n"
+        ), {'q': frase, 'n': limite * 3}).all()
+        if not ranking:
+            return []
+        orden = {cid: i for i, (cid, _) in enumerate(ranking)}
+        filas = R.query.filter(R.cliente_id.in_(list(orden))).all()
+        filas.sort(key=lambda r: (not r.negocio.lower().startswith(q), orden[r.cliente_id]))
+        return filas[:limite]
+
+    return R.query.filter(
+        R.busqueda.ilike(f'%{q}%')
+    ).order_by(prefijo_negocio, R.negocio.asc()).limit(limite).all()
+
+
+# =======================================================
+# AUTOCOMPLETADO EN MEMORIA (buscador rápido del menú)
+# =======================================================
+# Opcional: AUTOCOMPLETADO_EN_MEMORIA=1 activa un índice de trigramas por worker
+# que responde /api/clientes/search_menu sin ir a la base de datos.
+app.config.setdefault('AUTOCOMPLETADO_EN_MEMORIA', os.environ.get('AUTOCOMPLETADO_EN_MEMORIA', '0') == '1')
+# Cada cuántos segundos se compara contra cambio_version (cambios hechos por otros workers)
+app.config.setdefault('AUTOCOMPLETADO_TTL', int(os.environ.get('AUTOCOMPLETADO_TTL', '30')))
+
+
+class IndiceAutocompletado:
+    """
+    Índice de trigramas en memoria sobre negocio, contacto, mail e ID Gumi.
+    Se construye la primera vez que se usa y se invalida tras un commit local
+    que toque clientes/suscripciones, o cuando cambian las versiones en la DB
+    (revisadas como máximo cada AUTOCOMPLETADO_TTL segundos).
+    """
+    TABLAS = ('cliente', 'suscripcion')
+
+    def __init__(self):
+        import threading
+        self._lock = threading.Lock()
+        # (entradas, trigramas) publicados juntos: cada búsqueda lee una sola foto
+        # entradas: cliente_id -> dict(id, negocio, nombre_contacto, texto)
+        # trigramas: trigrama -> set(cliente_id)
+        self._indice = ({}, {})
+        self._versiones = None
+        self._revisado_en = 0.0
+        self._vigente = False
+
+    @staticmethod
+    def _trigramas_de(texto):
+        return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+    def invalidar(self):
+        self._vigente = False
+
+    def _construir(self):
+        entradas = {}
+        trigramas = {}
+        filas = db.session.query(
+            ClienteResumen.cliente_id, ClienteResumen.negocio, ClienteResumen.nombre_contacto,
+            ClienteResumen.mail, ClienteResumen.id_gumi
+        ).all()
+        for cid, negocio, contacto, mail, id_gumi in filas:
+            texto = ' '.join(str(v).strip().lower() for v in (negocio, contacto, mail, id_gumi) if v)
+            entradas[cid] = {
+                'id': cid,
+                'negocio': negocio,
+                'nombre_contacto': contacto,
+                'negocio_lower': (negocio or '').lower(),
+                'texto': texto,
+            }
+            for tg in self._trigramas_de(texto):
+                trigramas.setdefault(tg, set()).add(cid)
+        self._indice = (entradas, trigramas)
+
+    def _asegurar_vigente(self):
+        import time
+        ahora = time.monotonic()
+        revisar_db = self._versiones is None or ahora - self._revisado_en >= current_app.config['AUTOCOMPLETADO_TTL']
+        if self._vigente and not revisar_db:
+            return
+        with self._lock:
+            versiones = obtener_versiones(self.TABLAS) if (revisar_db or not self._vigente) else self._versiones
+            if not self._vigente or versiones != self._versiones:
+                self._construir()
+                self._vigente = True
+            self._versiones = versiones
+            self._revisado_en = ahora
+
+    def buscar(self, texto, limite=10):
+        q = (texto or '').strip().lower()
+        if len(q) < 3:
+            return []
+        self._asegurar_vigente()
+        entradas, trigramas = self._indice
+
+        candidatos = None
+        for tg in self._trigramas_de(q):
+            ids = trigramas.get(tg)
+            if not ids:
+                return []
+            candidatos = set(ids) if candidatos is None else candidatos & ids
+            if not candidatos:
+                return []
+
+        # Verificación final (los trigramas pueden dar falsos positivos) y ranking
+        encontrados = [entradas[cid] for cid in candidatos if q in entradas[cid]['texto']]
+        encontrados.sort(key=lambda e: (not e['negocio_lower'].startswith(q), e['negocio_lower']))
+        return [
+            {'id': e['id'], 'negocio': e['negocio'], 'nombre_contacto': e['nombre_contacto']}
+            for e in encontrados[:limite]
+        ]
+
+
+indice_autocompletado = IndiceAutocompletado()
+
+
+@al_confirmar_cambios(*IndiceAutocompletado.TABLAS)
+def _invalidar_indice_autocompletado():
+    indice_autocompletado.invalidar()
+
+
+@app.cli.command('reconstruir-cliente-resumen')
+def reconstruir_cliente_resumen_cmd():
+    """Reconstruye por completo la tabla cliente_resumen."""
+    refrescar_cliente_resumen(db.session)
+    db.session.commit()
+    total = db.session.query(func.count(ClienteResumen.cliente_id)).scalar()
+    print(f"✅ cliente_resumen reconstruida: {total} clientes.")
+
+
+# =======================================================
+# MANTENIMIENTO DEL ROLLUP resumen_ingresos_mensual
+# =======================================================
+
+def _registrar_meses_de_ingresos(session, modificados):
+    """
+    Anota qué meses del rollup hay que recalcular:
+    - Pago: mes de la fecha actual y de la anterior (si cambió).
+    - Cliente (pais) / Suscripcion (server, cliente): todos los meses con pagos de ese cliente.
+    """
+    from sqlalchemy import inspect as sa_inspect
+
+    meses = session.info.setdefault('meses_ingresos_pendientes', set())
+    clientes = session.info.setdefault('clientes_ingresos_pendientes', set())
+    for obj in modificados:
+        if isinstance(obj, Pago):
+            historial = sa_inspect(obj).attrs.fecha_pago.history
+            for f in (obj.fecha_pago, *historial.deleted):
+                if f:
+                    meses.add((f.year, f.month))
+        elif isinstance(obj, Cliente):
+            if obj in session.new or obj in session.deleted or sa_inspect(obj).attrs.pais.history.has_changes():
+                clientes.add(obj.id)
+        elif isinstance(obj, Suscripcion):
+            estado = sa_inspect(obj).attrs
+            if (obj in session.new or obj in session.deleted
+                    or estado.server.history.has_changes() or estado.cliente_id.history.has_changes()):
+                clientes.update(_cliente_ids_afectados(obj))
+    clientes.discard(None)
+
+
+# Conservar el valor anterior aunque el atributo esté expirado (tras un commit): sin esto
+# history.deleted queda vacío y no se recalcularía el mes / cliente de origen.
+def _con_historial_activo(target, value, oldvalue, initiator):
+    return value
+
+
+for _atributo in (Pago.fecha_pago, Pago.cliente_id, Suscripcion.cliente_id):
+    event.listen(_atributo, 'set', _con_historial_activo, active_history=True, retval=True)
+
+
+def _meses_con_pagos_de_clientes(session, cliente_ids):
+    ids = sorted(cliente_ids)
+    meses = set()
+    for i in range(0, len(ids), RESUMEN_LOTE):
+        fechas = session.execute(
+            db.select(Pago.fecha_pago).where(Pago.cliente_id.in_(ids[i:i + RESUMEN_LOTE])).distinct()
+        ).scalars()
+        meses.update((f.year, f.month) for f in fechas if f)
+    return meses
+
+
+def refrescar_resumen_ingresos(session, meses=None):
+    """
+    Recalcula resumen_ingresos_mensual para los (anio, mes) indicados (o todo si meses es None)
+    con DELETE + INSERT ... SELECT agrupado, en la transacción actual.
+    """
+    from sqlalchemy import select, insert, cast, Integer
+    from dateutil.relativedelta import relativedelta
+
+    tabla = ResumenIngresosMensual.__table__
+    anio = cast(extract('year', Pago.fecha_pago), Integer)
+    mes = cast(extract('month', Pago.fecha_pago), Integer)
+    columnas = ['anio', 'mes', 'pais', 'server', 'paquete', 'vigencia', 'moneda',
+                'metodo_pago', 'factura_pago', 'num_pagos', 'monto_total', 'monto_mxn_total']
+    # Mismos joins que el dashboard: pagos ACTIVOS con cliente, suscripción opcional
+    stmt_base = select(
+        anio, mes, Cliente.pais, Suscripcion.server, Pago.paquete, Pago.vigencia, Pago.moneda,
+        Pago.metodo_pago, Pago.factura_pago, func.count(Pago.id), func.sum(Pago.monto),
+        func.coalesce(func.sum(Pago.monto_mxn), 0)
+    ).join(Cliente, Pago.cliente_id == Cliente.id).outerjoin(
+        Suscripcion, Pago.cliente_id == Suscripcion.cliente_id
+    ).where(Pago.status == 'ACTIVO').group_by(
+        anio, mes, Cliente.pais, Suscripcion.server, Pago.paquete, Pago.vigencia, Pago.moneda,
+        Pago.metodo_pago, Pago.factura_pago
+    )
+
+    if meses is None:
+        session.execute(tabla.delete())
+        session.execute(insert(tabla).from_select(columnas, stmt_base))
+        return
+
+    for a, m in sorted(meses):
+        inicio = date(a, m, 1)
+        fin = inicio + relativedelta(months=1) - timedelta(days=1)
+        session.execute(tabla.delete().where(tabla.c.anio == a, tabla.c.mes == m))
+        session.execute(insert(tabla).from_select(
+            columnas, stmt_base.where(Pago.fecha_pago.between(inicio, fin))
+        ))
+
+
+@app.cli.command('reconstruir-resumen-ingresos')
+def reconstruir_resumen_ingresos_cmd():
+    """Reconstruye por completo la tabla resumen_ingresos_mensual."""
+    refrescar_resumen_ingresos(db.session)
+    db.session.commit()
+    filas, pagos = db.session.query(
+        func.count(ResumenIngresosMensual.id), func.sum(ResumenIngresosMensual.num_pagos)
+    ).one()
+    print(f"✅ resumen_ingresos_mensual reconstruida: {filas} filas, {pagos or 0} pagos.")
+
+
+# =======================================================
+# TIPOS DE CAMBIO Y Pago.monto_mxn
+# =======================================================
+
+def _moneda_normalizada(moneda):
+    return (moneda or 'MXN').upper()
+
+
+def _expr_tasa_mxn(moneda_col, fecha_col):
+    """Subconsulta escalar: tasa vigente de la moneda en la fecha (NULL si no hay)."""
+    return db.select(TipoCambio.tasa_mxn).where(
+        TipoCambio.moneda == func.upper(func.coalesce(moneda_col, 'MXN')),
+        TipoCambio.fecha_vigencia <= fecha_col
+    ).order_by(TipoCambio.fecha_vigencia.desc()).limit(1).scalar_subquery()
+
+
+def _tasas_de_respaldo():
+    """Tasas fijas de convertir_a_mxn, para monedas sin ninguna fila en tipo_cambio."""
+    return {'MXN': 1, 'USD': TASA_USD_MXN, 'COP': TASA_COP_MXN}
+
+
+def _expr_tasa_de_respaldo(moneda_col):
+    """Equivalente SQL de _tasas_de_respaldo (NULL para monedas sin tasa fija)."""
+    from sqlalchemy import case
+    return case(
+        {m: t for m, t in _tasas_de_respaldo().items()},
+        value=func.upper(func.coalesce(moneda_col, 'MXN')),
+        else_=None
+    )
+
+
+def tasa_a_mxn(connection, moneda, fecha):
+    """
+    Tasa a MXN vigente en `fecha` para `moneda` (1 para MXN). Sin tasa registrada usa la
+    tasa fija TASA_USD_MXN / TASA_COP_MXN; si la moneda tampoco tiene tasa fija devuelve
+    None (el pago queda sin monto_mxn hasta registrar la tasa con `flask tipo-cambio`).
+    """
+    moneda = _moneda_normalizada(moneda)
+    if moneda == 'MXN':
+        return Decimal('1')
+    tasa = connection.execute(
+        db.select(TipoCambio.tasa_mxn).where(
+            TipoCambio.moneda == moneda,
+            TipoCambio.fecha_vigencia <= (fecha or date.today())
+        ).order_by(TipoCambio.fecha_vigencia.desc()).limit(1)
+    ).scalar()
+    if tasa is not None:
+        return Decimal(str(tasa))
+    respaldo = _tasas_de_respaldo().get(moneda)
+    if respaldo is None:
+        logger.warning(f"Sin tipo de cambio para {moneda} al {fecha}: el pago queda sin monto_mxn")
+        return None
+    logger.warning(f"Sin tipo de cambio para {moneda} al {fecha}: se usa la tasa fija {respaldo}")
+    return Decimal(str(respaldo))
+
+
+@event.listens_for(Pago, 'before_insert')
+@event.listens_for(Pago, 'before_update')
+def _calcular_monto_mxn(mapper, connection, pago):
+    """Fija monto_mxn al escribir el pago (alta, o cambio de monto, moneda o fecha)."""
+    from sqlalchemy import inspect as sa_inspect
+
+    estado = sa_inspect(pago).attrs
+    cambio = any(estado[a].history.has_changes() for a in ('monto', 'moneda', 'fecha_pago'))
+    if pago.monto_mxn is not None and not cambio:
+        return
+    if pago.monto is None:
+        pago.monto_mxn = None
+        return
+    tasa = tasa_a_mxn(connection, pago.moneda, pago.fecha_pago)
+    if tasa is None:
+        pago.monto_mxn = None  # Se recalcula al registrar la tasa (ver tipo-cambio / backfill-monto-mxn)
+        return
+    pago.monto_mxn = (Decimal(str(pago.monto)) * tasa).quantize(Decimal('0.01'))
+
+
+def recalcular_montos_mxn(session, moneda=None, desde=None):
+    """
+    UPDATE masivo de Pago.monto_mxn con la tasa vigente en cada fecha_pago (misma regla que
+    tasa_a_mxn: tipo_cambio, luego la tasa fija, luego NULL).
+    Filtra opcionalmente por moneda y por fecha_pago >= desde. Devuelve los pagos actualizados.
+    """
+    from sqlalchemy import update
+
+    condiciones = []
+    if moneda:
+        moneda = _moneda_normalizada(moneda)
+        if moneda == 'MXN':
+            condiciones.append(or_(Pago.moneda.is_(None), func.upper(Pago.moneda) == 'MXN'))
+        else:
+            condiciones.append(func.upper(Pago.moneda) == moneda)
+    if desde:
+        condiciones.append(Pago.fecha_pago >= desde)
+
+    tasa = func.coalesce(_expr_tasa_mxn(Pago.moneda, Pago.fecha_pago), _expr_tasa_de_respaldo(Pago.moneda))
+    stmt = update(Pago).values(monto_mxn=func.round(Pago.monto * tasa, 2)).where(*condiciones)
+    resultado = session.execute(stmt.execution_options(synchronize_session=False))
+
+    sin_tasa = session.execute(
+        db.select(func.upper(func.coalesce(Pago.moneda, 'MXN')), func.count())
+        .where(Pago.monto.isnot(None), Pago.monto_mxn.is_(None), *condiciones)
+        .group_by(func.upper(func.coalesce(Pago.moneda, 'MXN')))
+    ).all()
+    for moneda_sin_tasa, n in sin_tasa:
+        logger.warning(f"{n} pagos en {moneda_sin_tasa} sin tipo de cambio: quedan sin monto_mxn")
+    return resultado.rowcount
+
+
+@app.cli.command('backfill-monto-mxn')
+@click.option('--moneda', default=None, help='Solo pagos en esta moneda.')
+@click.option('--desde', default=None, type=click.DateTime(formats=['%Y-%m-%d']), help='Solo pagos con fecha_pago >= YYYY-MM-DD.')
+def backfill_monto_mxn_cmd(moneda, desde):
+    """Recalcula Pago.monto_mxn con la tabla tipo_cambio (y el rollup mensual)."""
+    total = recalcular_montos_mxn(db.session, moneda=moneda, desde=desde.date() if desde else None)
+    db.session.commit()  # El UPDATE masivo refresca el rollup (ver _registrar_tablas_en_bulk)
+    print(f"✅ monto_mxn recalculado en {total} pagos.")
+
+
+@app.cli.command('tipo-cambio')
+@click.argument('moneda')
+@click.argument('tasa', type=Decimal)
+@click.option('--desde', default=None, type=click.DateTime(formats=['%Y-%m-%d']), help='Fecha de vigencia (default: hoy).')
+def tipo_cambio_cmd(moneda, tasa, desde):
+    """Registra (o corrige) la tasa a MXN de MONEDA y recalcula los pagos afectados."""
+    moneda = _moneda_normalizada(moneda)
+    fecha = desde.date() if desde else date.today()
+    registro = TipoCambio.query.filter_by(moneda=moneda, fecha_vigencia=fecha).first()
+    if registro:
+        registro.tasa_mxn = tasa
+    else:
+        db.session.add(TipoCambio(moneda=moneda, fecha_vigencia=fecha, tasa_mxn=tasa))
+    db.session.flush()
+    total = recalcular_montos_mxn(db.session, moneda=moneda, desde=fecha)
+    db.session.commit()
+    print(f"✅ {moneda} = {tasa} MXN desde {fecha}; {total} pagos recalculados.")
+
+
+def obtener_versiones(tablas):
+    """Devuelve {tabla: version} (0 si la tabla aún no registra cambios)."""
+    filas = db.session.query(CambioVersion.tabla, func.sum(CambioVersion.version)).filter(
+        CambioVersion.tabla.in_(list(tablas))
+    ).group_by(CambioVersion.tabla).all()
+    versiones = {t: 0 for t in tablas}
+    versiones.update({t: int(v) for t, v in filas})
+    return versiones
+
+
 # 🛑 3. RESTO DE FUNCIONES Y RUTAS (TERCERO)
 
 # =======================================================
@@ -237,6 +1155,43 @@ class PaquetePrecio(db.Model):
 from functools import wraps
 from flask import abort
 
+def etag_por_versiones(*tablas):
+    """
+    Calcula un ETag a partir de las versiones de las tablas de las que depende la vista
+    (más la URL, el usuario y la fecha del día) y responde 304 Not Modified sin ejecutar
+    la vista si el cliente ya tiene esa versión (If-None-Match).
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            import hashlib
+            from flask import make_response
+
+            versiones = obtener_versiones(tablas)
+            usuario = current_user.get_id() if current_user.is_authenticated else '-'
+            huella = '|'.join([
+                request.endpoint or '',
+                request.full_path,
+                str(usuario),
+                date.today().isoformat(),  # Varias vistas calculan días restantes / vigente
+                ','.join(f"{t}:{versiones[t]}" for t in sorted(versiones)),
+            ])
+            etag = hashlib.sha1(huella.encode('utf-8')).hexdigest()
+
+            if request.if_none_match.contains(etag):
+                resp = make_response('', 304)
+                resp.set_etag(etag)
+                return resp
+
+            resp = make_response(f(*args, **kwargs))
+            if resp.status_code == 200:
+                resp.set_etag(etag)
+                resp.headers['Cache-Control'] = 'private, no-cache'
+            return resp
+        return decorated_function
+    return decorator
+
+
 def role_required(allowed_roles):
     """
     Restringe el acceso a una ruta solo a los roles especificados.
@@ -289,6 +1244,81 @@ def formatear_fecha_jinja(value):
 
 app.jinja_env.filters['formatearFecha'] = formatear_fecha_jinja
 
+
+# ----- Filtros de fecha "sargables" (BETWEEN sobre la columna, usan el índice) -----
+def _anio_valido(anio):
+    return anio if anio and date.min.year <= anio <= date.max.year else None
+
+
+def _mes_valido(mes):
+    return mes if mes and 1 <= mes <= 12 else None
+
+
+def rango_de_fechas(anio=None, mes=None):
+    """(inicio, fin) inclusivo del año o del mes indicado; None si falta el año (o no es válido).
+    Un mes fuera de 1-12 se ignora."""
+    anio, mes = _anio_valido(anio), _mes_valido(mes)
+    if not anio:
+        return None
+    if mes:
+        return date(anio, mes, 1), date(anio, mes, calendar.monthrange(anio, mes)[1])
+    return date(anio, 1, 1), date(anio, 12, 31)
+
+
+def anios_de_columna(columna):
+    """(año mínimo, año máximo) presentes en una columna Date, o None si no hay datos.
+    MIN/MAX se resuelven con el índice de la columna."""
+    minimo, maximo = db.session.query(func.min(columna), func.max(columna)).one()
+    if minimo is None:
+        return None
+    return minimo.year, maximo.year
+
+
+def filtro_de_fechas(columna, anio=None, mes=None, desde=None, hasta=None, anios=None):
+    """
+    Predicado sobre una columna Date a partir de año/mes y/o un rango explícito, sin extract():
+    - anio (+ mes): BETWEEN inicio y fin del año o del mes.
+    - mes sin anio: ese mes en cualquier año -> OR de un BETWEEN por año dentro de
+      `anios` = (min, max); si no se indica, se toma de la propia columna.
+    - desde / hasta: cotas inclusivas adicionales.
+    Un año o mes fuera de rango (p. ej. ?month=13 en la URL) se ignora en vez de dar un 500.
+    Devuelve None si no hay nada que filtrar.
+    """
+    anio, mes = _anio_valido(anio), _mes_valido(mes)
+    condiciones = []
+    rango = rango_de_fechas(anio, mes)
+    if rango:
+        condiciones.append(columna.between(*rango))
+    elif mes:
+        anios = anios or anios_de_columna(columna)
+        if anios is None:
+            condiciones.append(db.false())
+        else:
+            condiciones.append(or_(*[
+                columna.between(*rango_de_fechas(a, mes)) for a in range(anios[0], anios[1] + 1)
+            ]))
+    if desde:
+        condiciones.append(columna >= desde)
+    if hasta:
+        condiciones.append(columna <= hasta)
+    if not condiciones:
+        return None
+    return and_(*condiciones)
+
+
+def anios_con_datos(columna):
+    """Años (desc) con al menos una fila: un EXISTS por año con BETWEEN, en una sola consulta."""
+    from sqlalchemy import select, exists
+
+    anios = anios_de_columna(columna)
+    if anios is None:
+        return []
+    candidatos = list(range(anios[1], anios[0] - 1, -1))
+    fila = db.session.execute(select(*[
+        exists().where(filtro_de_fechas(columna, anio=a)).label(f'a{a}') for a in candidatos
+    ])).one()
+    return [a for a, hay in zip(candidatos, fila) if hay]
+
 def primer_dia_mes(d: date) -> date:
     return d.replace(day=1)
 
@@ -296,6 +1326,14 @@ def ultimo_dia_mes(d: date) -> date:
     last_day = calendar.monthrange(d.year, d.month)[1]
     return d.replace(day=last_day)
 
+MESES_POR_VIGENCIA = {
+    "MENSUAL": 1, 
+    "TRIMESTRAL": 3, 
+    "SEMESTRAL": 6, 
+    "ANUAL": 12
+}
+DIAS_DEMO = 15
+
 # 🛑 FUNCIÓN CRÍTICA DE CÁLCULO DE VIGENCIA (YA INCLUYE DEMO DE 15 DÍAS)
 def calcular_fechas_vigencia(fecha_inicio: date, vigencia: str) -> tuple[date, date]:
     """
@@ -311,18 +1349,12 @@ def calcular_fechas_vigencia(fecha_inicio: date, vigencia: str) -> tuple[date, d
     # --- CASO 1: DEMO (15 Días Naturales) ---
     # Prioridad absoluta: si dice DEMO, son 15 días.
     if "DEMO" in vig:
-        vence_en = fecha_inicio + timedelta(days=15)
+        vence_en = fecha_inicio + timedelta(days=DIAS_DEMO)
         proximo_pago = vence_en + timedelta(days=1)
         return vence_en, proximo_pago
 
     # --- CASO 2: PERIODOS ALINEADOS A FIN DE MES ---
-    meses_map = {
-        "MENSUAL": 1, 
-        "TRIMESTRAL": 3, 
-        "SEMESTRAL": 6, 
-        "ANUAL": 12
-    }
-    duracion = meses_map.get(vig, 1)
+    duracion = MESES_POR_VIGENCIA.get(vig, 1)
 
     # Lógica: Mes Inicio + (Duración - 1) -> Fin de ese mes
     fecha_objetivo = fecha_inicio + relativedelta(months=duracion - 1)
@@ -333,44 +1365,48 @@ def calcular_fechas_vigencia(fecha_inicio: date, vigencia: str) -> tuple[date, d
     
     return vence_en, proximo_pago
 
-# app.py (Junto a las funciones de calendario)
 
-def recalcular_vigencia_cliente(cliente_id):
+def calcular_fechas_vigencia_lote(fechas_inicio, vigencias, hoy=None):
     """
-    Reconstruye la historia del cliente ignorando pagos cancelados.
+    Versión vectorizada de calcular_fechas_vigencia (mismas reglas DEMO y fin de mes).
+    fechas_inicio: array/Series de fechas (datetime64, date o texto ISO; vacías = hoy).
+    vigencias: array/Series de textos (vacías = MENSUAL).
+    Devuelve (vence_en, proximo_pago) como arrays numpy datetime64[D].
+    Verificada contra la función escalar con `python verificar_vigencias.py`.
     """
-    from datetime import date
-    
-    # 1. Identificar la entidad (usamos Suscripcion como fuente de la verdad)
-    suscripcion = Suscripcion.query.filter_by(cliente_id=cliente_id).first()
-    cliente = Cliente.query.get(cliente_id)
+    import numpy as np
 
-    if not suscripcion or not cliente:
-        return False
+    fechas = pd.to_datetime(pd.Series(fechas_inicio, dtype=object), errors='coerce')
+    fechas = fechas.fillna(pd.Timestamp(hoy or date.today())).to_numpy().astype('datetime64[D]')
+    vig = pd.Series(vigencias, dtype=object).fillna('').astype(str).str.upper().str.strip()
 
-    # 2. Obtener pagos activos ordenados
-    all_pagos = Pago.query.filter_by(cliente_id=cliente_id).order_by(Pago.fecha_pago.asc()).all()
-    pagos_activos = [p for p in all_pagos if (getattr(p, 'status', '') or '').upper() != 'CANCELADO']
+    # CASO 2: Mes Inicio + (Duración - 1) -> Fin de ese mes (= día anterior al inicio del mes siguiente)
+    duracion = vig.map(MESES_POR_VIGENCIA).fillna(1).to_numpy().astype('int64')
+    mes_objetivo = fechas.astype('datetime64[M]') + (duracion - 1)
+    vence_en = (mes_objetivo + 1).astype('datetime64[D]') - np.timedelta64(1, 'D')
 
-    # 3. Variables para el recálculo
-    acumulado_vence_en = None
-    acumulado_proximo_pago = None
-    
+    # CASO 1: DEMO (15 días naturales), prioridad absoluta
+    es_demo = vig.str.contains('DEMO', regex=False).to_numpy()
+    vence_en = np.where(es_demo, fechas + np.timedelta64(DIAS_DEMO, 'D'), vence_en)
+
+    return vence_en, vence_en + np.timedelta64(1, 'D')
+
+# app.py (Junto a las funciones de calendario)
+
+def reproducir_vigencia(pagos, estado=None, periodos=None):
+    """
+    Reproduce la historia de pagos ACTIVOS (iterable de (fecha_pago, vigencia, paquete)
+    en orden cronológico) y devuelve (vence_en, proximo_pago, ultimo_paquete, ultima_vigencia).
+    Función pura: la usan recalcular_vigencia_cliente y el recálculo masivo.
+
+    estado: (vence_en, proximo_pago) acumulados ANTES del primer pago (recálculo incremental).
+    periodos: lista opcional donde se agrega (periodo_inicio, periodo_fin) de cada pago.
+    """
+    acumulado_vence_en, acumulado_proximo_pago = estado or (None, None)
     ultimo_paquete = None
     ultima_vigencia = None
-    
-    if not pagos_activos:
-        # Reset total si no hay pagos activos
-        suscripcion.vence_en = None
-        suscripcion.proximo_pago = None
-        suscripcion.status = 'En prueba'
-        cliente.fecha_pago = None
-        db.session.commit()
-        return True
 
-    for pago in pagos_activos:
-        fecha_pago_actual = pago.fecha_pago
-        
+    for fecha_pago_actual, vigencia, paquete in pagos:
         # Determinar inicio del periodo (Regla de negocio: continuidad vs hueco)
         if acumulado_vence_en is None:
             fecha_inicio_calculo = fecha_pago_actual
@@ -380,37 +1416,476 @@ def recalcular_vigencia_cliente(cliente_id):
             else:
                 fecha_inicio_calculo = acumulado_vence_en
         
-        # 4. Calculamos y asignamos AMBOS valores
-        if pago.vigencia:
-            nuevo_vence, nuevo_proximo = calcular_fechas_vigencia(fecha_inicio_calculo, pago.vigencia)
+        # Calculamos y asignamos AMBOS valores
+        if vigencia:
+            nuevo_vence, nuevo_proximo = calcular_fechas_vigencia(fecha_inicio_calculo, vigencia)
         else:
             # Fallback si el pago no tiene vigencia (debería tenerla)
             nuevo_vence, nuevo_proximo = acumulado_vence_en or fecha_pago_actual, acumulado_proximo_pago or fecha_pago_actual
             
         acumulado_vence_en = nuevo_vence
         acumulado_proximo_pago = nuevo_proximo
+        if periodos is not None:
+            periodos.append((fecha_inicio_calculo, nuevo_vence))
         
         # Datos informativos del último pago
-        ultimo_paquete = pago.paquete
-        ultima_vigencia = pago.vigencia
+        ultimo_paquete = paquete
+        ultima_vigencia = vigencia
+
+    return acumulado_vence_en, acumulado_proximo_pago, ultimo_paquete, ultima_vigencia
+
+
+# ----- Periodos guardados por pago (Pago.periodo_inicio / periodo_fin) -----
+
+def _es_pago_activo(pago):
+    return (getattr(pago, 'status', '') or '').upper() != 'CANCELADO'
+
+
+def _registrar_periodos_invalidados(session, modificados):
+    """
+    Anota {cliente_id: fecha} desde la que hay que recalcular los periodos guardados:
+    altas/bajas de pagos o cambios de fecha, vigencia, status o cliente. Se recalculan al
+    confirmar (_versionar_antes_de_commit), salvo que recalcular_vigencia_cliente ya lo haya hecho.
+    """
+    from sqlalchemy import inspect as sa_inspect
+
+    for obj in modificados:
+        if not isinstance(obj, Pago):
+            continue
+        estado = sa_inspect(obj).attrs
+        if not (obj in session.new or obj in session.deleted
+                or any(getattr(estado, a).history.has_changes()
+                       for a in ('fecha_pago', 'vigencia', 'status', 'cliente_id'))):
+            continue
+        fechas = [f for f in (obj.fecha_pago, *estado.fecha_pago.history.deleted) if f]
+        for cliente_id in _cliente_ids_afectados(obj) - {None}:
+            # Sin fecha de pago se reproduce la historia completa del cliente
+            _anotar_periodo_pendiente(session, cliente_id, min(fechas) if fechas else None)
+
+
+def _anotar_periodo_pendiente(session, cliente_id, fecha):
+    """Une la marca {cliente_id: fecha} con la que ya hubiera (la menor; None = toda la historia)."""
+    pendientes = session.info.setdefault('periodos_pendientes', {})
+    if cliente_id in pendientes:
+        actual = pendientes[cliente_id]
+        fecha = None if actual is None or fecha is None else min(actual, fecha)
+    pendientes[cliente_id] = fecha
+
+
+def refrescar_suscripcion_periodo(session, cliente_id=None, desde=None):
+    """
+    Sincroniza el ledger suscripcion_periodo con los periodos guardados en Pago.
+    Sin cliente_id: reconstrucción completa. Con cliente_id: sus pagos desde `desde` más las
+    filas de pagos que ya no son suyos (borrados o movidos a otro cliente).
+    """
+    from sqlalchemy import select, exists
+
+    sp = SuscripcionPeriodo.__table__
+    p = Pago.__table__
+    origen = select(p.c.id, p.c.cliente_id, p.c.periodo_inicio, p.c.periodo_fin).where(
+        p.c.periodo_fin.isnot(None), p.c.cliente_id.isnot(None)
+    )
+    if cliente_id is None:
+        session.execute(sp.delete())
+    else:
+        origen = origen.where(p.c.cliente_id == cliente_id)
+        if desde:
+            origen = origen.where(p.c.fecha_pago >= desde)
+        pagos_del_tramo = select(p.c.id).where(p.c.cliente_id == cliente_id)
+        if desde:
+            pagos_del_tramo = pagos_del_tramo.where(p.c.fecha_pago >= desde)
+        sigue_siendo_suyo = exists().where(p.c.id == sp.c.pago_id, p.c.cliente_id == cliente_id)
+        session.execute(sp.delete().where(or_(
+            sp.c.pago_id.in_(pagos_del_tramo),
+            and_(sp.c.cliente_id == cliente_id, ~sigue_siendo_suyo),
+        )))
+    session.execute(sp.insert().from_select(['pago_id', 'cliente_id', 'periodo_inicio', 'periodo_fin'], origen))
+    _marcar_tablas_modificadas(session, {'pago'})
+
+
+def _guardar_periodos(session, cambios):
+    """UPDATE por PK de [(pago_id, periodo_inicio, periodo_fin), ...] sin pasar por el flush del ORM."""
+    from sqlalchemy import bindparam
+
+    if not cambios:
+        return
+    tabla = Pago.__table__
+    stmt = tabla.update().where(tabla.c.id == bindparam('b_id')).values(
+        periodo_inicio=bindparam('b_inicio'), periodo_fin=bindparam('b_fin')
+    )
+    for i in range(0, len(cambios), VIGENCIAS_LOTE):
+        session.execute(stmt, [
+            {'b_id': pago_id, 'b_inicio': inicio, 'b_fin': fin}
+            for pago_id, inicio, fin in cambios[i:i + VIGENCIAS_LOTE]
+        ])
+    _marcar_tablas_modificadas(session, {'pago'})
+
+
+def _estado_antes_de(session, cliente_id, desde):
+    """
+    Estado acumulado (vence_en, proximo_pago, paquete, vigencia) tras el último pago ACTIVO
+    anterior a `desde`, leído de su periodo guardado. None si no hay pagos previos;
+    False si ese periodo no está guardado (hay que reproducir toda la historia).
+    """
+    activo = func.upper(Pago.status) != 'CANCELADO'
+    previo = session.execute(
+        db.select(Pago.periodo_fin, Pago.vigencia, Pago.paquete)
+        .where(Pago.cliente_id == cliente_id, Pago.fecha_pago < desde, activo)
+        .order_by(Pago.fecha_pago.desc(), Pago.id.desc()).limit(1)
+    ).first()
+    if previo is None:
+        return None
+    if previo.periodo_fin is None:
+        return False
+
+    # proximo_pago = vence_en + 1 salvo que ningún pago previo tuviera vigencia (fallback del primer pago)
+    con_vigencia = bool(previo.vigencia) or session.execute(
+        db.select(Pago.id).where(
+            Pago.cliente_id == cliente_id, Pago.fecha_pago < desde, activo,
+            Pago.vigencia.isnot(None), Pago.vigencia != ''
+        ).limit(1)
+    ).first() is not None
+    proximo = previo.periodo_fin + timedelta(days=1) if con_vigencia else previo.periodo_fin
+    return previo.periodo_fin, proximo, previo.paquete, previo.vigencia
+
+
+def recalcular_vigencia_cliente(cliente_id, desde=None):
+    """
+    Reconstruye la historia del cliente ignorando pagos cancelados.
+
+    desde: fecha del pago editado (la menor si cambió de fecha). Solo se reproducen los pagos
+    desde esa fecha, partiendo del periodo guardado del pago anterior. Si ese periodo no está
+    guardado se reproduce la historia completa.
+
+    NO hace commit: corre dentro de un SAVEPOINT (si falla, solo se deshacen sus cambios y la
+    excepción sube) y deja todo en la transacción del llamador, que confirma una sola vez.
+    """
+    with db.session.begin_nested():
+        return _recalcular_vigencia_cliente(cliente_id, desde)
+
+
+def recalcular_periodos_cliente(session, cliente_id, desde=None):
+    """
+    Reproduce los pagos del cliente desde `desde` (partiendo del periodo guardado del pago
+    anterior; si no está guardado, toda la historia), guarda Pago.periodo_inicio / periodo_fin
+    de los que cambiaron y sincroniza ese tramo del ledger suscripcion_periodo.
+
+    No toca Suscripcion: devuelve (vence_en, proximo_pago, paquete, vigencia), o None si el
+    cliente no tiene pagos activos. Lo usan recalcular_vigencia_cliente y el commit de
+    cualquier transacción que haya cambiado pagos.
+    """
+    # 1. Punto de partida: periodo guardado del pago anterior a `desde` (o el inicio de la historia)
+    previo = _estado_antes_de(session, cliente_id, desde) if desde else None
+    if previo is False:
+        desde, previo = None, None
+
+    # 2. Pagos (desde la fecha editada) ordenados; columnas del ORM para que haga autoflush
+    consulta = db.select(
+        Pago.id, Pago.fecha_pago, Pago.vigencia, Pago.paquete, Pago.status,
+        Pago.periodo_inicio, Pago.periodo_fin
+    ).where(Pago.cliente_id == cliente_id)
+    if desde:
+        consulta = consulta.where(Pago.fecha_pago >= desde)
+    all_pagos = session.execute(consulta.order_by(Pago.fecha_pago.asc(), Pago.id.asc())).all()
+    pagos_activos = [p for p in all_pagos if _es_pago_activo(p)]
+
+    # 3. Reproducir los periodos pago por pago
+    periodos = []
+    resultado = None
+    if pagos_activos or previo:
+        resultado = reproducir_vigencia(
+            ((p.fecha_pago, p.vigencia, p.paquete) for p in pagos_activos),
+            estado=previo[:2] if previo else None, periodos=periodos
+        )
+        if not pagos_activos:
+            resultado = (*resultado[:2], previo[2], previo[3])
+
+    # 4. Guardar los que cambiaron (NULL para cancelados) y su tramo del ledger
+    nuevos = {p.id: periodo for p, periodo in zip(pagos_activos, periodos)}
+    cambios = []
+    for p in all_pagos:
+        inicio, fin = nuevos.get(p.id, (None, None))
+        if (p.periodo_inicio, p.periodo_fin) != (inicio, fin):
+            cambios.append((p.id, inicio, fin))
+    _guardar_periodos(session, cambios)
+    refrescar_suscripcion_periodo(session, cliente_id, desde)
+    _descartar_periodos_pendientes(session, cliente_id, desde)
+    return resultado
+
+
+def _recalcular_vigencia_cliente(cliente_id, desde):
+    from datetime import date
+    
+    # 1. Identificar la entidad (usamos Suscripcion como fuente de la verdad)
+    suscripcion = Suscripcion.query.filter_by(cliente_id=cliente_id).first()
+    cliente = Cliente.query.get(cliente_id)
 
-    # 5. Asignar resultados a la entidad Suscripcion
+    if not suscripcion or not cliente:
+        return False
+
+    # 2. Periodos de cada pago (y ledger) desde la fecha editada
+    resultado = recalcular_periodos_cliente(db.session, cliente_id, desde)
+
+    # 3. Sin pagos activos
+    if resultado is None:
+        # Reset total si no hay pagos activos
+        suscripcion.vence_en = None
+        suscripcion.proximo_pago = None
+        suscripcion.status = 'En prueba'
+        cliente.fecha_pago = None
+        return True
+
+    acumulado_vence_en, acumulado_proximo_pago, ultimo_paquete, ultima_vigencia = resultado
+
+    # 4. Asignar resultados a la entidad Suscripcion
     suscripcion.vence_en = acumulado_vence_en
     suscripcion.proximo_pago = acumulado_proximo_pago 
     
     if ultimo_paquete: suscripcion.paquete = ultimo_paquete
     if ultima_vigencia: suscripcion.vigencia = ultima_vigencia
     
-    # 6. Status
+    # 5. Status
     hoy = date.today()
     if acumulado_vence_en and acumulado_vence_en >= hoy:
         suscripcion.status = 'Activo'
     else:
         suscripcion.status = 'Suspendido'
 
-    db.session.commit()
     return True
 
+
+def _descartar_periodos_pendientes(session, cliente_id, desde):
+    """El recálculo ya cubrió el tramo marcado en el flush: no hay que repetirlo al confirmar."""
+    pendientes = session.info.get('periodos_pendientes')
+    if pendientes and cliente_id in pendientes and (
+            desde is None or (pendientes[cliente_id] is not None and desde <= pendientes[cliente_id])):
+        del pendientes[cliente_id]
+
+
+# ----- Recálculo masivo de vigencias (flask recalcular-vigencias) -----
+VIGENCIAS_LOTE = 1000  # Clientes por tarea del pool y filas por UPDATE
+
+
+def _reproducir_lote_vigencias(lote):
+    """
+    [(cliente_id, [(pago_id, fecha_pago, vigencia, paquete, periodo_inicio, periodo_fin), ...]), ...]
+    -> {cliente_id: (resultado, [(pago_id, periodo_inicio, periodo_fin) que cambiaron])}. Corre en el pool.
+    """
+    resultados = {}
+    for cliente_id, pagos in lote:
+        periodos = []
+        resultado = reproducir_vigencia(((p[1], p[2], p[3]) for p in pagos), periodos=periodos)
+        cambios = [(p[0], *periodo) for p, periodo in zip(pagos, periodos) if (p[4], p[5]) != periodo]
+        resultados[cliente_id] = (resultado, cambios)
+    return resultados
+
+
+def _lotes_de_pagos_por_cliente(tamano):
+    """Un solo SELECT ordenado (en streaming) de pagos no cancelados, agrupado por cliente en lotes."""
+    from itertools import groupby
+    from operator import itemgetter
+
+    stmt = db.select(
+        Pago.cliente_id, Pago.id, Pago.fecha_pago, Pago.vigencia, Pago.paquete, Pago.periodo_inicio, Pago.periodo_fin
+    ).where(
+        Pago.cliente_id.isnot(None),
+        func.upper(Pago.status) != 'CANCELADO'
+    ).order_by(Pago.cliente_id, Pago.fecha_pago, Pago.id).execution_options(yield_per=VIGENCIAS_LOTE)
+
+    lote = []
+    for cliente_id, filas in groupby(db.session.execute(stmt), key=itemgetter(0)):
+        lote.append((cliente_id, [tuple(f[1:]) for f in filas]))
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+@app.cli.command('recalcular-vigencias')
+@click.option('--dry-run', is_flag=True, help='Solo muestra las diferencias, no escribe.')
+@click.option('--workers', default=4, show_default=True, help='Procesos del pool (0 = en este proceso).')
+@click.option('--incluir-eliminados', is_flag=True, help='Recalcular también suscripciones con status Eliminado.')
+@click.option('--reporte', default=None, type=click.Path(dir_okay=False), help='CSV con todas las diferencias.')
+def recalcular_vigencias_cmd(dry_run, workers, incluir_eliminados, reporte):
+    """
+    Recalcula vence_en / proximo_pago / paquete / vigencia / status de todas las suscripciones
+    con las reglas actuales de calcular_fechas_vigencia (mismo resultado que recalcular_vigencia_cliente),
+    y guarda el periodo de cada pago (Pago.periodo_inicio / periodo_fin y el ledger suscripcion_periodo).
+    """
+    import time
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    from sqlalchemy import update
+
+    t0 = time.perf_counter()
+    hoy = date.today()
+
+    # 1. Reproducir periodos: un stream de pagos, lotes de clientes repartidos en el pool
+    resultados, cambios_periodos = {}, []
+
+    def acumular(parcial):
+        for cliente_id, (resultado, cambios) in parcial.items():
+            resultados[cliente_id] = resultado
+            cambios_periodos.extend(cambios)
+
+    if workers > 0:
+        # Ventana acotada (workers * 2 lotes en vuelo): pool.map consumiría todo el stream
+        # de pagos de golpe y lo tendría en memoria mientras el pool avanza
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            en_vuelo = set()
+            for lote in _lotes_de_pagos_por_cliente(VIGENCIAS_LOTE):
+                if len(en_vuelo) >= workers * 2:
+                    listos, en_vuelo = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                    for futuro in listos:
+                        acumular(futuro.result())
+                en_vuelo.add(pool.submit(_reproducir_lote_vigencias, lote))
+            for futuro in en_vuelo:
+                acumular(futuro.result())
+    else:
+        for lote in _lotes_de_pagos_por_cliente(VIGENCIAS_LOTE):
+            acumular(_reproducir_lote_vigencias(lote))
+
+    # Los pagos cancelados no cubren periodo
+    cancelados = db.select(Pago.id).where(
+        func.upper(Pago.status) == 'CANCELADO', Pago.periodo_fin.isnot(None)
+    )
+    cambios_periodos.extend((pago_id, None, None) for pago_id in db.session.scalars(cancelados))
+
+    # 2. Comparar con lo guardado (la primera suscripción de cada cliente, como recalcular_vigencia_cliente)
+    actuales = db.session.execute(
+        db.select(
+            Suscripcion.id, Suscripcion.cliente_id, Suscripcion.vence_en, Suscripcion.proximo_pago,
+            Suscripcion.paquete, Suscripcion.vigencia, Suscripcion.status, Cliente.fecha_pago
+        ).join(Cliente, Cliente.id == Suscripcion.cliente_id).order_by(Suscripcion.cliente_id, Suscripcion.id)
+    ).all()
+
+    cambios_sus, cambios_cli, diferencias = [], [], []
+    vistos = set()
+    for s in actuales:
+        if s.cliente_id in vistos:
+            continue
+        vistos.add(s.cliente_id)
+        if s.status == 'Eliminado' and not incluir_eliminados:
+            continue
+
+        nuevo = {'vence_en': s.vence_en, 'proximo_pago': s.proximo_pago,
+                 'paquete': s.paquete, 'vigencia': s.vigencia, 'status': s.status}
+        if s.cliente_id in resultados:
+            vence, proximo, paquete, vigencia = resultados[s.cliente_id]
+            nuevo.update(vence_en=vence, proximo_pago=proximo,
+                         status='Activo' if vence and vence >= hoy else 'Suspendido')
+            if paquete: nuevo['paquete'] = paquete
+            if vigencia: nuevo['vigencia'] = vigencia
+        else:
+            # Sin pagos activos: reset total
+            nuevo.update(vence_en=None, proximo_pago=None, status='En prueba')
+            if s.fecha_pago is not None:
+                cambios_cli.append({'id': s.cliente_id, 'fecha_pago': None})
+                diferencias.append((s.cliente_id, s.id, 'cliente.fecha_pago', s.fecha_pago, None))
+
+        campos = {k: v for k, v in nuevo.items() if getattr(s, k) != v}
+        if campos:
+            cambios_sus.append({'id': s.id, **campos})
+            diferencias.extend((s.cliente_id, s.id, k, getattr(s, k), v) for k, v in campos.items())
+
+    # 3. Reporte
+    por_campo = {}
+    for d in diferencias:
+        por_campo[d[2]] = por_campo.get(d[2], 0) + 1
+    print(f"Clientes con pagos: {len(resultados)} | Suscripciones revisadas: {len(vistos)} | "
+          f"Con cambios: {len(cambios_sus)} ({time.perf_counter() - t0:.1f}s)")
+    for campo, n in sorted(por_campo.items()):
+        print(f"  {campo}: {n}")
+    print(f"Pagos con periodo distinto al guardado: {len(cambios_periodos)}")
+    for cliente_id, sus_id, campo, antes, despues in diferencias[:20]:
+        print(f"  cliente {cliente_id} / suscripción {sus_id}: {campo} {antes} -> {despues}")
+    if len(diferencias) > 20:
+        print(f"  ... y {len(diferencias) - 20} diferencias más")
+    if reporte:
+        pd.DataFrame(diferencias, columns=['cliente_id', 'suscripcion_id', 'campo', 'antes', 'despues']).to_csv(reporte, index=False)
+        print(f"Reporte: {reporte}")
+
+    if dry_run:
+        print("🔹 Dry-run: no se escribió nada.")
+        return
+
+    # 4. UPDATE masivos por lotes (por PK), todo en una transacción
+    for i in range(0, len(cambios_sus), VIGENCIAS_LOTE):
+        db.session.execute(update(Suscripcion), cambios_sus[i:i + VIGENCIAS_LOTE])
+    for i in range(0, len(cambios_cli), VIGENCIAS_LOTE):
+        db.session.execute(update(Cliente), cambios_cli[i:i + VIGENCIAS_LOTE])
+    _guardar_periodos(db.session, cambios_periodos)
+    refrescar_suscripcion_periodo(db.session)
+    db.session.commit()
+    print(f"✅ {len(cambios_sus)} suscripciones actualizadas ({time.perf_counter() - t0:.1f}s).")
+
+
+# ----- Barrido nocturno de status (flask sweep-status) -----
+
+def _reglas_sweep_status(hoy):
+    """(nombre, status_actual, condición) de cada transición a 'Suspendido'."""
+    s = Suscripcion.__table__.c
+    es_demo = or_(s.paquete.ilike('%demo%'), s.vigencia.ilike('%demo%'))
+    # Demo sin vence_en: 15 días naturales desde fecha_inicio (mismo criterio que calcular_fechas_vigencia)
+    demo_expirada = and_(es_demo, or_(
+        s.vence_en < hoy,
+        and_(s.vence_en.is_(None), s.fecha_inicio < hoy - timedelta(days=DIAS_DEMO)),
+    ))
+    return [
+        ('Activo vencido', 'Activo', s.vence_en < hoy),
+        ('Demo activa expirada', 'Activo', and_(s.vence_en.is_(None), demo_expirada)),
+        ('Demo en prueba expirada', 'En prueba', demo_expirada),
+    ]
+
+
+@app.cli.command('sweep-status')
+@click.option('--dry-run', is_flag=True, help='Solo muestra qué cambiaría, no escribe.')
+@click.option('--fecha', default=None, type=click.DateTime(formats=['%Y-%m-%d']), help='Fecha de corte YYYY-MM-DD (default: hoy).')
+@click.option('--reporte', default=None, type=click.Path(dir_okay=False), help='CSV con las suscripciones cambiadas.')
+def sweep_status_cmd(dry_run, fecha, reporte):
+    """
+    Pasa a 'Suspendido' las suscripciones vencidas (vence_en < hoy) y las demos de 15 días
+    expiradas, con un UPDATE por regla, y muestra el resumen de cambios. Para cron (diario,
+    antes de `flask kpi-snapshot`).
+    """
+    hoy = fecha.date() if fecha else date.today()
+    tabla = Suscripcion.__table__
+    columnas = (tabla.c.id, tabla.c.cliente_id, tabla.c.server, tabla.c.paquete, tabla.c.vence_en)
+
+    cambios = []
+    for nombre, status_actual, condicion in _reglas_sweep_status(hoy):
+        condicion = and_(tabla.c.status == status_actual, condicion)
+        if dry_run:
+            filas = db.session.execute(db.select(*columnas).where(condicion)).all()
+        else:
+            filas = db.session.execute(
+                tabla.update().where(condicion).values(status='Suspendido').returning(*columnas)
+            ).all()
+        cambios.extend((nombre, status_actual, *f) for f in filas)
+
+    # Resumen por regla y servidor
+    df = pd.DataFrame(cambios, columns=['regla', 'status_anterior', 'suscripcion_id', 'cliente_id', 'server', 'paquete', 'vence_en'])
+    print(f"Corte: {hoy} | Suscripciones a 'Suspendido': {len(df)}")
+    if not df.empty:
+        resumen = df.fillna({'server': 'N/A'}).groupby(['regla', 'server']).size()
+        for (regla, server), n in resumen.items():
+            print(f"  {regla} / {server}: {n}")
+    if reporte:
+        df.to_csv(reporte, index=False)
+        print(f"Reporte: {reporte}")
+
+    if dry_run:
+        print("🔹 Dry-run: no se escribió nada.")
+        return
+
+    # UPDATE por Core: se avisa a mano al resumen de clientes y a las versiones de ETag
+    if cambios:
+        db.session.info.setdefault('clientes_resumen_pendientes', set()).update(int(c) for c in df['cliente_id'].dropna())
+        _marcar_tablas_modificadas(db.session, {'suscripcion'})
+    db.session.commit()
+    print(f"✅ {len(cambios)} suscripciones actualizadas.")
+
+
 def calcular_status_pago(proximo_pago: date, today: date) -> dict:
     """
     Indica si la suscripción está VIGENTE, VENCIDA o SIN PAGO.
@@ -537,6 +2012,7 @@ def paquetes_precios_list():
 # app.py (Reemplaza la función api_paquetes_precios_dt)
 @app.route('/api/paquetes_precios_dt')
 @login_required
+@etag_por_versiones('paquete_precio')
 def api_paquetes_precios_dt():
     """Devuelve SOLO el registro de PaquetePrecio VIGENTE (más reciente) para cada combinación, excluyendo DEMO."""
     from sqlalchemy import func, distinct, case, desc, and_
@@ -708,6 +2184,7 @@ def api_paquetes_precios_nuevo():
 
 @app.route('/api/paquetes_precios/<int:id>')
 @login_required
+@etag_por_versiones('paquete_precio')
 def api_paquetes_precios_get(id):
     """Obtiene un registro por ID para edición."""
     registro = PaquetePrecio.query.get_or_404(id)
@@ -989,74 +2466,21 @@ def api_usuario_eliminar(id):
 @login_required
 @role_required(ROLES_LECTURA)
 def clientes_list():
-    from sqlalchemy import select, outerjoin
+    from sqlalchemy import select
     from datetime import date
 
-    stmt = (
-        select(
-            Cliente.id,
-            Cliente.negocio,
-            Cliente.nombre_contacto,
-            Cliente.mail,
-            Cliente.telefono,
-            Cliente.telefono_secundario_1,
-            Cliente.telefono_secundario_2,
-            Cliente.telefono_secundario_3,
-            Cliente.pais,
-            Suscripcion.id_gumi,
-            Suscripcion.status,
-            Suscripcion.server,
-            Suscripcion.paquete,
-            Suscripcion.vigencia,
-            Suscripcion.vence_en,
-            Suscripcion.proximo_pago,
-            Suscripcion.observaciones,
-            Cliente.fecha_pago.label("ultimo_pago") # ✅ toma directamente del cliente_form
-        )
-        .outerjoin(Suscripcion, Suscripcion.cliente_id == Cliente.id)
-        .order_by(Cliente.negocio.asc())
-    )
-
-    results = db.session.execute(stmt).all()
-    today = date.today()
-
-    clientes = []
-    for r in results:
-        (
-            cid, negocio, nombre_contacto, mail, tel, tel1, tel2, tel3,
-            pais, id_gumi, status_sus, server, paquete, vigencia,
-            vence_en, proximo_pago, observaciones, ultimo_pago
-        ) = r
-
-        dias_restantes = (vence_en - today).days if vence_en else None
-        status = status_sus or "Activo"
-
-        clientes.append({
-            "id": cid,
-            "negocio": negocio,
-            "nombre_contacto": nombre_contacto,
-            "mail": mail,
-            "telefono": tel,
-            "tel_sec_1": tel1,
-            "tel_sec_2": tel2,
-            "tel_sec_3": tel3,
-            "pais": pais,
-            "status": status,
-            "id_gumi": id_gumi,
-            "server": server,
-            "paquete": paquete,
-            "vigencia": vigencia,
-            "vence_en": vence_en,
-            "proximo_pago": proximo_pago,
-            "dias_restantes": dias_restantes,
-            "observaciones": observaciones,
-            "ultimo_pago": ultimo_pago
-        })
+    # La tabla se llena por páginas desde /api/clientes_dt (serverSide);
+    # aquí solo van las opciones completas de los filtros por columna.
+    opciones_filtro = {}
+    for nombre, col in _COLUMNAS_FILTRO_CLIENTES.items():
+        opciones_filtro[nombre] = db.session.execute(
+            select(col).where(col.isnot(None), col != '').distinct().order_by(col)
+        ).scalars().all()
 
     return render_template(
         'clientes_list.html',
-        clientes=clientes,
-        current_date=today
+        opciones_filtro=opciones_filtro,
+        current_date=date.today()
     )
 
 # app.py
@@ -1086,6 +2510,7 @@ def clientes_demo_list():
 
 @app.route('/api/clientes_demo_dt')
 @login_required
+@etag_por_versiones('cliente', 'suscripcion')
 def api_clientes_demo_dt():
     from datetime import date
     from sqlalchemy import select, outerjoin, or_, and_
@@ -1093,39 +2518,34 @@ def api_clientes_demo_dt():
     today = date.today()
 
     # 1. Consulta
+    # es_demo = paquete '%Demo%' o lead sin suscripción 'En prueba' (precalculado en cliente_resumen)
     stmt = (
         select(
-            Cliente.id,
-            Cliente.negocio,
-            Cliente.nombre_contacto,
-            Cliente.mail,
-            Cliente.pais,
-            Cliente.status_cliente,
-            Cliente.telefono,
-            Cliente.telefono_secundario_1,
-            Cliente.telefono_secundario_2,
-            Cliente.telefono_secundario_3,
-            Suscripcion.id_gumi,
-            Suscripcion.server,
-            Suscripcion.paquete,
-            Suscripcion.status,
-            Suscripcion.vence_en
+            ClienteResumen.cliente_id.label('id'),
+            ClienteResumen.negocio,
+            ClienteResumen.nombre_contacto,
+            ClienteResumen.mail,
+            ClienteResumen.pais,
+            ClienteResumen.status_cliente,
+            ClienteResumen.telefono,
+            ClienteResumen.telefono_secundario_1,
+            ClienteResumen.telefono_secundario_2,
+            ClienteResumen.telefono_secundario_3,
+            ClienteResumen.id_gumi,
+            ClienteResumen.server,
+            ClienteResumen.paquete,
+            ClienteResumen.status,
+            ClienteResumen.vence_en
         )
-        .select_from(outerjoin(Cliente, Suscripcion, Cliente.id == Suscripcion.cliente_id))
-        .where(
-            or_(
-                Suscripcion.paquete.ilike('%Demo%'),
-                and_(
-                    Suscripcion.id.is_(None),
-                    Cliente.status_cliente.ilike('%En prueba%')
-                )
-            )
-        )
-        .order_by(Cliente.negocio.asc())
+        .where(ClienteResumen.es_demo.is_(True))
+        .order_by(ClienteResumen.negocio.asc())
     )
     
     try:
         results = db.session.execute(stmt).all()
+
+        if _formato_columnar():
+            return _respuesta_columnar(stmt.selected_columns.keys(), results)
         
         # 2. Diccionario para meses en español
         meses_abbr = {
@@ -1272,10 +2692,8 @@ def clientes_nuevo():
                 monto = float(request.form.get('precio_paquete') or 0)
                 fecha_pago = date.fromisoformat(request.form.get('fecha_pago') or date.today().isoformat())
                 
-                # 🛑 FIX CRÍTICO: Generar bank_transaction_id para pagos manuales
-                from time import time
-                timestamp_ms = int(time() * 1000) 
-                manual_unique_id_fallback = -1 * timestamp_ms
+                # 🛑 FIX CRÍTICO: bank_transaction_id negativo de la secuencia de pagos manuales
+                manual_unique_id_fallback = siguiente_id_manual()
 
                 pago = Pago(
                     cliente_id=cliente.id,
@@ -1398,10 +2816,8 @@ def clientes_editar(id):
                 fecha_pago_raw = request.form.get('fecha_pago') or date.today().isoformat()
                 fecha_pago = date.fromisoformat(fecha_pago_raw)
 
-                # 🛑 FIX CRÍTICO: Generar bank_transaction_id para pagos manuales
-                from time import time
-                timestamp_ms = int(time() * 1000) 
-                manual_unique_id_fallback = -1 * timestamp_ms
+                # 🛑 FIX CRÍTICO: bank_transaction_id negativo de la secuencia de pagos manuales
+                manual_unique_id_fallback = siguiente_id_manual()
 
                 nuevo_pago = Pago(
                     cliente_id=cliente.id,
@@ -1486,9 +2902,29 @@ def clientes_importar():
                     missing_cols = [col for col in REQUIRED_COLS_MIN if col not in df.columns]
                     raise ValueError(f"Faltan columnas requeridas en el CSV: {', '.join(missing_cols)}")
 
-                db.session.begin_nested() 
-                
+                # Vencimientos de todas las filas en una sola operación vectorizada
+                # (las filas con fecha inválida se validan y reportan dentro del ciclo)
+                fechas_inicio = pd.to_datetime(
+                    df['FECHA_INICIO_SUSCRIPCION'].astype(str).str.strip(), format='%Y-%m-%d', errors='coerce'
+                )
+                vences_lote, proximos_lote = calcular_fechas_vigencia_lote(
+                    fechas_inicio, df['VIGENCIA'].astype(str).str.strip()
+                )
+                vencimientos = {
+                    index: (fecha.date(), vence, proximo)
+                    for index, fecha, vence, proximo in zip(
+                        df.index, fechas_inicio, vences_lote.astype(object), proximos_lote.astype(object)
+                    )
+                    if not pd.isna(fecha)
+                }
+
+                # IDs manuales para los pagos de las filas ACTIVO, reservados en un solo bloque
+                filas_activas = int((df['STATUS'].astype(str).str.strip().str.upper() == 'ACTIVO').sum())
+                ids_manuales = iter(reservar_ids_manuales(filas_activas))
+
                 for index, row in df.iterrows():
+                    # SAVEPOINT por fila: un error solo deshace esa fila (no el bloque de IDs ni las demás)
+                    savepoint_fila = db.session.begin_nested()
                     try:
                         # --- 1. PROCESAMIENTO DE DATOS CRÍTICOS ---
                         paquete = str(row['PAQUETE']).strip()
@@ -1572,7 +3008,11 @@ def clientes_importar():
                         db.session.flush()
 
                         # --- 5. CREAR SUSCRIPCIÓN ---
-                        vence_en, proximo_pago = calcular_fechas_vigencia(fecha_inicio_sus, vigencia)
+                        calculado = vencimientos.get(index)
+                        if calculado and calculado[0] == fecha_inicio_sus:
+                            vence_en, proximo_pago = calculado[1:]
+                        else:
+                            vence_en, proximo_pago = calcular_fechas_vigencia(fecha_inicio_sus, vigencia)
 
                         suscripcion = Suscripcion(
                             cliente_id=cliente.id,
@@ -1589,10 +3029,8 @@ def clientes_importar():
                         
                         # --- 6. CREAR REGISTRO DE PAGO (Si es Activo) ---
                         if status == 'ACTIVO':
-                              # 🛑 FIX: Generar bank_transaction_id para pagos manuales de carga masiva
-                              from time import time
-                              timestamp_ms = int(time() * 1000) 
-                              manual_unique_id_fallback = -1 * (timestamp_ms + index) # Asegura unicidad
+                              # 🛑 FIX: bank_transaction_id del bloque reservado para la carga masiva
+                              manual_unique_id_fallback = next(ids_manuales)
 
                               pago = Pago(
                                   cliente_id=cliente.id,
@@ -1610,13 +3048,13 @@ def clientes_importar():
                               )
                               db.session.add(pago)
 
+                        savepoint_fila.commit()
                         conteo_exitoso += 1
 
                     except Exception as e:
                         # Fila 2 corresponde al índice 0, por eso es index + 2
                         errores.append(f"Fila {index + 2}: {e}")
-                        db.session.rollback()
-                        db.session.begin_nested() 
+                        savepoint_fila.rollback()
                         continue
                 
                 db.session.commit()
@@ -1798,88 +3236,254 @@ def enviar_whatsapp_cliente(cliente_id):
         flash("El cliente no tiene número principal registrado.", "warning")
     return redirect(url_for('clientes_list'))
 
+# ========== DataTables: formato columnar (?format=columnar) ==========
+def _formato_columnar():
+    """True si el cliente pidió el payload compacto: encabezado + arreglos de valores crudos."""
+    return (request.args.get('format') or '').lower() == 'columnar'
+
+
+def _valor_crudo(v):
+    """Normaliza un valor de la DB a JSON sin formato de presentación."""
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return float(v)
+    return v
+
+
+def _respuesta_columnar(columnas, filas, **extra):
+    """
+    {"columns": [...], "rows": [[...], ...]} sin HTML ni llaves repetidas por fila.
+    El front-end se encarga de renderizar.
+    """
+    return jsonify({
+        "columns": list(columnas),
+        "rows": [[_valor_crudo(v) for v in fila] for fila in filas],
+        **extra
+    })
+
+
+# ========== DataTables: procesamiento del lado del servidor ==========
+def _parametros_datatables():
+    """
+    Lee los parámetros que DataTables envía con serverSide: true.
+    Devuelve None si la petición no viene en modo servidor (sin 'draw').
+    """
+    draw = request.args.get('draw', type=int)
+    if draw is None:
+        return None
+
+    start = max(request.args.get('start', 0, type=int) or 0, 0)
+    length = request.args.get('length', 25, type=int)
+    if length is None or length < 0:
+        length = None  # -1 = "Todos"
+    else:
+        length = min(length, 1000)
+
+    # order[i][column] apunta al índice de columns[i][data]
+    orden = []
+    i = 0
+    while f'order[{i}][column]' in request.args:
+        col_idx = request.args.get(f'order[{i}][column]', type=int)
+        direccion = (request.args.get(f'order[{i}][dir]') or 'asc').lower()
+        nombre_col = request.args.get(f'columns[{col_idx}][data]')
+        if nombre_col:
+            orden.append((nombre_col, 'desc' if direccion == 'desc' else 'asc'))
+        i += 1
+
+    # columns[i][search][value]: filtro por columna (selects de server/país/paquete)
+    por_columna = {}
+    i = 0
+    while f'columns[{i}][data]' in request.args:
+        valor = (request.args.get(f'columns[{i}][search][value]') or '').strip()
+        if valor:
+            por_columna[request.args.get(f'columns[{i}][data]')] = valor
+        i += 1
+
+    return {
+        "draw": draw,
+        "start": start,
+        "length": length,
+        "search": (request.args.get('search[value]') or '').strip(),
+        "columns": por_columna,
+        "order": orden,
+    }
+
+
+def _fila_cliente_dt(row, today):
+    """Convierte una fila Cliente+Suscripcion al dict que consume clientes_list.html."""
+    (
+        cid, negocio, nombre_contacto, tel, tel1, tel2, tel3, mail, pais,
+        status_cliente, fecha_pago, id_gumi, server, paquete,
+        status_sus, proximo_pago, vence_en
+    ) = row
+
+    # 🛑 LÓGICA SIMPLIFICADA VIGENTE/VENCIDA INTEGRADA 🛑
+    status_pago_info = {"status": "SIN SUSCRIPCIÓN", "color": "bg-secondary"}
+
+    if proximo_pago:
+        dias = (proximo_pago - today).days
+
+        if dias >= 0:
+            # Si es hoy o futuro
+            status_pago_info = {"status": "VIGENTE", "color": "bg-success"}
+        else:
+            # Si la fecha ya pasó
+            status_pago_info = {"status": "VENCIDA", "color": "bg-danger"}
+
+    status = status_sus or status_cliente or "Activo"
+
+    return {
+        "id": cid,
+        "id_gumi": id_gumi or "",
+        "server": server or "",
+        "pais": pais or "",
+        "status": status,
+        "negocio": negocio,
+        "nombre_contacto": nombre_contacto,
+        "telefono": tel or "",
+        "tel_sec_1": tel1 or "",
+        "tel_sec_2": tel2 or "",
+        "tel_sec_3": tel3 or "",
+        "mail": mail or "",
+        "paquete": paquete or "",
+        "ultimo_pago": fecha_pago.isoformat() if fecha_pago else "",
+        "proximo_pago": proximo_pago.isoformat() if proximo_pago else "",
+        "status_pago_info": status_pago_info,
+    }
+
+
+def _expr_status_dt(status_col, status_cliente_col):
+    """Status que muestra la lista (misma regla que _fila_cliente_dt): suscripción, cliente o "Activo"."""
+    return func.coalesce(func.nullif(status_col, ''), func.nullif(status_cliente_col, ''), 'Activo')
+
+
+# Columnas de cliente_resumen con filtro exacto (selects de clientes_list.html)
+_COLUMNAS_FILTRO_CLIENTES = {
+    "server": ClienteResumen.server,
+    "pais": ClienteResumen.pais,
+    "paquete": ClienteResumen.paquete,
+}
+
+
 @app.route('/api/clientes_dt')
 @login_required
+@etag_por_versiones('cliente', 'suscripcion')
 def api_clientes_dt():
     from datetime import date
     from sqlalchemy import select, outerjoin
 
     today = date.today()
 
-    # 🔹 Consulta combinada Cliente + Suscripcion
-    stmt = (
-        select(
-            Cliente.id,
-            Cliente.negocio,
-            Cliente.nombre_contacto,
-            Cliente.telefono,
-            Cliente.telefono_secundario_1,
-            Cliente.telefono_secundario_2,
-            Cliente.telefono_secundario_3,
-            Cliente.mail,
-            Cliente.pais,
-            Cliente.status_cliente,
-            Cliente.fecha_pago,
-            Suscripcion.id_gumi,
-            Suscripcion.server,
-            Suscripcion.paquete,
-            Suscripcion.status,
-            Suscripcion.proximo_pago,
-            Suscripcion.vence_en
-        )
-        .select_from(outerjoin(Cliente, Suscripcion, Cliente.id == Suscripcion.cliente_id))
-        .order_by(Cliente.negocio.asc())
+    # 🔹 Proyección Cliente + Suscripcion desde el modelo de lectura cliente_resumen
+    R = ClienteResumen
+    stmt = select(
+        R.cliente_id.label('id'),
+        R.negocio,
+        R.nombre_contacto,
+        R.telefono,
+        R.telefono_secundario_1,
+        R.telefono_secundario_2,
+        R.telefono_secundario_3,
+        R.mail,
+        R.pais,
+        R.status_cliente,
+        R.ultimo_pago.label('fecha_pago'),
+        R.id_gumi,
+        R.server,
+        R.paquete,
+        R.status,
+        R.proximo_pago,
+        R.vence_en
     )
 
-    results = db.session.execute(stmt).all()
-    rows = []
+    dt = _parametros_datatables()
+    if dt is None:
+        # Modo clásico: toda la lista, DataTables pagina en el navegador
+        results = db.session.execute(stmt.order_by(R.negocio.asc())).all()
+        if _formato_columnar():
+            return _respuesta_columnar(stmt.selected_columns.keys(), results)
+        return jsonify({"data": [_fila_cliente_dt(row, today) for row in results]})
+
+    # --- Modo servidor: WHERE / ORDER BY / LIMIT-OFFSET en SQL ---
+    columnas_orden = {
+        "id": R.cliente_id,
+        "id_gumi": R.id_gumi,
+        "server": R.server,
+        "pais": R.pais,
+        "status": _expr_status_dt(R.status, R.status_cliente),
+        "status_pago_info": R.proximo_pago,
+        "negocio": R.negocio,
+        "nombre_contacto": R.nombre_contacto,
+        "mail": R.mail,
+        "paquete": R.paquete,
+        "ultimo_pago": R.ultimo_pago,
+        "proximo_pago": R.proximo_pago,
+    }
 
-    for row in results:
-        (
-            cid, negocio, nombre_contacto, tel, tel1, tel2, tel3, mail, pais,
-            status_cliente, fecha_pago, id_gumi, server, paquete,
-            status_sus, proximo_pago, vence_en
-        ) = row
+    if dt["search"]:
+        patron = f"%{dt['search']}%"
+        stmt = stmt.where(or_(
+            R.negocio.ilike(patron),
+            R.nombre_contacto.ilike(patron),
+            R.mail.ilike(patron),
+            R.telefono.ilike(patron),
+            R.telefonos_normalizados.ilike(patron),
+            R.pais.ilike(patron),
+            R.id_gumi.ilike(patron),
+            R.server.ilike(patron),
+            R.paquete.ilike(patron),
+            R.status.ilike(patron),
+        ))
+
+    for nombre_col, valor in dt["columns"].items():
+        col = _COLUMNAS_FILTRO_CLIENTES.get(nombre_col)
+        if col is not None:
+            stmt = stmt.where(col == valor)
+
+    orden_sql = []
+    for nombre_col, direccion in dt["order"]:
+        col = columnas_orden.get(nombre_col)
+        if col is not None:
+            orden_sql.append(col.desc() if direccion == 'desc' else col.asc())
+    if not orden_sql:
+        orden_sql.append(R.negocio.asc())
+    orden_sql.append(R.cliente_id.asc())  # Desempate estable entre páginas
+
+    # 🔹 Totales por status sobre TODO el conjunto filtrado (no solo la página)
+    filtrado = stmt.subquery()
+    status_expr = _expr_status_dt(filtrado.c.status, filtrado.c.status_cliente)
+    totales = {
+        status: cantidad
+        for status, cantidad in db.session.execute(
+            select(status_expr, func.count()).group_by(status_expr)
+        ).all()
+    }
+    filtrados = sum(totales.values())
+    if dt["search"] or dt["columns"]:
+        total = db.session.query(func.count(R.cliente_id)).scalar()
+    else:
+        total = filtrados
 
-        # 🛑 LÓGICA SIMPLIFICADA VIGENTE/VENCIDA INTEGRADA 🛑
-        
-        status_pago_info = {"status": "SIN SUSCRIPCIÓN", "color": "bg-secondary"}
-        
-        if proximo_pago:
-            dias = (proximo_pago - today).days
-            
-            if dias >= 0:
-                # Si es hoy o futuro
-                status_pago_info = {"status": "VIGENTE", "color": "bg-success"}
-            else:
-                # Si la fecha ya pasó
-                status_pago_info = {"status": "VENCIDA", "color": "bg-danger"}
-        
-        # -------------------------------------------------------------
-        
-        status = status_sus or status_cliente or "Activo"
-        is_eliminado = (status_sus or status_cliente) == 'Eliminado'
-
-        rows.append({
-            "id": cid,
-            "id_gumi": id_gumi or "",
-            "server": server or "",
-            "pais": pais or "",
-            "status": status,
-            "negocio": negocio,
-            "nombre_contacto": nombre_contacto,
-            "telefono": tel or "",
-            "tel_sec_1": tel1 or "",
-            "tel_sec_2": tel2 or "",
-            "tel_sec_3": tel3 or "",
-            "mail": mail or "",
-            "paquete": paquete or "",
-            "ultimo_pago": fecha_pago.isoformat() if fecha_pago else "",
-            "proximo_pago": proximo_pago.isoformat() if proximo_pago else "",
-            "status_pago_info": status_pago_info,
-        })
+    stmt = stmt.order_by(*orden_sql).offset(dt["start"])
+    if dt["length"] is not None:
+        stmt = stmt.limit(dt["length"])
+
+    results = db.session.execute(stmt).all()
 
-    return jsonify({"data": rows})
+    if _formato_columnar():
+        return _respuesta_columnar(
+            stmt.selected_columns.keys(), results,
+            draw=dt["draw"], recordsTotal=total, recordsFiltered=filtrados, totales=totales
+        )
+
+    return jsonify({
+        "draw": dt["draw"],
+        "recordsTotal": total,
+        "recordsFiltered": filtrados,
+        "totales": totales,
+        "data": [_fila_cliente_dt(row, today) for row in results],
+    })
 
 
 @app.route('/pagos')
@@ -1888,12 +3492,7 @@ def pagos_list_global():
     from sqlalchemy import extract
     
     # Obtener años únicos de los pagos para el filtro
-    years = db.session.query(db.extract('year', Pago.fecha_pago).distinct().label('year')) \
-             .filter(Pago.fecha_pago.isnot(None)) \
-             .order_by(db.desc('year')) \
-             .all()
-    
-    unique_years = [r.year for r in years]
+    unique_years = anios_con_datos(Pago.fecha_pago)
     
     # Mapeo de meses (para el frontend)
     months_map = {
@@ -1908,25 +3507,114 @@ def pagos_list_global():
 
 
 
+# MAPEO DE MONEDAS POR PAÍS (Ajusta esta lista según tus clientes)
+CURRENCY_MAP = {
+    'MÉXICO': 'MXN',
+    'COLOMBIA': 'COP',
+    'PERÚ': 'PEN',
+    'ESTADOS UNIDOS': 'USD',
+    # Agrega otros países/monedas si es necesario
+}
+DEFAULT_CURRENCY = 'MXN' # Moneda de fallback si no se encuentra ninguna referencia
+
+MESES_ABBR = {
+    1: "ene", 2: "feb", 3: "mar", 4: "abr", 5: "may", 6: "jun",
+    7: "jul", 8: "ago", 9: "sep", 10: "oct", 11: "nov", 12: "dic"
+}
+
+
+def _fila_pago_dt(r):
+    """Formatea una fila de la consulta de pagos globales para DataTables."""
+    # --- LÓGICA DE MONEDA: Jalar el dato o usar fallback ---
+    moneda_final = r.moneda
+    if not moneda_final:
+        # Si Pago.moneda es NULL, intentamos inferir del País del Cliente
+        pais_limpio = (r.cliente_pais or '').upper().strip()
+        moneda_final = CURRENCY_MAP.get(pais_limpio, DEFAULT_CURRENCY)
+    # --- FIN LÓGICA DE MONEDA ---
+
+    # --- FORMATO DE FECHA AMIGABLE ---
+    if r.fecha_pago:
+        dia = r.fecha_pago.day
+        mes = MESES_ABBR.get(r.fecha_pago.month, "")
+        anio = r.fecha_pago.year
+        fecha_display = f"{dia} {mes} {anio}" # Ej: 30 nov 2025
+        fecha_iso = r.fecha_pago.strftime("%Y-%m-%d") # Ej: 2025-11-30
+    else:
+        fecha_display = ""
+        fecha_iso = ""
+
+    # Formatos auxiliares
+    facturado = "Sí" if r.factura_pago or (r.numero_factura and str(r.numero_factura).strip()) else "No"
+    monto_str = f"{r.monto:,.2f}" if r.monto is not None else "0.00"
+
+    # Generar enlace al detalle del cliente
+    cliente_id_link = r.cliente_id_for_link
+    cliente_negocio_display = r.cliente_negocio or "Cliente Eliminado"
+
+    negocio_link = cliente_negocio_display
+
+    if cliente_id_link:
+        url_detalle = url_for('cliente_detalle', cliente_id=cliente_id_link)
+        negocio_link = f'<a href="{url_detalle}">{cliente_negocio_display}</a>'
+
+    return {
+        "id": r.id,
+
+        "fecha_pago": fecha_display,
+        "fecha_pago_orden": fecha_iso,
+
+        "paquete": r.paquete or "—",
+        "vigencia": r.vigencia or "—",
+        "monto": monto_str,
+        "moneda": moneda_final, # <--- Siempre será un valor de moneda válido
+        "metodo_pago": r.metodo_pago or "—",
+        "motivo_descuento": r.motivo_descuento or "—",
+        "num_factura": r.numero_factura or "—",
+        "facturado_str": facturado,
+        "id_gumi": r.suscripcion_id_gumi or "—",
+        "server": r.server_info or "—",
+        "pais_cliente": r.cliente_pais or "—",
+        "negocio_link": negocio_link,
+        "contacto": r.cliente_contacto or "—",
+    }
+
+
+# ========== Paginación por cursor (keyset) ==========
+def _codificar_cursor(*valores):
+    """Empaqueta la última clave vista en un token opaco (base64 url-safe)."""
+    import base64
+    import json
+    crudo = json.dumps(list(valores), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(crudo).decode('ascii').rstrip('=')
+
+
+def _decodificar_cursor(token):
+    """Inverso de _codificar_cursor. Lanza ValueError si el token no es válido."""
+    import base64
+    import json
+    try:
+        relleno = '=' * (-len(token) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(token + relleno))
+    except Exception:
+        raise ValueError("Cursor inválido")
+    if not isinstance(valores, list):
+        raise ValueError("Cursor inválido")
+    return valores
+
+
 @app.route('/api/pagos_dt_global')
 @login_required
+@etag_por_versiones('pago', 'cliente', 'suscripcion')
 def api_pagos_dt_global():
-    from sqlalchemy import select, outerjoin, extract
-    from flask import url_for 
+    from sqlalchemy import select, outerjoin, extract, tuple_
     import traceback
 
     year_filter = request.args.get('year', type=int)
     month_filter = request.args.get('month', type=int)
-    
-    # MAPEO DE MONEDAS POR PAÍS (Ajusta esta lista según tus clientes)
-    CURRENCY_MAP = {
-        'MÉXICO': 'MXN',
-        'COLOMBIA': 'COP',
-        'PERÚ': 'PEN',
-        'ESTADOS UNIDOS': 'USD',
-        # Agrega otros países/monedas si es necesario
-    }
-    DEFAULT_CURRENCY = 'MXN' # Moneda de fallback si no se encuentra ninguna referencia
+
+    # Modo cursor: ?cursor= (vacío = primera página) & limit=N
+    modo_cursor = 'cursor' in request.args
 
     try:
         # 1. Construir la consulta base
@@ -1945,89 +3633,100 @@ def api_pagos_dt_global():
             .outerjoin(Cliente, Pago.cliente_id == Cliente.id) 
             .outerjoin(Suscripcion, Pago.cliente_id == Suscripcion.cliente_id)
             .where(Pago.status == 'ACTIVO') 
-            .order_by(Pago.fecha_pago.desc())
         )
 
         # 2. Filtros
-        if year_filter:
-            stmt = stmt.where(extract('year', Pago.fecha_pago) == year_filter)
-        
-        if month_filter:
-            stmt = stmt.where(extract('month', Pago.fecha_pago) == month_filter)
-        
-        # 3. Ejecutar
+        filtro_fecha = filtro_de_fechas(Pago.fecha_pago, anio=year_filter, mes=month_filter)
+        if filtro_fecha is not None:
+            stmt = stmt.where(filtro_fecha)
+
+        if not modo_cursor:
+            # 3. Ejecutar (lista completa)
+            results = db.session.execute(stmt.order_by(Pago.fecha_pago.desc())).all()
+            if _formato_columnar():
+                return _respuesta_columnar(stmt.selected_columns.keys(), results)
+            return jsonify({"data": [_fila_pago_dt(r) for r in results]})
+
+        # --- Modo cursor: orden total (fecha_pago DESC, id DESC) ---
+        limite = request.args.get('limit', 100, type=int) or 100
+        limite = max(1, min(limite, 1000))
+
+        token = request.args.get('cursor') or ''
+        if token:
+            try:
+                fecha_cursor, id_cursor = _decodificar_cursor(token)
+                fecha_cursor = date.fromisoformat(fecha_cursor)
+                id_cursor = int(id_cursor)
+            except (ValueError, TypeError):
+                return jsonify({"data": [], "next_cursor": None, "error": "Cursor inválido"}), 400
+            stmt = stmt.where(
+                tuple_(Pago.fecha_pago, Pago.id) < tuple_(fecha_cursor, id_cursor)
+            )
+
+        stmt = stmt.order_by(Pago.fecha_pago.desc(), Pago.id.desc()).limit(limite + 1)
         results = db.session.execute(stmt).all()
 
-        # 4. Diccionario de meses en español
-        meses_abbr = {
-            1: "ene", 2: "feb", 3: "mar", 4: "abr", 5: "may", 6: "jun",
-            7: "jul", 8: "ago", 9: "sep", 10: "oct", 11: "nov", 12: "dic"
-        }
+        hay_mas = len(results) > limite
+        results = results[:limite]
 
-        rows = []
-        for r in results:
-            # --- LÓGICA DE MONEDA: Jalar el dato o usar fallback ---
-            moneda_final = r.moneda
-            if not moneda_final:
-                # Si Pago.moneda es NULL, intentamos inferir del País del Cliente
-                pais_limpio = (r.cliente_pais or '').upper().strip()
-                moneda_final = CURRENCY_MAP.get(pais_limpio, DEFAULT_CURRENCY)
-            # --- FIN LÓGICA DE MONEDA ---
-
-
-            # --- FORMATO DE FECHA AMIGABLE ---
-            if r.fecha_pago:
-                dia = r.fecha_pago.day
-                mes = meses_abbr.get(r.fecha_pago.month, "")
-                anio = r.fecha_pago.year
-                fecha_display = f"{dia} {mes} {anio}" # Ej: 30 nov 2025
-                fecha_iso = r.fecha_pago.strftime("%Y-%m-%d") # Ej: 2025-11-30
-            else:
-                fecha_display = ""
-                fecha_iso = ""
+        next_cursor = None
+        if hay_mas and results:
+            ultimo = results[-1]
+            next_cursor = _codificar_cursor(ultimo.fecha_pago.isoformat(), ultimo.id)
 
-            # Formatos auxiliares
-            facturado = "Sí" if r.factura_pago or (r.numero_factura and str(r.numero_factura).strip()) else "No"
-            monto_str = f"{r.monto:,.2f}" if r.monto is not None else "0.00"
-            
-            # Generar enlace al detalle del cliente
-            cliente_id_link = r.cliente_id_for_link 
-            cliente_negocio_display = r.cliente_negocio or "Cliente Eliminado"
-            
-            negocio_link = cliente_negocio_display 
-            
-            if cliente_id_link:
-                url_detalle = url_for('cliente_detalle', cliente_id=cliente_id_link) 
-                negocio_link = f'<a href="{url_detalle}">{cliente_negocio_display}</a>'
-            
-            rows.append({
-                "id": r.id,
-                
-                "fecha_pago": fecha_display,
-                "fecha_pago_orden": fecha_iso,
-
-                "paquete": r.paquete or "—",
-                "vigencia": r.vigencia or "—",
-                "monto": monto_str,
-                "moneda": moneda_final, # <--- Siempre será un valor de moneda válido
-                "metodo_pago": r.metodo_pago or "—", 
-                "motivo_descuento": r.motivo_descuento or "—",
-                "num_factura": r.numero_factura or "—",
-                "facturado_str": facturado,
-                "id_gumi": r.suscripcion_id_gumi or "—",
-                "server": r.server_info or "—",
-                "pais_cliente": r.cliente_pais or "—", 
-                "negocio_link": negocio_link, 
-                "contacto": r.cliente_contacto or "—",
-            })
+        if _formato_columnar():
+            return _respuesta_columnar(stmt.selected_columns.keys(), results, next_cursor=next_cursor)
 
-        return jsonify({"data": rows})
+        return jsonify({
+            "data": [_fila_pago_dt(r) for r in results],
+            "next_cursor": next_cursor
+        })
 
     except Exception as e:
         # Es buena práctica registrar el error completo en el log
         print(f"Error en api_pagos_dt_global: {traceback.format_exc()}")
         return jsonify({"data": []}), 500
 
+# ========== IDs de pagos manuales (bank_transaction_id negativo) ==========
+def reservar_ids_manuales(cantidad=1):
+    """
+    Reserva `cantidad` IDs negativos únicos para bank_transaction_id de pagos manuales, en O(1).
+    - Postgres: -nextval('pago_manual_id_seq') (atómico entre workers, no se revierte con rollback).
+    - SQLite: UPDATE ... RETURNING sobre la tabla `secuencia` dentro de la transacción de la sesión
+      (SQLite serializa las escrituras; si se hace rollback, se revierten también los pagos).
+    Con cantidad > 1 reserva un bloque (cargas masivas).
+    """
+    from sqlalchemy import select, insert, update
+
+    if cantidad <= 0:
+        return []
+
+    if db.engine.dialect.name == 'postgresql':
+        valores = db.session.execute(
+            select(secuencia_pago_manual.next_value()).select_from(func.generate_series(1, cantidad))
+        ).scalars().all()
+        return [-int(v) for v in valores]
+
+    tabla = Secuencia.__table__
+    nombre = secuencia_pago_manual.name
+    fin = db.session.execute(
+        update(tabla).where(tabla.c.nombre == nombre)
+        .values(valor=tabla.c.valor + cantidad).returning(tabla.c.valor)
+    ).scalar()
+    if fin is None:
+        # Primera vez: continuar después del ID manual más negativo que ya exista
+        minimo = db.session.execute(
+            select(func.min(Pago.bank_transaction_id)).where(Pago.bank_transaction_id < 0)
+        ).scalar()
+        fin = -int(minimo or 0) + cantidad
+        db.session.execute(insert(tabla).values(nombre=nombre, valor=fin))
+    return [-v for v in range(fin - cantidad + 1, fin + 1)]
+
+
+def siguiente_id_manual():
+    return reservar_ids_manuales(1)[0]
+
+
 # ========== API: Agregar pago ==========
 def _parse_monto(m):
     """Acepta strings tipo 'MXN 1,234.50' o '$1,234' y regresa float seguro."""
@@ -2076,18 +3775,8 @@ def api_nuevo_pago():
     provided_bank_id = data.get('bank_transaction_id')
     
     if provided_bank_id is None or provided_bank_id == '':
-        # Caso: Pago manual. Generamos el ID negativo único buscando el mínimo.
-        
-        # 1. BUSCAR EL VALOR MÍNIMO (más negativo) de bank_transaction_id
-        min_manual_id = db.session.query(
-            func.min(Pago.bank_transaction_id)
-        ).filter(Pago.bank_transaction_id < 0).scalar() # Buscamos el ID más negativo
-
-        # 2. Asignar el nuevo ID. Si min_manual_id es None, empezamos en -1.
-        if min_manual_id is None:
-            final_bank_transaction_id = -1
-        else:
-            final_bank_transaction_id = int(min_manual_id) - 1 
+        # Caso: Pago manual. ID negativo único de la secuencia (sin carreras entre workers).
+        final_bank_transaction_id = siguiente_id_manual()
     else:
         # Caso: Pago de conciliación.
         final_bank_transaction_id = int(provided_bank_id)
@@ -2232,6 +3921,7 @@ def api_agregar_pago(cliente_id):
 
 @app.route('/api/cliente_pago/<int:cliente_id>')
 @login_required
+@etag_por_versiones('cliente', 'suscripcion', 'paquete_precio')
 def api_cliente_pago(cliente_id):
     """Devuelve datos para el modal de AGREGAR PAGO:
         - negocio, país
@@ -2336,6 +4026,7 @@ def cliente_detalle(cliente_id):
 
 @app.route('/api/pagos_cliente_v2/<int:cliente_id>')
 @login_required
+@etag_por_versiones('cliente', 'pago')
 def api_pagos_cliente_v2(cliente_id):
     """
     Devuelve los pagos registrados del cliente en formato JSON (para DataTables).
@@ -2374,6 +4065,8 @@ def api_pagos_cliente_v2(cliente_id):
 
 
 # TASA DE CONVERSIÓN FIJA PARA DASHBOARD (Para unificar a MXN)
+# 🔹 Los ingresos del dashboard ya usan Pago.monto_mxn (tabla tipo_cambio); estas tasas
+# quedaron como valor inicial de tipo_cambio en la migración y para convertir_a_mxn.
 TASA_USD_MXN = 18.0
 TASA_COP_MXN = 0.0045 
 
@@ -2397,8 +4090,622 @@ def convertir_a_mxn(monto, moneda):
         return float(monto * Decimal(str(TASA_COP_MXN)))
     return float(monto)
 
+GRANULARIDADES_TENDENCIA = ('dia', 'semana', 'mes')
+TENDENCIA_MAX_MESES = 36
+
+
+def _inicio_periodo(d, granularidad):
+    """Primer día del periodo (día, semana ISO que empieza en lunes, o mes) que contiene d."""
+    if granularidad == 'mes':
+        return d.replace(day=1)
+    if granularidad == 'semana':
+        return d - timedelta(days=d.weekday())
+    return d
+
+
+def _expr_periodo(columna, granularidad):
+    """Expresión SQL que trunca una columna Date al inicio de su periodo."""
+    if db.engine.dialect.name == 'postgresql':
+        campo = {'dia': 'day', 'semana': 'week', 'mes': 'month'}[granularidad]
+        return db.cast(func.date_trunc(campo, columna), db.Date)
+    # SQLite: fechas ISO en texto
+    if granularidad == 'mes':
+        return func.strftime('%Y-%m-01', columna)
+    if granularidad == 'semana':
+        return func.date(columna, '-6 days', 'weekday 1')
+    return func.date(columna)
+
+
+def _ventana_tendencia(meses, granularidad):
+    """Normaliza (meses, granularidad) y devuelve (meses, granularidad, desde, hasta)."""
+    from dateutil.relativedelta import relativedelta
+
+    meses = max(1, min(meses or 6, TENDENCIA_MAX_MESES))
+    if granularidad not in GRANULARIDADES_TENDENCIA:
+        granularidad = 'mes'
+
+    hoy = date.today()
+    desde = (hoy - relativedelta(months=meses - 1)).replace(day=1)
+    hasta = hoy.replace(day=1) + relativedelta(months=1) - timedelta(days=1)
+    return meses, granularidad, desde, hasta
+
+
+def calcular_tendencia_ventas(meses=6, granularidad='mes', pais=None, server=None, paquete=None):
+    """
+    Ingresos ACTIVOS en MXN (Pago.monto_mxn) por periodo para los últimos `meses` meses
+    (incluye el mes en curso). Una sola consulta agrupada por periodo; los periodos sin pagos salen en 0.
+    Devuelve (labels, data).
+    """
+    meses, granularidad, desde, hasta = _ventana_tendencia(meses, granularidad)
+
+    ingresos = {}
+    if granularidad == 'mes':
+        # Por mes basta el rollup mensual
+        R = ResumenIngresosMensual
+        clave = R.anio * 100 + R.mes
+        q = db.session.query(R.anio, R.mes, func.sum(R.monto_mxn_total)).filter(
+            clave.between(desde.year * 100 + desde.month, hasta.year * 100 + hasta.month)
+        )
+        if pais: q = q.filter(R.pais == pais)
+        if server: q = q.filter(R.server == server)
+        if paquete: q = q.filter(R.paquete.ilike(f'%{paquete}%'))
+        for a, m, suma_mxn in q.group_by(R.anio, R.mes).all():
+            ingresos[date(a, m, 1)] = float(suma_mxn or 0)
+        return _eje_tendencia(ingresos, desde, hasta, meses, granularidad)
+
+    # La primera semana del eje empieza en lunes, aunque ese lunes caiga antes de `desde`
+    periodo = _expr_periodo(Pago.fecha_pago, granularidad).label('periodo')
+    q = db.session.query(periodo, func.sum(Pago.monto_mxn)).filter(
+        Pago.status == 'ACTIVO',
+        Pago.fecha_pago.between(_inicio_periodo(desde, granularidad), hasta)
+    ).join(Cliente, Pago.cliente_id == Cliente.id).outerjoin(Suscripcion, Pago.cliente_id == Suscripcion.cliente_id)
+
+    if pais: q = q.filter(Cliente.pais == pais)
+    if server: q = q.filter(Suscripcion.server == server)
+    if paquete: q = q.filter(Pago.paquete.ilike(f'%{paquete}%'))
+
+    for p, suma_mxn in q.group_by(periodo).all():
+        if p is None:
+            continue
+        inicio = p if isinstance(p, date) else date.fromisoformat(str(p)[:10])
+        ingresos[inicio] = ingresos.get(inicio, 0.0) + float(suma_mxn or 0)
+    return _eje_tendencia(ingresos, desde, hasta, meses, granularidad)
+
+
+def _eje_tendencia(ingresos, desde, hasta, meses, granularidad):
+    """Eje completo de periodos (labels, data) para que los huecos se vean como 0."""
+    from dateutil.relativedelta import relativedelta
+
+    if granularidad == 'mes':
+        paso, formato = relativedelta(months=1), ('%b' if meses <= 12 else '%b %y')
+    elif granularidad == 'semana':
+        paso, formato = timedelta(weeks=1), '%d %b'
+    else:
+        paso, formato = timedelta(days=1), '%d %b'
+
+    labels, data = [], []
+    actual = _inicio_periodo(desde, granularidad)
+    while actual <= hasta:
+        labels.append(actual.strftime(formato))
+        data.append(round(ingresos.get(actual, 0.0)))
+        actual += paso
+    return labels, data
+
+
+# =======================================================
+# CACHE DE RESPUESTAS DEL DASHBOARD
+# =======================================================
+app.config.setdefault('DASHBOARD_CACHE_TTL', int(os.environ.get('DASHBOARD_CACHE_TTL', '300')))  # segundos; 0 = sin cache
+app.config.setdefault('DASHBOARD_CACHE_MAX', int(os.environ.get('DASHBOARD_CACHE_MAX', '128')))  # entradas (LRU)
+
+
+class CacheRespuestas:
+    """
+    Cache LRU con TTL por worker, con contadores de aciertos/fallos.
+    Los valores se guardan tal cual (dicts listos para jsonify): no modificarlos.
+    """
+
+    def __init__(self, nombre):
+        import threading
+        from collections import OrderedDict
+        self.nombre = nombre
+        self._lock = threading.Lock()
+        self._datos = OrderedDict()  # clave -> (expira_en, valor)
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+
+    def _config(self):
+        cfg = current_app.config
+        return cfg['DASHBOARD_CACHE_TTL'], cfg['DASHBOARD_CACHE_MAX']
+
+    def obtener(self, clave):
+        import time
+        ttl, _ = self._config()
+        with self._lock:
+            entrada = self._datos.get(clave) if ttl > 0 else None
+            if entrada is not None and entrada[0] > time.monotonic():
+                self._datos.move_to_end(clave)
+                self.aciertos += 1
+                return entrada[1]
+            if entrada is not None:
+                del self._datos[clave]
+            self.fallos += 1
+            return None
+
+    def guardar(self, clave, valor):
+        import time
+        ttl, maximo = self._config()
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > maximo:
+                self._datos.popitem(last=False)
+
+    def invalidar(self):
+        with self._lock:
+            self._datos.clear()
+            self.invalidaciones += 1
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                "cache": self.nombre,
+                "entradas": len(self._datos),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "invalidaciones": self.invalidaciones,
+                "tasa_aciertos": round(self.aciertos / total, 3) if total else 0.0,
+            }
+
+
+cache_dashboard = CacheRespuestas('dashboard_data')
+
+
+@al_confirmar_cambios('pago', 'suscripcion', 'cliente')
+def _invalidar_cache_dashboard():
+    cache_dashboard.invalidar()
+
+
+def _clave_cache_dashboard(anio, mes, pais, server, paquete, tendencia_meses, granularidad, motor='sql'):
+    """
+    Tupla normalizada de filtros y motor (sql / pandas). Incluye la fecha (antigüedad y
+    tendencia dependen de hoy) y las versiones de las tablas, para no servir datos que
+    otro worker ya cambió.
+    """
+    def limpio(v):
+        v = (v or '').strip()
+        return v or None
+
+    return (
+        anio or None, mes or None, limpio(pais), limpio(server),
+        (limpio(paquete) or '').lower() or None,  # ILIKE: no distingue mayúsculas
+        max(1, min(tendencia_meses or 6, TENDENCIA_MAX_MESES)),
+        granularidad if granularidad in GRANULARIDADES_TENDENCIA else 'mes',
+        'pandas' if motor == 'pandas' else 'sql',
+        date.today().isoformat(),
+        tuple(sorted(obtener_versiones(('pago', 'suscripcion', 'cliente')).items())),
+    )
+
+
+@app.route('/api/dashboard_cache_stats')
+@login_required
+@role_required(ROLES_SUPERADMIN)
+def api_dashboard_cache_stats():
+    """Contadores de aciertos/fallos de la cache del dashboard (de este worker)."""
+    return jsonify(cache_dashboard.estadisticas())
+
+
+# =======================================================
+# EJECUCIÓN PARALELA DE CONSULTAS DEL DASHBOARD
+# =======================================================
+app.config.setdefault('DASHBOARD_PARALELO', os.environ.get('DASHBOARD_PARALELO', '0') == '1')
+app.config.setdefault('DASHBOARD_HILOS', int(os.environ.get('DASHBOARD_HILOS', '4')))
+
+_pool_dashboard = None
+
+
+def _obtener_pool_dashboard():
+    global _pool_dashboard
+    if _pool_dashboard is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _pool_dashboard = ThreadPoolExecutor(
+            max_workers=app.config['DASHBOARD_HILOS'], thread_name_prefix='dashboard'
+        )
+    return _pool_dashboard
+
+
+def _ejecutar_en_contexto(app_obj, fn):
+    """Corre fn() en un hilo del pool con su propio app context (y su propia sesión/conexión)."""
+    import time
+    with app_obj.app_context():
+        t0 = time.perf_counter()
+        try:
+            return fn(), (time.perf_counter() - t0) * 1000
+        finally:
+            db.session.remove()
+
+
+def ejecutar_secciones(secciones, paralelo=False):
+    """
+    Ejecuta {nombre: fn} y devuelve ({nombre: resultado}, {nombre: ms, 'total': ms}).
+    En paralelo cada sección toma una conexión del pool de SQLAlchemy, así que el tiempo
+    total se acerca al de la consulta más lenta en lugar de a la suma de todas.
+    """
+    import time
+    t0 = time.perf_counter()
+    resultados, tiempos = {}, {}
+    if paralelo:
+        app_obj = current_app._get_current_object()
+        futuros = {
+            nombre: _obtener_pool_dashboard().submit(_ejecutar_en_contexto, app_obj, fn)
+            for nombre, fn in secciones.items()
+        }
+        for nombre, futuro in futuros.items():
+            resultados[nombre], tiempos[nombre] = futuro.result()
+    else:
+        for nombre, fn in secciones.items():
+            t = time.perf_counter()
+            resultados[nombre] = fn()
+            tiempos[nombre] = (time.perf_counter() - t) * 1000
+    tiempos = {k: round(v, 1) for k, v in tiempos.items()}
+    tiempos['total'] = round((time.perf_counter() - t0) * 1000, 1)
+    tiempos['modo'] = 'paralelo' if paralelo else 'serie'
+    return resultados, tiempos
+
+
+# =======================================================
+# FOTOS DIARIAS DE KPIs (kpi_snapshot)
+# =======================================================
+
+def calcular_kpi_snapshot(fecha=None):
+    """
+    Filas de kpi_snapshot (dicts) para `fecha` (hoy por defecto): una por (pais, server),
+    con el estado actual de las suscripciones y los pagos del mes de la fecha según el rollup.
+    """
+    from sqlalchemy import case
+
+    fecha = fecha or date.today()
+    ahora = datetime.now()
+    filas = {}
+
+    def fila(pais, server):
+        return filas.setdefault((pais, server), {
+            'fecha': fecha, 'pais': pais, 'server': server,
+            'clientes_activos': 0, 'suspendidos': 0, 'demos_activos': 0,
+            'num_pagos_mes': 0, 'pagos_facturados_mes': 0, 'ingresos_mes_mxn': Decimal('0'),
+            'creado_en': ahora,
+        })
+
+    # Mismas reglas que el dashboard: Activo, Suspendido, y DEMO = Activo con paquete '%demo%'
+    es_activo = Suscripcion.status == 'Activo'
+    suscripciones = db.session.query(
+        Cliente.pais, Suscripcion.server,
+        func.sum(case((es_activo, 1), else_=0)),
+        func.sum(case((Suscripcion.status == 'Suspendido', 1), else_=0)),
+        func.sum(case((and_(es_activo, Suscripcion.paquete.ilike('%demo%')), 1), else_=0)),
+    ).join(Cliente, Cliente.id == Suscripcion.cliente_id).group_by(Cliente.pais, Suscripcion.server)
+    for pais, server, activos, suspendidos, demos in suscripciones:
+        f = fila(pais, server)
+        f['clientes_activos'], f['suspendidos'], f['demos_activos'] = int(activos or 0), int(suspendidos or 0), int(demos or 0)
+
+    R = ResumenIngresosMensual
+    pagos = db.session.query(
+        R.pais, R.server, func.sum(R.num_pagos),
+        func.sum(case((R.factura_pago.is_(True), R.num_pagos), else_=0)),
+        func.sum(R.monto_mxn_total),
+    ).filter(R.anio == fecha.year, R.mes == fecha.month).group_by(R.pais, R.server)
+    for pais, server, num, facturados, ingresos in pagos:
+        f = fila(pais, server)
+        f['num_pagos_mes'], f['pagos_facturados_mes'] = int(num or 0), int(facturados or 0)
+        f['ingresos_mes_mxn'] = Decimal(str(ingresos or 0))
+
+    return list(filas.values())
+
+
+@app.cli.command('kpi-snapshot')
+def kpi_snapshot_cmd():
+    """Guarda la foto de KPIs de hoy por país y servidor (idempotente: reemplaza la de hoy). Para cron."""
+    hoy = date.today()
+    filas = calcular_kpi_snapshot(hoy)
+    KpiSnapshot.query.filter(KpiSnapshot.fecha == hoy).delete(synchronize_session=False)
+    if filas:
+        db.session.execute(KpiSnapshot.__table__.insert(), filas)
+        _marcar_tablas_modificadas(db.session, {'kpi_snapshot'})
+    db.session.commit()
+    print(f"✅ kpi_snapshot {hoy}: {len(filas)} filas (país x servidor).")
+
+
+@app.route('/api/kpi_historico')
+@login_required
+@etag_por_versiones('kpi_snapshot')
+def api_kpi_historico():
+    """
+    Serie diaria de KPIs desde kpi_snapshot (sumando los países/servidores que coincidan).
+    Parámetros: desde, hasta (YYYY-MM-DD; default últimos 90 días), pais, server.
+    """
+    try:
+        hasta = date.fromisoformat(request.args['hasta']) if request.args.get('hasta') else date.today()
+        desde = date.fromisoformat(request.args['desde']) if request.args.get('desde') else hasta - timedelta(days=90)
+    except ValueError:
+        return jsonify({"error": "Fechas inválidas (YYYY-MM-DD)."}), 400
+    pais = request.args.get('pais')
+    server = request.args.get('server')
+
+    K = KpiSnapshot
+    q = db.session.query(
+        K.fecha,
+        func.sum(K.clientes_activos), func.sum(K.suspendidos), func.sum(K.demos_activos),
+        func.sum(K.num_pagos_mes), func.sum(K.pagos_facturados_mes), func.sum(K.ingresos_mes_mxn),
+    ).filter(K.fecha.between(desde, hasta))
+    if pais: q = q.filter(K.pais == pais)
+    if server: q = q.filter(K.server == server)
+
+    labels = []
+    series = {k: [] for k in ('clientes_activos', 'suspendidos', 'demos_activos', 'num_pagos_mes', 'pct_facturado', 'ingresos_mes_mxn')}
+    for fecha, activos, suspendidos, demos, num, facturados, ingresos in q.group_by(K.fecha).order_by(K.fecha):
+        labels.append(fecha.isoformat())
+        series['clientes_activos'].append(int(activos or 0))
+        series['suspendidos'].append(int(suspendidos or 0))
+        series['demos_activos'].append(int(demos or 0))
+        series['num_pagos_mes'].append(int(num or 0))
+        series['pct_facturado'].append(round((facturados or 0) / num * 100) if num else 0)
+        series['ingresos_mes_mxn'].append(round(float(ingresos or 0), 2))
+
+    return jsonify({"labels": labels, "series": series})
+
+
+# =======================================================
+# LEDGER DE PERIODOS (suscripcion_periodo): consultas "a la fecha"
+# =======================================================
+
+def _fecha_param(nombre, default=None):
+    valor = request.args.get(nombre)
+    return date.fromisoformat(valor) if valor else default
+
+
+def _periodos_vigentes_en(fecha):
+    """Condición: el periodo cubre `fecha` (rango sobre ix_suscripcion_periodo_inicio_fin)."""
+    sp = SuscripcionPeriodo
+    return and_(sp.periodo_inicio <= fecha, sp.periodo_fin >= fecha)
+
+
+def _filtrar_por_cliente_resumen(stmt, pais, server):
+    """pais / server actuales del cliente (el ledger no guarda su historia)."""
+    if pais or server:
+        stmt = stmt.join(ClienteResumen, ClienteResumen.cliente_id == SuscripcionPeriodo.cliente_id)
+        if pais: stmt = stmt.where(ClienteResumen.pais == pais)
+        if server: stmt = stmt.where(ClienteResumen.server == server)
+    return stmt
+
+
+@app.route('/api/periodos/activos')
+@login_required
+@etag_por_versiones('pago', 'cliente', 'suscripcion')
+def api_periodos_activos():
+    """
+    Clientes con un periodo pagado que cubre la fecha (?fecha=YYYY-MM-DD, default hoy).
+    Filtros opcionales: pais, server.
+    """
+    from sqlalchemy import select
+
+    try:
+        fecha = _fecha_param('fecha', date.today())
+    except ValueError:
+        return jsonify({"error": "Fecha inválida (YYYY-MM-DD)."}), 400
+
+    sp = SuscripcionPeriodo
+    ids = _filtrar_por_cliente_resumen(
+        select(sp.cliente_id).where(_periodos_vigentes_en(fecha)),
+        request.args.get('pais'), request.args.get('server')
+    ).distinct().subquery()
+    filas = db.session.execute(
+        select(ClienteResumen.cliente_id, ClienteResumen.negocio, ClienteResumen.pais, ClienteResumen.server,
+               ClienteResumen.paquete)
+        .join(ids, ids.c.cliente_id == ClienteResumen.cliente_id)
+        .order_by(ClienteResumen.negocio)
+    ).all()
+
+    por_pais = {}
+    for f in filas:
+        por_pais[f.pais or 'N/A'] = por_pais.get(f.pais or 'N/A', 0) + 1
+    return jsonify({
+        "fecha": fecha.isoformat(),
+        "total": len(filas),
+        "por_pais": por_pais,
+        "clientes": [
+            {"id": f.cliente_id, "negocio": f.negocio, "pais": f.pais, "server": f.server, "paquete": f.paquete}
+            for f in filas
+        ],
+    })
+
+
+@app.route('/api/periodos/mrr')
+@login_required
+@etag_por_versiones('pago', 'cliente', 'suscripcion')
+def api_periodos_mrr():
+    """
+    MRR (MXN) a una fecha: suma de monto_mxn / meses de la vigencia de los periodos que la cubren.
+    ?fecha=YYYY-MM-DD (default hoy), pais, server.
+    """
+    from sqlalchemy import select, case
+
+    try:
+        fecha = _fecha_param('fecha', date.today())
+    except ValueError:
+        return jsonify({"error": "Fecha inválida (YYYY-MM-DD)."}), 400
+
+    sp = SuscripcionPeriodo
+    meses = case(MESES_POR_VIGENCIA, value=func.upper(func.trim(Pago.vigencia)), else_=1)
+    stmt = _filtrar_por_cliente_resumen(
+        select(
+            func.coalesce(func.sum(Pago.monto_mxn / meses), 0),
+            func.count(func.distinct(sp.cliente_id)),
+        ).select_from(sp).join(Pago, Pago.id == sp.pago_id).where(_periodos_vigentes_en(fecha)),
+        request.args.get('pais'), request.args.get('server')
+    )
+    mrr, clientes = db.session.execute(stmt).one()
+    return jsonify({"fecha": fecha.isoformat(), "mrr_mxn": round(float(mrr or 0), 2), "clientes": int(clientes or 0)})
+
+
+@app.route('/api/periodos/huecos')
+@login_required
+@etag_por_versiones('pago', 'cliente', 'suscripcion')
+def api_periodos_huecos():
+    """
+    Huecos de cobertura: periodos que empiezan en [desde, hasta] más de un día después del fin
+    del periodo anterior del mismo cliente. ?desde, ?hasta (default últimos 365 días),
+    cliente_id, min_dias (días sin cobertura, default 1).
+    """
+    from sqlalchemy import select
+    from sqlalchemy.orm import aliased
+
+    try:
+        hasta = _fecha_param('hasta', date.today())
+        desde = _fecha_param('desde', hasta - timedelta(days=365))
+    except ValueError:
+        return jsonify({"error": "Fechas inválidas (YYYY-MM-DD)."}), 400
+    min_dias = request.args.get('min_dias', 1, type=int)
+    cliente_id = request.args.get('cliente_id', type=int)
+
+    sp = SuscripcionPeriodo
+    previo = aliased(SuscripcionPeriodo)
+    # Fin del periodo anterior: un seek por fila en ix_suscripcion_periodo_cliente_id_inicio
+    fin_anterior = (
+        select(previo.periodo_fin)
+        .where(previo.cliente_id == sp.cliente_id, previo.periodo_inicio < sp.periodo_inicio)
+        .order_by(previo.periodo_inicio.desc()).limit(1)
+        .scalar_subquery()
+    )
+    stmt = select(sp.cliente_id, sp.periodo_inicio, fin_anterior.label('fin_anterior')).where(
+        sp.periodo_inicio.between(desde, hasta)
+    )
+    if cliente_id:
+        stmt = stmt.where(sp.cliente_id == cliente_id)
+    sub = stmt.subquery()
+    filas = db.session.execute(
+        select(sub, ClienteResumen.negocio)
+        .join(ClienteResumen, ClienteResumen.cliente_id == sub.c.cliente_id, isouter=True)
+        .where(sub.c.fin_anterior.isnot(None), sub.c.periodo_inicio > sub.c.fin_anterior)
+        .order_by(sub.c.periodo_inicio, sub.c.cliente_id)
+    ).all()
+
+    huecos = []
+    for f in filas:
+        dias = (f.periodo_inicio - f.fin_anterior).days - 1
+        if dias >= min_dias:
+            huecos.append({
+                "cliente_id": f.cliente_id, "negocio": f.negocio,
+                "sin_cobertura_desde": (f.fin_anterior + timedelta(days=1)).isoformat(),
+                "retoma": f.periodo_inicio.isoformat(), "dias": dias,
+            })
+    return jsonify({"desde": desde.isoformat(), "hasta": hasta.isoformat(), "total": len(huecos), "huecos": huecos})
+
+
+# =======================================================
+# MOTOR ANALÍTICO (pandas) - ver analitica.py
+# =======================================================
+# 'sql' (default) o 'pandas': con qué motor calcula /api/dashboard_data si no se pide ?motor=
+app.config.setdefault('DASHBOARD_MOTOR', os.environ.get('DASHBOARD_MOTOR', 'sql'))
+
+motor_analitico = analitica.MotorAnalitico()
+
+ANALISIS_DISPONIBLES = {
+    'percentiles': analitica.percentiles_montos,
+    'ltv': analitica.ltv_por_cliente,
+    'ingresos_servidor': analitica.ingresos_por_servidor,
+}
+
+
+def datos_analiticos():
+    """DataFrames de pagos ACTIVOS y suscripciones, recargados solo cuando cambian las versiones."""
+    from sqlalchemy import select
+
+    def cargar():
+        # Mismos joins que el dashboard: pago -> cliente (obligatorio) -> suscripción (opcional)
+        stmt_pagos = select(
+            Pago.id.label('pago_id'), Pago.cliente_id, Pago.fecha_pago, Pago.monto, Pago.monto_mxn,
+            Pago.moneda, Pago.vigencia, Pago.metodo_pago, Pago.factura_pago, Pago.paquete,
+            Cliente.pais, Suscripcion.server,
+        ).join(Cliente, Pago.cliente_id == Cliente.id).outerjoin(
+            Suscripcion, Pago.cliente_id == Suscripcion.cliente_id
+        ).where(Pago.status == 'ACTIVO')
+        stmt_suscripciones = select(
+            Suscripcion.id.label('suscripcion_id'), Suscripcion.cliente_id, Suscripcion.status,
+            Suscripcion.server, Suscripcion.paquete, Suscripcion.fecha_inicio, Cliente.pais,
+        ).join(Cliente, Cliente.id == Suscripcion.cliente_id)
+        with db.engine.connect() as conexion:
+            return analitica.cargar_datos(conexion, stmt_pagos, stmt_suscripciones)
+
+    version = tuple(sorted(obtener_versiones(('pago', 'cliente', 'suscripcion')).items()))
+    return motor_analitico.datos(version, cargar)
+
+
+@al_confirmar_cambios('pago', 'cliente', 'suscripcion')
+def _invalidar_motor_analitico():
+    motor_analitico.invalidar()
+
+
+def dashboard_con_pandas(anio, mes, pais, server, paquete, tendencia_meses, granularidad):
+    """Mismo JSON que /api/dashboard_data, calculado con analitica.py. Devuelve (datos, tiempos)."""
+    import time
+    t0 = time.perf_counter()
+    datos = datos_analiticos()
+    t_carga = time.perf_counter()
+
+    final_data = analitica.agregados_dashboard(
+        datos, date.today(), anio=anio, mes=mes, pais=pais, server=server, paquete=paquete
+    )
+    meses, granularidad, desde, hasta = _ventana_tendencia(tendencia_meses, granularidad)
+    ingresos = analitica.ingresos_por_periodo(
+        datos, desde, hasta, granularidad, pais=pais, server=server, paquete=paquete
+    )
+    labels, data = _eje_tendencia(ingresos, desde, hasta, meses, granularidad)
+    final_data["ventas"] = {"labels": labels, "data": data}
+
+    fin = time.perf_counter()
+    return final_data, {
+        'carga': round((t_carga - t0) * 1000, 1),
+        'agregados': round((fin - t_carga) * 1000, 1),
+        'total': round((fin - t0) * 1000, 1),
+        'modo': 'pandas',
+    }
+
+
+@app.route('/api/analitica/<nombre>')
+@login_required
+@etag_por_versiones('pago', 'cliente', 'suscripcion')
+def api_analitica(nombre):
+    """
+    Análisis sobre los DataFrames del motor pandas: percentiles | ltv | ingresos_servidor.
+    Acepta los filtros del dashboard: anio, mes, pais, server, paquete (y limite para ltv).
+    """
+    analisis = ANALISIS_DISPONIBLES.get(nombre)
+    if analisis is None:
+        return jsonify({"error": f"Análisis desconocido. Opciones: {', '.join(ANALISIS_DISPONIBLES)}"}), 404
+
+    filtros = {
+        'anio': request.args.get('anio', type=int),
+        'mes': request.args.get('mes', type=int),
+        'pais': request.args.get('pais') or None,
+        'server': request.args.get('server') or None,
+        'paquete': request.args.get('paquete') or None,
+    }
+    if nombre == 'ltv':
+        filtros['limite'] = min(request.args.get('limite', 50, type=int), 1000)
+    try:
+        return jsonify(analisis(datos_analiticos(), **filtros))
+    except Exception:
+        current_app.logger.error(f"Error en api_analitica({nombre}): {traceback.format_exc()}")
+        return jsonify({"error": "Error interno al calcular el análisis."}), 500
+
+
 @app.route('/api/dashboard_data')
 @login_required
+@etag_por_versiones('pago', 'cliente', 'suscripcion')
 def api_dashboard_data():
     from sqlalchemy import func, extract, and_
     from datetime import date
@@ -2418,134 +4725,181 @@ def api_dashboard_data():
         pais_filtro = request.args.get('pais')
         server_filtro = request.args.get('server')
         paquete_filtro = request.args.get('paquete')
-        
-        # --- 2. CONSULTA BASE DE PAGOS (Filtrada) ---
-        q_pagos = db.session.query(Pago).join(Cliente, Pago.cliente_id == Cliente.id).outerjoin(Suscripcion, Pago.cliente_id == Suscripcion.cliente_id).filter(Pago.status == 'ACTIVO')
-        
-        if anio_filtro:
-            q_pagos = q_pagos.filter(extract('year', Pago.fecha_pago) == anio_filtro)
-        if mes_filtro:
-            q_pagos = q_pagos.filter(extract('month', Pago.fecha_pago) == mes_filtro)
-        
-        # Aplicar filtros de Suscripcion/Cliente a los Pagos
-        if pais_filtro:
-            q_pagos = q_pagos.filter(Cliente.pais == pais_filtro)
-        if server_filtro:
-            q_pagos = q_pagos.filter(Suscripcion.server == server_filtro)
-        if paquete_filtro:
-            q_pagos = q_pagos.filter(Pago.paquete.ilike(f'%{paquete_filtro}%'))
+        tendencia_meses = request.args.get('tendencia_meses', 6, type=int)
+        granularidad = request.args.get('granularidad', 'mes')
 
+        # Motor pandas (opcional): agregados vectorizados sobre DataFrames cacheados por versión
+        motor = request.args.get('motor') or current_app.config['DASHBOARD_MOTOR']
 
-        # --- 3. CONSULTA BASE DE SUSCRIPCIONES ACTIVAS (Filtrada) ---
-        q_suscripciones_activas = db.session.query(Suscripcion).join(Cliente, Cliente.id == Suscripcion.cliente_id).filter(
-            Suscripcion.status == 'Activo'
+        # Cache de respuestas por combinación de filtros (normalizada) y motor
+        clave_cache = _clave_cache_dashboard(
+            anio_filtro, mes_filtro, pais_filtro, server_filtro, paquete_filtro, tendencia_meses, granularidad, motor
         )
-        # Aplicar filtros de Suscripcion/Cliente a las Suscripciones
-        if pais_filtro: q_suscripciones_activas = q_suscripciones_activas.filter(Cliente.pais == pais_filtro)
-        if server_filtro: q_suscripciones_activas = q_suscripciones_activas.filter(Suscripcion.server == server_filtro)
-        if paquete_filtro: q_suscripciones_activas = q_suscripciones_activas.filter(Suscripcion.paquete.ilike(f'%{paquete_filtro}%'))
+        en_cache = cache_dashboard.obtener(clave_cache)
+        if en_cache is not None:
+            return jsonify(en_cache)
 
-
-        # --- 4. CÁLCULO DE KPIS NUMÉRICOS ---
+        if motor == 'pandas':
+            final_data, tiempos = dashboard_con_pandas(
+                anio_filtro, mes_filtro, pais_filtro, server_filtro, paquete_filtro, tendencia_meses, granularidad
+            )
+            cache_dashboard.guardar(clave_cache, final_data)
+            return jsonify({**final_data, "tiempos": tiempos})
         
-        # A. Ingresos Totales y Segmentados (Suma y Conversión a MXN)
+        # --- 2. PAGOS: se leen del rollup resumen_ingresos_mensual (ver sección 4) ---
+
+
+        # --- 3. CONSULTAS BASE DE SUSCRIPCIONES (Filtradas) ---
+        # Se construyen al ejecutar cada sección: en modo paralelo cada hilo usa su propia sesión.
+        def q_suscripciones(*condiciones, filtrar_paquete=True):
+            q = db.session.query(Suscripcion).join(Cliente, Cliente.id == Suscripcion.cliente_id).filter(*condiciones)
+            # Aplicar filtros de Suscripcion/Cliente a las Suscripciones
+            if pais_filtro: q = q.filter(Cliente.pais == pais_filtro)
+            if server_filtro: q = q.filter(Suscripcion.server == server_filtro)
+            if paquete_filtro and filtrar_paquete: q = q.filter(Suscripcion.paquete.ilike(f'%{paquete_filtro}%'))
+            return q
+
+        def q_suscripciones_activas():
+            return q_suscripciones(Suscripcion.status == 'Activo')
+
+        # --- 4. CONSULTAS INDEPENDIENTES (en serie, o en paralelo con ?paralelo=1) ---
+
+        def seccion_pagos():
+            # 🔹 Un solo GROUP BY sobre el rollup mensual (resumen_ingresos_mensual), con los mismos
+            # filtros: unas decenas de filas (moneda x vigencia x método x facturado) sin tocar 'pago'.
+            R = ResumenIngresosMensual
+            q_rollup = db.session.query(
+                R.moneda, R.vigencia, R.metodo_pago, R.factura_pago,
+                func.sum(R.num_pagos), func.sum(R.monto_mxn_total)
+            )
+            if anio_filtro: q_rollup = q_rollup.filter(R.anio == anio_filtro)
+            if mes_filtro: q_rollup = q_rollup.filter(R.mes == mes_filtro)
+            if pais_filtro: q_rollup = q_rollup.filter(R.pais == pais_filtro)
+            if server_filtro: q_rollup = q_rollup.filter(R.server == server_filtro)
+            if paquete_filtro: q_rollup = q_rollup.filter(R.paquete.ilike(f'%{paquete_filtro}%'))
+            return q_rollup.group_by(R.moneda, R.vigencia, R.metodo_pago, R.factura_pago).all()
+
+        def seccion_activos():
+            return q_suscripciones_activas().count()
+
+        def seccion_suspendidos():
+            # Clientes Suspendidos (Aplicar los mismos filtros)
+            return q_suscripciones(Suscripcion.status == 'Suspendido').count()
+
+        def seccion_demos():
+            # NUEVO KPI 4: DEMOs Activos (Clientes 'En prueba' por PAQUETE)
+            # 🛑 CORRECCIÓN CRÍTICA: Filtra por PAQUETE.ilike('%demo%') Y STATUS == 'Activo'
+            # Solo aplicar filtro de paquete si el filtro ES 'Demo' o similar,
+            # pero como ya filtramos por '%demo%', solo nos interesa si el usuario NO ha filtrado por otro paquete.
+            # Si se filtra por 'Clínica', la cuenta de demos debe ser 0.
+            if paquete_filtro and 'demo' not in paquete_filtro.lower():
+                return 0
+            return q_suscripciones(
+                and_(Suscripcion.status == 'Activo', Suscripcion.paquete.ilike('%demo%')),
+                filtrar_paquete=False
+            ).count()
+
+        def seccion_antiguedad():
+            # Agrupado por fecha_inicio: una fila por fecha, no por suscripción
+            return q_suscripciones_activas().with_entities(
+                Suscripcion.fecha_inicio, func.count(Suscripcion.id)
+            ).group_by(Suscripcion.fecha_inicio).all()
+
+        def seccion_paquetes():
+            # NOTA: La lógica de aquí ya debe incluir los paquetes 'Demo' si su status es 'Activo'
+            return db.session.query(Suscripcion.paquete, func.count(Suscripcion.id)).filter(
+                Suscripcion.id.in_(q_suscripciones_activas().with_entities(Suscripcion.id))
+            ).group_by(Suscripcion.paquete).all()
+
+        def seccion_servidores():
+            return db.session.query(Suscripcion.server, func.count(Suscripcion.id)).filter(
+                Suscripcion.id.in_(q_suscripciones_activas().with_entities(Suscripcion.id))
+            ).group_by(Suscripcion.server).order_by(func.count(Suscripcion.id).desc()).all()
+
+        def seccion_tendencia():
+            # Tendencia de Ventas (por defecto últimos 6 meses, por mes) - Una sola consulta agrupada
+            return calcular_tendencia_ventas(
+                tendencia_meses, granularidad,
+                pais=pais_filtro, server=server_filtro, paquete=paquete_filtro
+            )
+
+        paralelo = request.args.get('paralelo', type=int)
+        if paralelo is None:
+            paralelo = current_app.config['DASHBOARD_PARALELO']
+        res, tiempos = ejecutar_secciones({
+            'pagos': seccion_pagos,
+            'activos': seccion_activos,
+            'suspendidos': seccion_suspendidos,
+            'demos': seccion_demos,
+            'antiguedad': seccion_antiguedad,
+            'paquetes': seccion_paquetes,
+            'servidores': seccion_servidores,
+            'tendencia': seccion_tendencia,
+        }, paralelo=bool(paralelo))
+
+        # --- 5. CÁLCULO DE KPIS Y GRÁFICAS (en memoria, sobre pocas filas) ---
+
+        # A. Ingresos Totales y Segmentados (ya en MXN)
         total_ingresos_mxn = 0.0          # Ingresos Totales (Global)
         ingresos_mx_only = 0.0            # NUEVO: Ingresos solo en MXN
         ingresos_latam_mxn = 0.0          # NUEVO: Ingresos de otras monedas (COP, USD, etc.) convertidos a MXN
-        pagos_filtrados = q_pagos.all()
-        
-        for pago in pagos_filtrados:
-            monto_mxn = convertir_a_mxn(pago.monto, pago.moneda)
+        total_payments_count = 0          # NUEVO KPI 3: Número de Pagos
+        total_pagos_facturados = 0
+        vigencias_temp = {}
+        metodos_temp = {}
+
+        for moneda, vigencia, metodo, facturado, conteo, suma_mxn in res['pagos']:
+            monto_mxn = float(suma_mxn or 0)  # Ya convertido con la tasa histórica de cada pago
             total_ingresos_mxn += monto_mxn
-            
-            moneda_check = (pago.moneda or '').upper().strip()
-            
+
+            moneda_check = (moneda or '').upper().strip()
+
             if moneda_check == 'MXN':
                 ingresos_mx_only += monto_mxn
             else:
                 # Todo lo que no sea MXN se considera LATAM/Otro (convertido a MXN)
                 ingresos_latam_mxn += monto_mxn
-        
-        # NUEVO KPI 3: Número de Pagos
-        total_payments_count = len(pagos_filtrados)
 
-        # B. Clientes Activos y Suspendidos
-        total_clientes_activos = q_suscripciones_activas.count()
-        
-        # Clientes Suspendidos (Aplicar los mismos filtros)
-        q_suspendidos = db.session.query(Suscripcion).join(Cliente, Cliente.id == Suscripcion.cliente_id).filter(Suscripcion.status == 'Suspendido')
-        if pais_filtro: q_suspendidos = q_suspendidos.filter(Cliente.pais == pais_filtro)
-        if server_filtro: q_suspendidos = q_suspendidos.filter(Suscripcion.server == server_filtro)
-        if paquete_filtro: q_suspendidos = q_suspendidos.filter(Suscripcion.paquete.ilike(f'%{paquete_filtro}%'))
-        total_suspendidos = q_suspendidos.count()
+            total_payments_count += conteo
+            if facturado:
+                total_pagos_facturados += conteo
 
-        # NUEVO KPI 4: DEMOs Activos (Clientes 'En prueba' por PAQUETE)
-        # 🛑 CORRECCIÓN CRÍTICA: Filtra por PAQUETE.ilike('%demo%') Y STATUS == 'Activo'
-        q_demos_activos = db.session.query(Suscripcion).join(Cliente, Cliente.id == Suscripcion.cliente_id).filter(
-            # Debe ser activo Y el nombre del paquete debe contener 'demo'
-            and_(
-                Suscripcion.status == 'Activo',
-                Suscripcion.paquete.ilike('%demo%')
-            )
-        )
-        # Aplicar filtros de localización/servidor
-        if pais_filtro: q_demos_activos = q_demos_activos.filter(Cliente.pais == pais_filtro)
-        if server_filtro: q_demos_activos = q_demos_activos.filter(Suscripcion.server == server_filtro)
-        
-        # Solo aplicar filtro de paquete si el filtro ES 'Demo' o similar,
-        # pero como ya filtramos por '%demo%', solo nos interesa si el usuario NO ha filtrado por otro paquete.
-        # Si se filtra por 'Clínica', la cuenta de demos debe ser 0.
-        if paquete_filtro and 'demo' not in paquete_filtro.lower():
-            # Si el usuario filtra por un paquete que NO es demo, el conteo de demos debe ser 0.
-            total_demos_activos = 0
-        else:
-            total_demos_activos = q_demos_activos.count()
+            vig = vigencia or 'N/A'
+            vigencias_temp[vig] = vigencias_temp.get(vig, 0) + conteo
+            met = metodo or 'Otro'
+            metodos_temp[met] = metodos_temp.get(met, 0) + conteo
 
+        # B. Clientes Activos, Suspendidos y DEMOs
+        total_clientes_activos = res['activos']
+        total_suspendidos = res['suspendidos']
+        total_demos_activos = res['demos']
 
-        # C. Antigüedad Promedio (Calculado en memoria con la query filtrada)
+        # C. Antigüedad Promedio
         total_antiguedad_dias = 0
-        clientes_antiguedad = q_suscripciones_activas.all() 
-        
         hoy = date.today()
-        for sus in clientes_antiguedad:
+        for fecha_inicio, conteo in res['antiguedad']:
             # 🛑 FIX: Manejar fecha_inicio nula
-            if sus.fecha_inicio:
-                dias_activo = (hoy - sus.fecha_inicio).days
-                total_antiguedad_dias += dias_activo
+            if fecha_inicio:
+                total_antiguedad_dias += (hoy - fecha_inicio).days * conteo
 
         antiguedad_promedio_meses = 0
         if total_clientes_activos > 0:
             antiguedad_promedio_meses = round((total_antiguedad_dias / total_clientes_activos) / 30.44, 1)
 
         # D. Porcentaje Facturado
-        total_pagos_conteo = len(pagos_filtrados) 
-        total_pagos_facturados = sum(1 for p in pagos_filtrados if p.factura_pago)
+        total_pagos_conteo = total_payments_count
         pct_facturado = 0
         if total_pagos_conteo > 0:
             pct_facturado = round((total_pagos_facturados / total_pagos_conteo) * 100)
 
+        # E. Top Vigencias (Pagos) - Ya agregadas en el GROUP BY de pagos
+        vigencias_data = dict(sorted(vigencias_temp.items(), key=lambda kv: (-kv[1], kv[0])))
 
-        # --- 5. GRÁFICAS DE DISTRIBUCIÓN (Agrupaciones eficientes) ---
-
-        # E. Top Vigencias (Pagos) - Usamos la lista 'pagos_filtrados' en memoria
-        vigencias_temp = {}
-        for pago in pagos_filtrados:
-            vig = pago.vigencia or 'N/A'
-            vigencias_temp[vig] = vigencias_temp.get(vig, 0) + 1
-        vigencias_data = vigencias_temp
-
-        # F. Top Paquetes (Suscripciones Activas) - Agrupación en DB (más eficiente)
-        # NOTA: La lógica de aquí ya debe incluir los paquetes 'Demo' si su status es 'Activo'
-        paquetes_raw = db.session.query(Suscripcion.paquete, func.count(Suscripcion.id)).filter(
-            Suscripcion.id.in_(
-                q_suscripciones_activas.with_entities(Suscripcion.id).subquery()
-            )
-        ).group_by(Suscripcion.paquete).all()
-
+        # F. Top Paquetes (Suscripciones Activas)
         paquetes_labels = ['Abeja', 'Clínica', 'Iguana', 'Chango', 'Elefante', 'Demo']
         paquetes_data = [0] * len(paquetes_labels)
         
-        for nombre, count in paquetes_raw:
+        for nombre, count in res['paquetes']:
             if not nombre: continue
             nombre_clean = nombre.split(' ')[0].strip()
             # 🛑 Para la gráfica, cualquier paquete que contenga 'Demo' lo mapeamos al índice 'Demo'
@@ -2559,50 +4913,14 @@ def api_dashboard_data():
                 # Si es un paquete no mapeado, lo ignoramos de la gráfica de top paquetes
                 pass 
 
-        # G. Métodos de Pago - Usamos la lista 'pagos_filtrados' en memoria
-        metodos_temp = {}
-        for pago in pagos_filtrados:
-            metodo = pago.metodo_pago or 'Otro'
-            metodos_temp[metodo] = metodos_temp.get(metodo, 0) + 1
-        metodos_data = metodos_temp
-
-        # H. Carga por Servidor - Agrupación en DB (más eficiente)
-        servidores_raw = db.session.query(Suscripcion.server, func.count(Suscripcion.id)).filter(
-            Suscripcion.id.in_(
-                q_suscripciones_activas.with_entities(Suscripcion.id).subquery()
-            )
-        ).group_by(Suscripcion.server).order_by(func.count(Suscripcion.id).desc()).all()
-        servidores_data = {s[0] or 'N/A': s[1] for s in servidores_raw}
+        # G. Métodos de Pago - Ya agregados en el GROUP BY de pagos
+        metodos_data = dict(sorted(metodos_temp.items(), key=lambda kv: (-kv[1], kv[0])))
 
-        # I. Tendencia de Ventas (Últimos 6 meses) - Usa la base 'q_pagos' para aplicar filtros
-        tendencia = []
-        meses_tendencia = []
-        
-        hoy = date.today()
-        for i in range(6):
-            target_date = hoy - relativedelta(months=5 - i)
-            target_month = target_date.month
-            target_year = target_date.year
-            
-            q_tendencia = db.session.query(Pago).filter(
-                Pago.status == 'ACTIVO',
-                extract('year', Pago.fecha_pago) == target_year,
-                extract('month', Pago.fecha_pago) == target_month
-            ).join(Cliente, Pago.cliente_id == Cliente.id).outerjoin(Suscripcion, Pago.cliente_id == Suscripcion.cliente_id)
-
-            if pais_filtro: q_tendencia = q_tendencia.filter(Cliente.pais == pais_filtro)
-            if server_filtro: q_tendencia = q_tendencia.filter(Suscripcion.server == server_filtro)
-            if paquete_filtro: q_tendencia = q_tendencia.filter(Pago.paquete.ilike(f'%{paquete_filtro}%'))
-            
-            pagos_mes = q_tendencia.all()
-            
-            ingresos_mes = 0.0
-            for pago in pagos_mes:
-                ingresos_mes += convertir_a_mxn(pago.monto, pago.moneda)
-            
-            mes_str = target_date.strftime('%b')
-            meses_tendencia.append(mes_str)
-            tendencia.append(round(ingresos_mes))
+        # H. Carga por Servidor
+        servidores_data = {s[0] or 'N/A': s[1] for s in res['servidores']}
+
+        # I. Tendencia de Ventas
+        meses_tendencia, tendencia = res['tendencia']
 
         # --- 6. ARMADO DEL JSON FINAL ---
         final_data = {
@@ -2645,7 +4963,9 @@ def api_dashboard_data():
             }
         }
         
-        return jsonify(final_data)
+        cache_dashboard.guardar(clave_cache, final_data)
+        # Tiempos por sección (ms): solo en respuestas calculadas, no se guardan en cache
+        return jsonify({**final_data, "tiempos": tiempos})
 
     except Exception as e:
         # 🛑 CRÍTICO: Capturamos la excepción, la logueamos y devolvemos un JSON de error
@@ -2668,6 +4988,7 @@ def api_dashboard_data():
 
 @app.route('/api/pago/<int:id_pago>')
 @login_required
+@etag_por_versiones('pago', 'cliente', 'paquete_precio')
 def api_get_pago(id_pago):
     """ Devuelve los detalles de un pago específico para el modal de edición. """
     pago = Pago.query.get_or_404(id_pago)
@@ -2780,21 +5101,24 @@ def soft_delete_pago(pago_id):
     if not pago:
         return jsonify({"ok": False, "error": "Pago no encontrado"}), 404
     
-    # Obtener el cliente ID antes de la eliminación lógica
+    # Obtener el cliente ID (y la fecha desde la que se recalcula) antes de la eliminación lógica
     cliente_id = pago.cliente_id
+    fecha_pago = pago.fecha_pago
     
     try:
         # 1. SOFT DELETE: Usamos el campo 'status' para marcar como CANCELADO
         pago.status = 'CANCELADO' 
         
-        # IMPORTANTE: Guardamos el estado de cancelado ANTES de recalcular
+        # IMPORTANTE: El recálculo hace flush del cancelado antes de leer los pagos
         db.session.add(pago) 
-        db.session.commit() 
 
-        # 2. RECALCULAR TODO EL HISTORIAL (CORRECCIÓN AQUÍ)
-        recalcular_vigencia_cliente(cliente_id)
+        # 2. RECALCULAR EL HISTORIAL desde el pago cancelado en adelante
+        recalcular_vigencia_cliente(cliente_id, desde=fecha_pago)
+
+        # 3. Un solo commit: cancelación y vigencia se confirman juntas
+        db.session.commit()
         
-        # 3. Respuesta
+        # 4. Respuesta
         return jsonify({"ok": True, "message": "Pago cancelado y fechas recalculadas correctamente."})
 
     except Exception as e:
@@ -2853,6 +5177,7 @@ def clientes_por_vencer_list():
 
 @app.route('/api/clientes_por_vencer_dt')
 @login_required
+@etag_por_versiones('cliente', 'suscripcion')
 def api_clientes_por_vencer_dt():
     
     try:
@@ -2863,35 +5188,58 @@ def api_clientes_por_vencer_dt():
         server_filtro = request.args.get('server')
         pais_filtro = request.args.get('pais')
         mes_vencimiento = request.args.get('month')
+        anio_vencimiento = request.args.get('year', type=int) # Opcional: sin año, el mes se busca en todos los años
 
         # 2. Fechas
         hoy = date.today()
         fecha_limite = hoy + timedelta(days=15)
 
-        # 3. Consulta Base
-        base_query = db.session.query(Cliente, Suscripcion).outerjoin(Suscripcion, Cliente.id == Suscripcion.cliente_id).filter(
-            Suscripcion.id.isnot(None)
+        # 3. Consulta Base (modelo de lectura cliente_resumen, índice status+vence_en)
+        R = ClienteResumen
+        base_query = db.session.query(R).filter(
+            R.suscripcion_id.isnot(None)
         ).filter(
             and_(
-                Suscripcion.status == 'Activo',
-                ~Suscripcion.paquete.ilike('%DEMO%'),
-                Suscripcion.vence_en <= fecha_limite
+                R.status == 'Activo',
+                ~R.paquete.ilike('%DEMO%'),
+                R.vence_en <= fecha_limite
             )
         )
 
         # 4. Filtros Opcionales
         if server_filtro:
-            base_query = base_query.filter(Suscripcion.server == server_filtro)
+            base_query = base_query.filter(R.server == server_filtro)
         if pais_filtro:
-            base_query = base_query.filter(Cliente.pais == pais_filtro)
+            base_query = base_query.filter(R.pais == pais_filtro)
         if mes_vencimiento:
             try:
                 mes = int(mes_vencimiento)
-                base_query = base_query.filter(extract('month', Suscripcion.vence_en) == mes)
+                if anio_vencimiento:
+                    filtro_fecha = filtro_de_fechas(R.vence_en, anio=anio_vencimiento, mes=mes)
+                else:
+                    # Mes en cualquier año: un BETWEEN por año hasta la fecha límite
+                    anios = anios_de_columna(R.vence_en)
+                    if anios:
+                        anios = (anios[0], min(anios[1], fecha_limite.year))
+                    filtro_fecha = filtro_de_fechas(R.vence_en, mes=mes, anios=anios)
+                if filtro_fecha is not None:
+                    base_query = base_query.filter(filtro_fecha)
             except ValueError:
                 pass 
 
         # 5. Ejecución
+        if _formato_columnar():
+            columnas_q = base_query.with_entities(
+                R.cliente_id.label('id'), R.negocio, R.pais, R.nombre_contacto,
+                R.telefono, R.telefono_secundario_1,
+                R.telefono_secundario_2, R.telefono_secundario_3,
+                R.id_gumi, R.server, R.paquete,
+                R.status, R.vence_en
+            )
+            return _respuesta_columnar(
+                [d['name'] for d in columnas_q.column_descriptions], columnas_q.all()
+            )
+
         results = base_query.all()
         
         # Diccionario manual para meses en español (Evita problemas de idioma del servidor)
@@ -2902,8 +5250,8 @@ def api_clientes_por_vencer_dt():
 
         # 6. Formato
         data = []
-        for cliente, suscripcion in results:
-            fecha_vencimiento = suscripcion.vence_en
+        for r in results:
+            fecha_vencimiento = r.vence_en
             
             # Cálculo de días para color
             dias_restantes = (fecha_vencimiento - hoy).days if fecha_vencimiento else 999
@@ -2922,7 +5270,7 @@ def api_clientes_por_vencer_dt():
 
             # Teléfonos
             telefonos_display = ''
-            lista_tels = [cliente.telefono, cliente.telefono_secundario_1, cliente.telefono_secundario_2, cliente.telefono_secundario_3]
+            lista_tels = [r.telefono, r.telefono_secundario_1, r.telefono_secundario_2, r.telefono_secundario_3]
             for tel in lista_tels:
                 if tel:
                     num = ''.join(filter(str.isdigit, tel))
@@ -2931,15 +5279,15 @@ def api_clientes_por_vencer_dt():
                         telefonos_display += f'<div class="mb-1"><a href="https://wa.me/{num}" target="_blank" class="text-decoration-none fw-bold text-success"><i class="fa-brands fa-whatsapp"></i> {tel.strip()}</a></div>'
 
             data.append({
-                'id': cliente.id,
-                'negocio': cliente.negocio,
-                'pais': cliente.pais,
-                'nombre_contacto': cliente.nombre_contacto,
+                'id': r.cliente_id,
+                'negocio': r.negocio,
+                'pais': r.pais,
+                'nombre_contacto': r.nombre_contacto,
                 'telefonos_display': telefonos_display,
-                'id_gumi': suscripcion.id_gumi or 'N/A',
-                'server': suscripcion.server or 'N/A',
-                'paquete_nombre': suscripcion.paquete, 
-                'status': suscripcion.status, 
+                'id_gumi': r.id_gumi or 'N/A',
+                'server': r.server or 'N/A',
+                'paquete_nombre': r.paquete, 
+                'status': r.status, 
                 
                 # DATA CRÍTICA: 
                 # 1. Para ORDENAR correctamente usamos ISO (YYYY-MM-DD)
@@ -2965,12 +5313,7 @@ def conciliacion_list():
     try:
         # Obtener todos los años únicos de las transacciones
         # FIX: Ahora 'distinct' está importado globalmente
-        unique_years = db.session.query(
-            distinct(extract('year', BankTransaction.date))
-        ).filter(BankTransaction.date != None).all()
-        
-        # unique_years será una lista de tuplas, la convertimos a una lista de enteros
-        unique_years = sorted([int(y[0]) for y in unique_years if y[0] is not None], reverse=True)
+        unique_years = anios_con_datos(BankTransaction.date)
         
     except Exception:
         # Si la tabla está vacía o hay un error, usamos los años recientes
@@ -3177,23 +5520,138 @@ def conciliacion_importar():
     return render_template('conciliacion_importar.html')
 
 
-@app.route('/api/transacciones_pendientes_dt')
-@login_required
-def api_transacciones_pendientes_dt():
-    """API para DataTables de transacciones bancarias (Pendientes y Conciliadas)."""
+# Función de formato manual simple: Decimal a string con 2 decimales y coma de miles
+def format_decimal_to_str(d):
+    if d is None:
+        return "0.00"
+    try:
+        # Uso de ABS para asegurar que el débito se muestre positivo en la columna EGRESO
+        return f"{abs(Decimal(d)):,.2f}"
+    except Exception:
+         return "0.00"
+
+
+def _fila_transaccion_dt(row):
+    """Formatea una fila BankTransaction ⟕ Pago ⟕ Cliente para DataTables."""
+    # Aseguramos que los valores sean Decimal para la comparación
+    debit = row.debit if row.debit is not None else Decimal('0.00')
+    credit = row.credit if row.credit is not None else Decimal('0.00')
+    total_balance = row.total_balance if row.total_balance is not None else Decimal('0.00')
+    
+    is_ingreso = credit > Decimal('0.00')
+    
+    # Lógica de display para Negocio y Factura
     
-    # Función de formato manual simple: Decimal a string con 2 decimales y coma de miles
-    def format_decimal_to_str(d):
-        if d is None:
-            return "0.00"
+    # 1. Intenta usar los datos directamente de la Transacción Bancaria (para Sucursal/Exportación)
+    negocio_final = row.negocio_conciliado or 'N/A'
+    
+    # 🛑 INICIO DEL AJUSTE PARA QUITAR EL EMAIL 🛑
+    if negocio_final != 'N/A':
+        # La limpieza solo aplica si la información viene de 'negocio_conciliado'
+        
+        # Patrón para eliminar (Email) o [Email] o cualquier cosa entre paréntesis o corchetes
+        # Esto cubre el caso de Select2 que guarda 'Nombre (email)'
+        negocio_final = re.sub(r'\s*\(.*\)', '', negocio_final)
+        negocio_final = re.sub(r'\s*\[.*\]', '', negocio_final)
+        
+        # Patrón para eliminar cualquier cosa que parezca un correo después de un espacio o coma
+        # Esto cubre casos como 'Nombre, email@dominio.com'
+        if ',' in negocio_final:
+             negocio_final = negocio_final.split(',')[0].strip()
+            
+        negocio_final = negocio_final.strip() # Limpiamos cualquier espacio extra
+    # 🛑 FIN DEL AJUSTE PARA QUITAR EL EMAIL 🛑
+
+
+    factura_final = row.num_factura_conciliado or 'N/A'
+    
+    # 2. Si hay un Pago (Conciliación Clásica), sobreescribe con el nombre limpio del cliente
+    if row.pago_id and row.cliente_negocio:
+         negocio_final = row.cliente_negocio # Este ya debe ser solo el nombre
+         # ¡ESTA LÍNEA AHORA FUNCIONARÁ PORQUE 'numero_factura' FUE INCLUIDO EN EL SELECT!
+         factura_final = row.numero_factura or row.num_factura_conciliado or 'N/A' # Prefiere la factura del Pago si existe
+    
+    # 3. RFC/NIT se toma solo si hay un Pago (conciliación clásica)
+    rfc_final = row.rfc_nit or 'N/A' 
+
+
+    return {
+        'id': row.id,
+        'fecha_banco': row.date.strftime('%d-%m-%Y'),
+        'concepto': row.concept,
+        
+        # Datos de conciliación
+        'status': row.status, # Enviamos el status real de la Transacción Bancaria
+        'is_conciliated': row.is_conciliated,
+        'pago_id': row.pago_id, 
+        
+        # Valores formateados (String)
+        'egreso_str': format_decimal_to_str(debit),
+        'ingreso_str': format_decimal_to_str(credit), 
+        'total_str': format_decimal_to_str(total_balance),
+        
+        # Valores numéricos (Float para sort/export)
+        'egreso_num': float(debit),
+        'ingreso_num': float(credit),
+        'total_num': float(total_balance),
+        
+        # Datos conciliados (o pre-conciliados)
+        'negocio_conciliado': negocio_final, 
+        'num_factura_conciliado': factura_final,
+        'rfc_nit_conciliado': rfc_final, 
+        'is_ingreso': is_ingreso 
+    }
+
+
+# Filas que se piden a la DB por lote en las respuestas en streaming
+STREAM_YIELD_PER = 500
+
+
+def _stream_json_data(query, formatear_fila, columnas=None):
+    """
+    Genera {"data": [...]} fila por fila a partir de un Query con yield_per,
+    sin materializar el resultado completo en memoria.
+    Si se pasan columnas, emite el formato columnar {"columns": [...], "rows": [...]}.
+    """
+    from flask import Response, stream_with_context
+
+    if columnas is None:
+        apertura = '{"data":['
+    else:
+        apertura = '{"columns":' + current_app.json.dumps(list(columnas)) + ',"rows":['
+
+    def generar():
+        yield apertura
+        primero = True
         try:
-            # Uso de ABS para asegurar que el débito se muestre positivo en la columna EGRESO
-            return f"{abs(Decimal(d)):,.2f}"
+            for row in query.yield_per(STREAM_YIELD_PER):
+                fila_json = current_app.json.dumps(formatear_fila(row), separators=(',', ':'))
+                if primero:
+                    primero = False
+                    yield fila_json
+                else:
+                    yield ',' + fila_json
         except Exception:
-             return "0.00"
+            # Los headers (200) ya se enviaron: cerramos el JSON con un "error" explícito
+            # para que DataTables/el cliente no tomen la lista truncada como completa.
+            logger.error(f"Error durante el streaming de DataTables: {traceback.format_exc()}")
+            yield '],"error":"La respuesta se interrumpió por un error en el servidor; los datos están incompletos."}'
+            return
+        yield ']}'
+
+    return Response(stream_with_context(generar()), mimetype='application/json')
+
 
+@app.route('/api/transacciones_pendientes_dt')
+@login_required
+@etag_por_versiones('bank_transaction', 'pago', 'cliente')
+def api_transacciones_pendientes_dt():
+    """API para DataTables de transacciones bancarias (Pendientes y Conciliadas).
+    Con ?stream=1 la respuesta se escribe en streaming (yield_per) en vez de armarse completa.
+    """
     year = request.args.get('year', None, type=int)
     month = request.args.get('month', None, type=int)
+    streaming = request.args.get('stream', '').lower() in ('1', 'true', 'si', 'sí')
 
     # 1. Consulta SQL
     try:
@@ -3218,12 +5676,26 @@ def api_transacciones_pendientes_dt():
             Cliente, Pago.cliente_id == Cliente.id
         )
         
-        if year:
-            query = query.filter(db.extract('year', BankTransaction.date) == year)
-        if month:
-            query = query.filter(db.extract('month', BankTransaction.date) == month)
-            
-        transactions_data = query.order_by(db.desc(BankTransaction.date)).all()
+        filtro_fecha = filtro_de_fechas(BankTransaction.date, anio=year, mes=month)
+        if filtro_fecha is not None:
+            query = query.filter(filtro_fecha)
+
+        query = query.order_by(db.desc(BankTransaction.date))
+        columnar = _formato_columnar()
+
+        if streaming:
+            if columnar:
+                return _stream_json_data(
+                    query,
+                    lambda row: [_valor_crudo(v) for v in row],
+                    columnas=[d['name'] for d in query.column_descriptions]
+                )
+            return _stream_json_data(query, _fila_transaccion_dt)
+
+        transactions_data = query.all()
+
+        if columnar:
+            return _respuesta_columnar([d['name'] for d in query.column_descriptions], transactions_data)
         
     except Exception as e:
         logger.error(f"Error en la consulta de DataTables: {traceback.format_exc()}")
@@ -3231,77 +5703,7 @@ def api_transacciones_pendientes_dt():
 
 
     # 2. Procesamiento y Formato
-    data = []
-    
-    for row in transactions_data:
-        # Aseguramos que los valores sean Decimal para la comparación
-        debit = row.debit if row.debit is not None else Decimal('0.00')
-        credit = row.credit if row.credit is not None else Decimal('0.00')
-        total_balance = row.total_balance if row.total_balance is not None else Decimal('0.00')
-        
-        is_ingreso = credit > Decimal('0.00')
-        
-        # Lógica de display para Negocio y Factura
-        
-        # 1. Intenta usar los datos directamente de la Transacción Bancaria (para Sucursal/Exportación)
-        negocio_final = row.negocio_conciliado or 'N/A'
-        
-        # 🛑 INICIO DEL AJUSTE PARA QUITAR EL EMAIL 🛑
-        if negocio_final != 'N/A':
-            # La limpieza solo aplica si la información viene de 'negocio_conciliado'
-            
-            # Patrón para eliminar (Email) o [Email] o cualquier cosa entre paréntesis o corchetes
-            # Esto cubre el caso de Select2 que guarda 'Nombre (email)'
-            negocio_final = re.sub(r'\s*\(.*\)', '', negocio_final)
-            negocio_final = re.sub(r'\s*\[.*\]', '', negocio_final)
-            
-            # Patrón para eliminar cualquier cosa que parezca un correo después de un espacio o coma
-            # Esto cubre casos como 'Nombre, email@dominio.com'
-            if ',' in negocio_final:
-                 negocio_final = negocio_final.split(',')[0].strip()
-                
-            negocio_final = negocio_final.strip() # Limpiamos cualquier espacio extra
-        # 🛑 FIN DEL AJUSTE PARA QUITAR EL EMAIL 🛑
-
-
-        factura_final = row.num_factura_conciliado or 'N/A'
-        
-        # 2. Si hay un Pago (Conciliación Clásica), sobreescribe con el nombre limpio del cliente
-        if row.pago_id and row.cliente_negocio:
-             negocio_final = row.cliente_negocio # Este ya debe ser solo el nombre
-             # ¡ESTA LÍNEA AHORA FUNCIONARÁ PORQUE 'numero_factura' FUE INCLUIDO EN EL SELECT!
-             factura_final = row.numero_factura or row.num_factura_conciliado or 'N/A' # Prefiere la factura del Pago si existe
-        
-        # 3. RFC/NIT se toma solo si hay un Pago (conciliación clásica)
-        rfc_final = row.rfc_nit or 'N/A' 
-
-
-        data.append({
-            'id': row.id,
-            'fecha_banco': row.date.strftime('%d-%m-%Y'),
-            'concepto': row.concept,
-            
-            # Datos de conciliación
-            'status': row.status, # Enviamos el status real de la Transacción Bancaria
-            'is_conciliated': row.is_conciliated,
-            'pago_id': row.pago_id, 
-            
-            # Valores formateados (String)
-            'egreso_str': format_decimal_to_str(debit),
-            'ingreso_str': format_decimal_to_str(credit), 
-            'total_str': format_decimal_to_str(total_balance),
-            
-            # Valores numéricos (Float para sort/export)
-            'egreso_num': float(debit),
-            'ingreso_num': float(credit),
-            'total_num': float(total_balance),
-            
-            # Datos conciliados (o pre-conciliados)
-            'negocio_conciliado': negocio_final, 
-            'num_factura_conciliado': factura_final,
-            'rfc_nit_conciliado': rfc_final, 
-            'is_ingreso': is_ingreso 
-        })
+    data = [_fila_transaccion_dt(row) for row in transactions_data]
         
     return jsonify({'data': data})
 
@@ -3312,21 +5714,21 @@ def api_transacciones_pendientes_dt():
 @login_required
 @role_required(ROLES_MODIFICACION) # ADMIN o SUPERADMIN
 def transaccion_eliminar(transaccion_id):
-    """Elimina una BankTransaction por ID. También elimina el Pago asociado si existe."""
+    """Elimina una BankTransaction por ID. También elimina el Pago asociado si existe (todo en un commit)."""
     try:
         # Primero, buscar y eliminar el Pago asociado si existe
         pago = Pago.query.filter_by(bank_transaction_id=transaccion_id).first()
         if pago:
             # Si hay un pago asociado, marcamos el cliente para recalculo de vigencia
             cliente_id = pago.cliente_id
+            fecha_pago = pago.fecha_pago
             
             db.session.delete(pago)
-            db.session.commit()
             
-            # Si se eliminó el pago, re-calculamos la vigencia del cliente
-            recalcular_vigencia_cliente(cliente_id)
+            # Si se eliminó el pago, re-calculamos la vigencia del cliente (desde ese pago)
+            recalcular_vigencia_cliente(cliente_id, desde=fecha_pago)
 
-        # Luego, eliminar la BankTransaction
+        # Luego, eliminar la BankTransaction y confirmar todo junto
         transaccion = BankTransaction.query.get_or_404(transaccion_id)
         db.session.delete(transaccion)
         db.session.commit()
@@ -3391,6 +5793,8 @@ def pago_registrar():
         
         is_update = pago_existente is not None
         pago = pago_existente if is_update else Pago()
+        # Re-conciliación: el recálculo parte de la fecha menor (anterior o nueva)
+        recalcular_desde = min(fecha_pago, pago_existente.fecha_pago) if is_update else fecha_pago
 
         # 4. Asignar/Actualizar campos del Pago
         pago.nombre = cliente.nombre_contacto
@@ -3419,8 +5823,8 @@ def pago_registrar():
         transaccion.negocio_conciliado = cliente.negocio # Guardar el negocio en la transacción
         transaccion.num_factura_conciliado = num_factura # Guardar factura en la transacción
 
-        # 6. Recalcular Vigencia 
-        recalcular_vigencia_cliente(cliente_id)
+        # 6. Recalcular Vigencia (no confirma: un solo commit para pago, transacción y vigencia)
+        recalcular_vigencia_cliente(cliente_id, desde=recalcular_desde)
 
         db.session.commit()
         
@@ -3438,6 +5842,7 @@ def pago_registrar():
 # ----------------------------------------------------
 @app.route('/api/paquetes_list')
 @login_required
+@etag_por_versiones('paquete_precio')
 def api_paquetes_list():
     """Devuelve una lista simple de paquetes para ser usada en Select2 o modales.
     Utiliza el modelo PaquetePrecio para asegurar que solo se muestren los activos.
@@ -3467,6 +5872,7 @@ def api_paquetes_list():
 
 @app.route('/api/clientes/search')
 @login_required
+@etag_por_versiones('cliente', 'suscripcion')
 def api_clientes_search():
     """API para el Select2 en el modal de conciliación."""
     query = request.args.get('q', '', type=str)
@@ -3474,17 +5880,11 @@ def api_clientes_search():
     if len(query) < 3:
         return jsonify(results=[]) 
         
-    # Buscar clientes por negocio, contacto o email
-    clientes = Cliente.query.filter(
-        or_(
-            Cliente.negocio.ilike(f'%{query}%'), 
-            Cliente.nombre_contacto.ilike(f'%{query}%'), 
-            Cliente.mail.ilike(f'%{query}%')
-        )
-    ).limit(20).all()
+    # Buscar clientes por negocio, contacto, email, ID Gumi, RFC o teléfono (índice de búsqueda)
+    clientes = buscar_clientes(query, limite=20)
     
     results = [{
-        'id': c.id, 
+        'id': c.cliente_id, 
         'text': f"{c.negocio} ({c.nombre_contacto}) - {c.mail}"
     } for c in clientes]
     
@@ -3495,23 +5895,29 @@ def api_clientes_search():
 @app.route('/api/clientes/search_menu')
 @login_required
 def api_clientes_search_menu():
-    """API para el Buscador Rápido en el menú principal (Devuelve ID y texto)."""
+    """API para el Buscador Rápido en el menú principal (Devuelve ID y texto).
+    Con AUTOCOMPLETADO_EN_MEMORIA responde el índice del worker sin ETag (revalidar contra
+    cambio_version costaría justo el viaje a la DB que se evita); si no, va a la DB con ETag.
+    """
+    if current_app.config.get('AUTOCOMPLETADO_EN_MEMORIA'):
+        query = request.args.get('q', '', type=str)
+        return jsonify(indice_autocompletado.buscar(query, limite=10))
+
+    return _buscar_clientes_menu_db()
+
+
+@etag_por_versiones('cliente', 'suscripcion')
+def _buscar_clientes_menu_db():
     query = request.args.get('q', '', type=str)
     
     if len(query) < 3:
         return jsonify([]) # Devuelve un array vacío si la consulta es demasiado corta
         
-    # Buscar clientes por negocio, contacto, mail, o ID Gumi
-    clientes = Cliente.query.filter(
-        or_(
-            Cliente.negocio.ilike(f'%{query}%'), 
-            Cliente.nombre_contacto.ilike(f'%{query}%'), 
-            Cliente.mail.ilike(f'%{query}%')
-        )
-    ).limit(10).all() # Limitar a 10 resultados para no sobrecargar el menú
+    # Buscar clientes por negocio, contacto, mail, ID Gumi, RFC o teléfono
+    clientes = buscar_clientes(query, limite=10) # Limitar a 10 resultados para no sobrecargar el menú
     
     results = [{
-        'id': c.id, 
+        'id': c.cliente_id, 
         'negocio': c.negocio,
         'nombre_contacto': c.nombre_contacto
     } for c in clientes]
@@ -3521,6 +5927,7 @@ def api_clientes_search_menu():
 
 @app.route('/api/paquetes_by_country')
 @login_required
+@etag_por_versiones('paquete_precio')
 def api_paquetes_by_country():
     """Devuelve la lista de PaquetePrecio activos filtrados por país y moneda.
     Se usa para llenar el Select2 en el modal de conciliación.
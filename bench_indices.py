@@ -0,0 +1,167 @@
+"""
+Benchmark de los índices de rutas calientes (migración 7a2d5c9e1f34).
+
+Crea una base sintética, ejecuta las consultas de las rutas calientes SIN los índices
+nuevos y luego CON ellos, mostrando el plan (EXPLAIN) y el tiempo de cada una.
+
+Uso:
+    python bench_indices.py                      # SQLite temporal
+    BENCH_DATABASE_URL=postgresql://... python bench_indices.py   # ⚠️ borra y recrea las tablas
+    BENCH_CLIENTES=20000 python bench_indices.py
+"""
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, text
+
+from app import db
+
+INDICES_NUEVOS = [
+    ('bank_transaction', 'ix_bank_transaction_date'),
+    ('cliente', 'ix_cliente_negocio'),
+    ('pago', 'ix_pago_cliente_id_fecha_pago'),
+    ('pago', 'ix_pago_status_fecha_pago'),
+    ('pago', 'ix_pago_fecha_pago_activo'),
+    ('suscripcion', 'ix_suscripcion_cliente_id'),
+    ('suscripcion', 'ix_suscripcion_status_vence_en'),
+]
+
+CONSULTAS = {
+    'Pagos de un cliente': (
+        "SELECT id, fecha_pago, monto FROM pago WHERE cliente_id = :cid ORDER BY fecha_pago DESC",
+        {'cid': 1234},
+    ),
+    'Pagos ACTIVOS del mes (dashboard)': (
+        "SELECT SUM(monto) FROM pago WHERE status = 'ACTIVO' AND fecha_pago BETWEEN :ini AND :fin",
+        {'ini': date(2025, 3, 1), 'fin': date(2025, 3, 31)},
+    ),
+    'Listado global de pagos (primera página)': (
+        "SELECT id, fecha_pago FROM pago WHERE status = 'ACTIVO' ORDER BY fecha_pago DESC, id DESC LIMIT 50",
+        {},
+    ),
+    'Suscripción de un cliente': (
+        "SELECT * FROM suscripcion WHERE cliente_id = :cid",
+        {'cid': 1234},
+    ),
+    'Clientes por vencer': (
+        "SELECT cliente_id, vence_en FROM suscripcion WHERE status = 'Activo' AND vence_en BETWEEN :ini AND :fin",
+        {'ini': date(2025, 6, 1), 'fin': date(2025, 6, 30)},
+    ),
+    'Transacciones del mes': (
+        "SELECT id, date, credit FROM bank_transaction WHERE date BETWEEN :ini AND :fin ORDER BY date DESC",
+        {'ini': date(2025, 3, 1), 'fin': date(2025, 3, 31)},
+    ),
+    'Cliente por nombre de negocio': (
+        "SELECT id FROM cliente WHERE negocio = :negocio",
+        {'negocio': 'Negocio 01234'},
+    ),
+}
+
+
+def poblar(conn, n_clientes):
+    rnd = random.Random(42)
+    inicio = date(2022, 1, 1)
+    clientes, suscripciones, pagos, transacciones = [], [], [], []
+    pago_id = 1
+    for cid in range(1, n_clientes + 1):
+        clientes.append({
+            'id': cid, 'negocio': f'Negocio {cid:05d}', 'nombre_contacto': f'Contacto {cid}',
+            'mail': f'c{cid}@example.com', 'telefono': f'55{cid:08d}', 'pais': rnd.choice(['MÉXICO', 'COLOMBIA', 'LATAM']),
+        })
+        fecha_inicio = inicio + timedelta(days=rnd.randint(0, 900))
+        suscripciones.append({
+            'id': cid, 'cliente_id': cid, 'status': rnd.choice(['Activo'] * 6 + ['Suspendido', 'Eliminado', 'En prueba']),
+            'server': f'server{rnd.randint(1, 8)}', 'fecha_inicio': fecha_inicio, 'paquete': 'Básico',
+            'vigencia': 'Mensual', 'vence_en': fecha_inicio + timedelta(days=rnd.randint(30, 1200)),
+        })
+        for _ in range(rnd.randint(5, 30)):
+            pagos.append({
+                'id': pago_id, 'nombre': f'Contacto {cid}', 'correo': f'c{cid}@example.com',
+                'monto': rnd.randint(200, 5000), 'cliente_id': cid,
+                'fecha_pago': inicio + timedelta(days=rnd.randint(0, 1400)),
+                'status': 'ACTIVO' if rnd.random() < 0.9 else 'CANCELADO',
+            })
+            pago_id += 1
+    for tid in range(1, n_clientes * 5 + 1):
+        transacciones.append({
+            'id': tid, 'date': inicio + timedelta(days=rnd.randint(0, 1400)), 'concept': f'SPEI {tid}',
+            'credit': rnd.randint(200, 5000), 'status': 'PENDIENTE',
+        })
+
+    t = db.metadata.tables
+    conn.execute(t['cliente'].insert(), clientes)
+    conn.execute(t['suscripcion'].insert(), suscripciones)
+    conn.execute(t['pago'].insert(), pagos)
+    conn.execute(t['bank_transaction'].insert(), transacciones)
+    print(f"Datos: {len(clientes)} clientes, {len(pagos)} pagos, {len(transacciones)} transacciones")
+
+
+def plan(conn, sql, params):
+    if conn.dialect.name == 'sqlite':
+        filas = conn.execute(text('EXPLAIN QUERY PLAN ' + sql), params).fetchall()
+        return [f.detail for f in filas]
+    return [f[0] for f in conn.execute(text('EXPLAIN ' + sql), params).fetchall()]
+
+
+def medir(conn, sql, params, repeticiones=20):
+    t0 = time.perf_counter()
+    for _ in range(repeticiones):
+        conn.execute(text(sql), params).fetchall()
+    return (time.perf_counter() - t0) / repeticiones * 1000
+
+
+def correr(conn, etiqueta):
+    print(f"\n==================== {etiqueta} ====================")
+    resultados = {}
+    for nombre, (sql, params) in CONSULTAS.items():
+        ms = medir(conn, sql, params)
+        resultados[nombre] = ms
+        print(f"\n🔹 {nombre}: {ms:.3f} ms")
+        for linea in plan(conn, sql, params):
+            print(f"    {linea}")
+    return resultados
+
+
+def main():
+    url = os.environ.get('BENCH_DATABASE_URL')
+    if not url:
+        url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_indices.db')
+    n_clientes = int(os.environ.get('BENCH_CLIENTES', '5000'))
+    engine = create_engine(url)
+    print(f"Base: {engine.url.render_as_string(hide_password=True)}")
+
+    tablas = [db.metadata.tables[n] for n in ('paquete_precio', 'bank_transaction', 'cliente', 'pago', 'suscripcion')]
+    db.metadata.drop_all(engine, tables=tablas)
+    db.metadata.create_all(engine, tables=tablas)
+
+    with engine.begin() as conn:
+        for _, indice in INDICES_NUEVOS:
+            conn.execute(text(f'DROP INDEX IF EXISTS {indice}'))
+        poblar(conn, n_clientes)
+        conn.execute(text('ANALYZE'))
+
+    with engine.connect() as conn:
+        antes = correr(conn, 'SIN índices')
+
+    with engine.begin() as conn:
+        for tabla, indice in INDICES_NUEVOS:
+            idx = next(i for i in db.metadata.tables[tabla].indexes if i.name == indice)
+            idx.create(conn)
+        conn.execute(text('ANALYZE'))
+
+    with engine.connect() as conn:
+        despues = correr(conn, 'CON índices')
+
+    print("\n==================== Resumen ====================")
+    for nombre in CONSULTAS:
+        a, d = antes[nombre], despues[nombre]
+        print(f"{nombre:45s} {a:9.3f} ms -> {d:9.3f} ms  (x{a / d if d else float('inf'):.1f})")
+
+    db.metadata.drop_all(engine, tables=tablas)
+
+
+if __name__ == '__main__':
+    main()
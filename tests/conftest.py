@@ -0,0 +1,59 @@
+"""
+Fixtures de pytest: la app apunta a una base SQLite temporal (creada con create_all)
+y el cliente de pruebas entra con un usuario SUPERADMIN.
+"""
+import os
+import sys
+import tempfile
+from datetime import date
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+# Antes de importar app: nunca usar la DATABASE_URL del entorno en las pruebas
+_ARCHIVO_DB = tempfile.NamedTemporaryFile(prefix='pruebas_', suffix='.db', delete=False)
+_ARCHIVO_DB.close()
+os.environ['DATABASE_URL'] = 'sqlite:///' + _ARCHIVO_DB.name
+
+import pytest
+
+from app import app as flask_app, db, User, Cliente, Suscripcion, PaquetePrecio
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with flask_app.app_context():
+        db.create_all()
+        usuario = User(username='admin', role='SUPERADMIN')
+        usuario.set_password('admin')
+        db.session.add(usuario)
+        db.session.commit()
+    yield flask_app
+    os.remove(_ARCHIVO_DB.name)
+
+
+@pytest.fixture
+def client(app):
+    cliente_http = app.test_client()
+    cliente_http.post('/login', data={'username': 'admin', 'password': 'admin'})
+    return cliente_http
+
+
+@pytest.fixture
+def nuevo_cliente(app):
+    """Crea un cliente con suscripción y un paquete MENSUAL en MXN; devuelve (cliente_id, paquete_id)."""
+    def crear(negocio='Negocio de prueba', pais='MÉXICO'):
+        with app.app_context():
+            paquete = PaquetePrecio(pais=pais, paquete='Iguana', vigencia='MENSUAL', precio=650,
+                                    moneda='MXN', fecha_vigencia=date(2024, 1, 1))
+            cliente = Cliente(negocio=negocio, nombre_contacto='Contacto', mail='contacto@ejemplo.com',
+                              telefono='55 1234 5678', pais=pais)
+            db.session.add_all([paquete, cliente])
+            db.session.flush()
+            db.session.add(Suscripcion(cliente_id=cliente.id, id_gumi=f'G{cliente.id}', status='En prueba',
+                                       server='s1', fecha_inicio=date(2025, 1, 1), paquete='Iguana',
+                                       vigencia='MENSUAL'))
+            db.session.commit()
+            return cliente.id, paquete.id
+    return crear
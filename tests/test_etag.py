@@ -0,0 +1,30 @@
+"""ETag / If-None-Match de /api/clientes_dt (etag_por_versiones)."""
+
+
+def test_304_si_no_cambio_nada(client, nuevo_cliente):
+    nuevo_cliente('Negocio ETag 1')
+    r = client.get('/api/clientes_dt')
+    assert r.status_code == 200
+    etag = r.headers['ETag']
+
+    r = client.get('/api/clientes_dt', headers={'If-None-Match': etag})
+    assert r.status_code == 304
+    assert r.data == b''
+
+
+def test_etag_cambia_tras_escribir(client, nuevo_cliente):
+    cliente_id, _ = nuevo_cliente('Negocio ETag 2')
+    etag = client.get('/api/clientes_dt').headers['ETag']
+
+    assert client.post(f'/api/clientes/{cliente_id}/status', json={'status': 'Activo'}).get_json()['ok']
+
+    r = client.get('/api/clientes_dt', headers={'If-None-Match': etag})
+    assert r.status_code == 200
+    assert r.headers['ETag'] != etag
+    assert client.get('/api/clientes_dt', headers={'If-None-Match': r.headers['ETag']}).status_code == 304
+
+
+def test_etag_distinto_por_parametros(client):
+    a = client.get('/api/clientes_dt?start=0&length=10').headers['ETag']
+    b = client.get('/api/clientes_dt?start=10&length=10').headers['ETag']
+    assert a != b
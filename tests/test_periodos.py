@@ -0,0 +1,110 @@
+"""Periodos por pago (Pago.periodo_inicio / periodo_fin) en todas las rutas de escritura."""
+import pytest
+
+from app import db, Pago, SuscripcionPeriodo
+
+
+@pytest.fixture
+def nuevo_pago(client):
+    """Registra un pago por /api/pagos/nuevo (como el modal de clientes_list.html)."""
+    def registrar(cliente_id, paquete_id, fecha, monto=650):
+        return client.post('/api/pagos/nuevo', json={
+            'cliente_id': cliente_id, 'paquete_id': paquete_id, 'fecha_pago': fecha,
+            'metodo_pago': 'Transferencia', 'monto': monto, 'moneda': 'MXN',
+        })
+    return registrar
+
+
+def _periodos(app, cliente_id):
+    with app.app_context():
+        return [
+            (p.fecha_pago.isoformat(), p.periodo_inicio and p.periodo_inicio.isoformat(),
+             p.periodo_fin and p.periodo_fin.isoformat())
+            for p in Pago.query.filter_by(cliente_id=cliente_id).order_by(Pago.fecha_pago, Pago.id)
+        ]
+
+
+def test_pago_nuevo_guarda_periodos(app, nuevo_cliente, nuevo_pago):
+    cliente_id, paquete_id = nuevo_cliente('Negocio Periodos 1', pais='ARGENTINA')
+    for fecha in ('2025-01-10', '2025-02-10', '2025-03-10', '2025-04-10'):
+        assert nuevo_pago(cliente_id, paquete_id, fecha).get_json()['ok']
+
+    periodos = _periodos(app, cliente_id)
+    assert len(periodos) == 4
+    assert all(inicio and fin for _, inicio, fin in periodos)
+    assert periodos[2][1] <= '2025-03-15' <= periodos[2][2]
+
+
+def test_api_de_periodos_ve_los_pagos_nuevos(client, nuevo_cliente, nuevo_pago):
+    cliente_id, paquete_id = nuevo_cliente('Negocio Periodos 2', pais='URUGUAY')
+    for fecha in ('2025-02-10', '2025-03-10'):
+        assert nuevo_pago(cliente_id, paquete_id, fecha).get_json()['ok']
+
+    activos = client.get('/api/periodos/activos?fecha=2025-03-15&pais=URUGUAY').get_json()
+    assert activos['total'] == 1
+    assert activos['clientes'][0]['id'] == cliente_id
+
+    mrr = client.get('/api/periodos/mrr?fecha=2025-03-15&pais=URUGUAY').get_json()
+    assert mrr['clientes'] == 1
+    assert mrr['mrr_mxn'] == 650.0
+
+
+def test_editar_fecha_reacomoda_periodos(app, client, nuevo_cliente, nuevo_pago):
+    cliente_id, paquete_id = nuevo_cliente('Negocio Periodos 3', pais='CHILE')
+    for fecha in ('2025-01-10', '2025-02-10', '2025-03-10'):
+        assert nuevo_pago(cliente_id, paquete_id, fecha).get_json()['ok']
+    with app.app_context():
+        primero = db.session.execute(
+            db.select(Pago.id).where(Pago.cliente_id == cliente_id).order_by(Pago.fecha_pago)
+        ).scalars().first()
+
+    r = client.post(f'/api/pago/editar/{primero}', json={
+        'fecha_pago': '2025-05-10', 'monto': 650, 'metodo_pago': 'Transferencia', 'paquete': paquete_id,
+    })
+    assert r.get_json()['ok']
+
+    periodos = _periodos(app, cliente_id)
+    assert [f for f, _, _ in periodos] == ['2025-02-10', '2025-03-10', '2025-05-10']
+    assert all(inicio and fin for _, inicio, fin in periodos)
+    # Cada periodo empieza después (o al cierre) del anterior
+    assert all(periodos[i][1] >= periodos[i - 1][1] for i in range(1, len(periodos)))
+
+
+# ----- Ledger suscripcion_periodo -----
+
+def _ledger(app, cliente_id):
+    with app.app_context():
+        return sorted(
+            (sp.pago_id, sp.periodo_inicio, sp.periodo_fin)
+            for sp in SuscripcionPeriodo.query.filter_by(cliente_id=cliente_id)
+        )
+
+
+def _periodos_guardados(app, cliente_id):
+    with app.app_context():
+        return sorted(
+            (p.id, p.periodo_inicio, p.periodo_fin)
+            for p in Pago.query.filter(Pago.cliente_id == cliente_id, Pago.periodo_fin.isnot(None))
+        )
+
+
+def test_ledger_sigue_altas_ediciones_y_cancelaciones(app, client, nuevo_cliente, nuevo_pago):
+    cliente_id, paquete_id = nuevo_cliente('Negocio Ledger', pais='BOLIVIA')
+    for fecha in ('2025-01-10', '2025-02-10', '2025-03-10', '2025-04-10'):
+        assert nuevo_pago(cliente_id, paquete_id, fecha).get_json()['ok']
+    assert len(_ledger(app, cliente_id)) == 4
+    assert _ledger(app, cliente_id) == _periodos_guardados(app, cliente_id)
+
+    pago_id = _ledger(app, cliente_id)[1][0]
+    r = client.post(f'/api/pago/editar/{pago_id}', json={
+        'fecha_pago': '2025-06-01', 'monto': 650, 'metodo_pago': 'Transferencia', 'paquete': paquete_id,
+    })
+    assert r.get_json()['ok']
+    assert len(_ledger(app, cliente_id)) == 4
+    assert _ledger(app, cliente_id) == _periodos_guardados(app, cliente_id)
+
+    assert client.post(f'/api/pagos/{pago_id}/soft_delete').get_json()['ok']
+    ledger = _ledger(app, cliente_id)
+    assert pago_id not in [fila[0] for fila in ledger]
+    assert len(ledger) == 3
+    assert ledger == _periodos_guardados(app, cliente_id)
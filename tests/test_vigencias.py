@@ -0,0 +1,28 @@
+"""Propiedad de calcular_fechas_vigencia_lote: da lo mismo que la versión escalar (ver verificar_vigencias.py)."""
+import random
+
+import numpy as np
+
+from app import calcular_fechas_vigencia_lote
+from verificar_vigencias import generar, verificar
+
+
+def test_lote_igual_a_escalar():
+    fechas, vigencias = generar(random.Random(42), 5000)
+    assert verificar(fechas, vigencias) == []
+
+
+def test_lote_no_depende_del_orden_ni_del_tamano():
+    rnd = random.Random(7)
+    fechas, vigencias = generar(rnd, 2000)
+    indices = list(range(len(fechas)))
+    rnd.shuffle(indices)
+    assert verificar([fechas[i] for i in indices[:300]], [vigencias[i] for i in indices[:300]]) == []
+    assert verificar(fechas[:1], vigencias[:1]) == []
+
+
+def test_lote_acepta_datetime64():
+    fechas, vigencias = generar(random.Random(3), 1000)
+    vence_date, _ = calcular_fechas_vigencia_lote(fechas, vigencias)
+    vence_np, _ = calcular_fechas_vigencia_lote(np.array(fechas, dtype='datetime64[D]'), vigencias)
+    assert np.array_equal(vence_date, vence_np)
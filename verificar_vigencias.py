@@ -0,0 +1,102 @@
+"""
+Verificación por propiedades de calcular_fechas_vigencia_lote.
+
+Genera casos aleatorios (fechas de cualquier día o vacías, con énfasis en fines de mes, febrero
+y años bisiestos; vigencias conocidas, DEMO, vacías y con mayúsculas/espacios raros)
+y comprueba que la versión vectorizada da exactamente lo mismo que la escalar.
+Al final compara tiempos de ambas versiones.
+
+Uso:
+    python verificar_vigencias.py
+    VERIFICAR_CASOS=500000 VERIFICAR_SEMILLA=7 python verificar_vigencias.py
+"""
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from app import calcular_fechas_vigencia, calcular_fechas_vigencia_lote
+
+VIGENCIAS = [
+    'Mensual', 'MENSUAL', ' mensual ', 'Trimestral', 'TRIMESTRAL', 'Semestral', 'semestral',
+    'Anual', 'ANUAL ', 'Demo', 'DEMO 15 días', 'demo', 'Paquete Demo', 'Bimestral', 'Otro', '', None,
+]
+
+
+def fecha_aleatoria(rnd):
+    """Fechas uniformes más fines / inicios de mes (donde suelen romperse los cálculos)."""
+    tipo = rnd.random()
+    if tipo < 0.01:
+        return None  # Sin fecha: ambas versiones usan hoy
+    if tipo < 0.5:
+        return date(2000, 1, 1) + timedelta(days=rnd.randint(0, 365 * 40))
+    anio, mes = rnd.randint(2000, 2039), rnd.randint(1, 12)
+    if tipo < 0.8:
+        # Último día del mes (incluye 28/29 de febrero)
+        return date(anio + mes // 12, mes % 12 + 1, 1) - timedelta(days=1)
+    return date(anio, mes, rnd.choice([1, 28, 29, 30]) if mes != 2 else rnd.choice([1, 28]))
+
+
+def generar(rnd, n):
+    fechas = [fecha_aleatoria(rnd) for _ in range(n)]
+    vigencias = [rnd.choice(VIGENCIAS) for _ in range(n)]
+    return fechas, vigencias
+
+
+def verificar(fechas, vigencias):
+    """Lista de (fecha, vigencia, esperado, obtenido) que no coinciden."""
+    vence, proximo = calcular_fechas_vigencia_lote(fechas, vigencias)
+    vence, proximo = vence.astype(object), proximo.astype(object)
+    fallas = []
+    for i, (f, v) in enumerate(zip(fechas, vigencias)):
+        esperado = calcular_fechas_vigencia(f, v)
+        obtenido = (vence[i], proximo[i])
+        if esperado != obtenido:
+            fallas.append((f, v, esperado, obtenido))
+    return fallas
+
+
+def main():
+    n = int(os.environ.get('VERIFICAR_CASOS', '100000'))
+    semilla = int(os.environ.get('VERIFICAR_SEMILLA', '42'))
+    rnd = random.Random(semilla)
+
+    # 1. Propiedad: lote == escalar, caso por caso
+    fechas, vigencias = generar(rnd, n)
+    fallas = verificar(fechas, vigencias)
+
+    # 2. Propiedad: el orden y el tamaño del lote no cambian el resultado
+    indices = list(range(n))
+    rnd.shuffle(indices)
+    sub = indices[: min(n, 1000)]
+    fallas += verificar([fechas[i] for i in sub], [vigencias[i] for i in sub])
+    fallas += verificar(fechas[:1], vigencias[:1])
+
+    # 3. Entradas como datetime64 (no solo date)
+    vence_d, _ = calcular_fechas_vigencia_lote(fechas, vigencias)
+    vence_np, _ = calcular_fechas_vigencia_lote(np.array(fechas, dtype='datetime64[D]'), vigencias)
+    if not np.array_equal(vence_d, vence_np):
+        fallas.append(('datetime64', None, 'igual a date', 'distinto'))
+
+    print(f"Casos: {n} (semilla {semilla}) | Fallas: {len(fallas)}")
+    for f, v, esperado, obtenido in fallas[:20]:
+        print(f"  {f} / {v!r}: escalar={esperado} lote={obtenido}")
+
+    # 4. Tiempos
+    t0 = time.perf_counter()
+    for f, v in zip(fechas, vigencias):
+        calcular_fechas_vigencia(f, v)
+    t_escalar = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    calcular_fechas_vigencia_lote(fechas, vigencias)
+    t_lote = time.perf_counter() - t0
+    print(f"Escalar: {t_escalar * 1000:.1f} ms | Lote: {t_lote * 1000:.1f} ms (x{t_escalar / t_lote:.1f})")
+
+    sys.exit(1 if fallas else 0)
+
+
+if __name__ == '__main__':
+    main()